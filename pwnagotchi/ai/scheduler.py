@@ -0,0 +1,125 @@
+import math
+import logging
+
+# weights of what we get out of a channel, per second of dwell
+HANDSHAKE_WEIGHT = 1.0
+NEW_STATION_WEIGHT = 0.1
+MISS_WEIGHT = -0.05
+# how much the bandit favours channels it knows little about
+EXPLORATION = 0.5
+
+
+class ChannelScheduler(object):
+    """
+    Decides in which order the channels with visible access points are visited,
+    and for how long to dwell on each one of them after the attacks.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def update(self, channel_stats):
+        """
+        Feeds the per channel yield of the epoch that just ended, see Epoch.track_channel.
+        """
+        pass
+
+    def order(self, grouped):
+        """
+        grouped is a dict channel -> access points, returns a list of (channel, aps).
+        """
+        raise NotImplementedError
+
+    def dwell(self, channel, default):
+        """
+        Seconds to wait on channel before hopping away, default is what the
+        fixed recon/hop timings would wait.
+        """
+        raise NotImplementedError
+
+
+class FixedScheduler(ChannelScheduler):
+    """
+    The classic behaviour: most populated channels first, fixed hop_recon_time/min_recon_time waits.
+    """
+
+    def order(self, grouped):
+        return sorted(grouped.items(), key=lambda kv: len(kv[1]), reverse=True)
+
+    def dwell(self, channel, default):
+        return default
+
+
+class BanditScheduler(ChannelScheduler):
+    """
+    Discounted UCB over the per channel yield: channels that gave us handshakes and new
+    stations per second of dwell are visited first and for longer, while channels we
+    know little about keep getting explored. Old observations decay every epoch so the
+    policy follows us around when we move.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        personality = config['personality']
+        self.decay = personality.get('channel_decay', 0.9)
+        self.min_dwell = personality['min_recon_time']
+        self.max_dwell = personality.get('max_recon_time', personality['hop_recon_time'])
+        # channel -> [discounted reward, discounted dwell seconds, discounted visits]
+        self._arms = {}
+
+    def update(self, channel_stats):
+        for arm in self._arms.values():
+            arm[0] *= self.decay
+            arm[1] *= self.decay
+            arm[2] *= self.decay
+
+        for channel, stats in channel_stats.items():
+            if stats['dwell'] <= 0:
+                continue
+            arm = self._arms.setdefault(channel, [0.0, 0.0, 0.0])
+            arm[0] += HANDSHAKE_WEIGHT * stats['handshakes'] + \
+                      NEW_STATION_WEIGHT * stats['new_stations'] + \
+                      MISS_WEIGHT * stats['misses']
+            arm[1] += stats['dwell']
+            arm[2] += 1.0
+
+    def score(self, channel):
+        arm = self._arms.get(channel)
+        if arm is None or arm[2] < 1e-3:
+            return math.inf
+        tot_visits = sum(a[2] for a in self._arms.values())
+        rate = arm[0] / max(arm[1], 1e-3)
+        return rate + EXPLORATION * math.sqrt(math.log(max(tot_visits, 1.0) + 1.0) / arm[2])
+
+    def order(self, grouped):
+        # ties (e.g. unexplored channels) are broken by the number of access points
+        return sorted(grouped.items(), key=lambda kv: (self.score(kv[0]), len(kv[1])), reverse=True)
+
+    def dwell(self, channel, default):
+        # nothing was sent on this channel, nothing to wait for
+        if default <= 0:
+            return default
+
+        score = self.score(channel)
+        if math.isinf(score):
+            # first time here, take a good look around
+            frac = 1.0
+        else:
+            best = max(s for s in (self.score(ch) for ch in self._arms) if not math.isinf(s))
+            frac = max(score, 0.0) / best if best > 0 else 0.0
+        return self.min_dwell + (self.max_dwell - self.min_dwell) * frac
+
+
+SCHEDULERS = {
+    'fixed': FixedScheduler,
+    'bandit': BanditScheduler,
+}
+
+
+def load(config):
+    name = config['personality'].get('channel_scheduler', 'fixed')
+    if name not in SCHEDULERS:
+        logging.warning("unknown channel scheduler '%s', using fixed", name)
+        name = 'fixed'
+    logging.debug("using %s channel scheduler", name)
+    return SCHEDULERS[name](config)
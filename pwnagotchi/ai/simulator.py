@@ -0,0 +1,167 @@
+"""
+Replays the per channel yield recorded in a pwnagotchi log against the channel schedulers,
+to compare them offline before enabling one on the unit:
+
+    python3 -m pwnagotchi.ai.simulator /etc/pwnagotchi/log/pwnagotchi.log --hours 8 --policy fixed --policy bandit
+"""
+import os
+import re
+import math
+import random
+import argparse
+import tomllib
+
+import pwnagotchi.ai.scheduler as scheduler
+from pwnagotchi.utils import merge_config
+
+CHANNELS_PARSER = re.compile(r'\[channels\] epoch=\d+ (.+)$')
+CHANNEL_DATA_PARSER = re.compile(r'(\d+):dwell=([\d.]+),handshakes=(\d+),stations=(\d+),misses=(\d+)')
+# older logs don't have the [channels] line, rebuild what we can from the usual messages
+WAIT_PARSER = re.compile(r'waiting for (\d+)s on channel (\d+)')
+HANDSHAKE_PARSER = re.compile(r'captured new handshake on channel (\d+)')
+APS_PARSER = re.compile(r'(\d+) access points on channel (\d+)')
+
+# seconds lost on every channel switch, attacks included
+HOP_OVERHEAD = 2.0
+# handshakes on a channel saturate as the same stations get deauthed over and over
+SATURATION = 20.0
+EPOCH_TIME = 60.0
+
+
+def parse_log(filename):
+    """
+    Returns channel -> {'dwell', 'handshakes', 'new_stations', 'misses', 'aps'} totals.
+    """
+    totals = {}
+    structured = False
+    fallback = {}
+
+    def stats_for(table, channel):
+        if channel not in table:
+            table[channel] = {'dwell': 0.0, 'handshakes': 0, 'new_stations': 0, 'misses': 0, 'aps': 0}
+        return table[channel]
+
+    with open(filename, 'rt', errors='ignore') as fp:
+        for line in fp:
+            m = CHANNELS_PARSER.search(line)
+            if m:
+                structured = True
+                for ch, dwell, hs, sta, misses in CHANNEL_DATA_PARSER.findall(m.group(1)):
+                    stats = stats_for(totals, int(ch))
+                    stats['dwell'] += float(dwell)
+                    stats['handshakes'] += int(hs)
+                    stats['new_stations'] += int(sta)
+                    stats['misses'] += int(misses)
+                continue
+
+            m = WAIT_PARSER.search(line)
+            if m:
+                stats_for(fallback, int(m.group(2)))['dwell'] += float(m.group(1))
+                continue
+
+            m = HANDSHAKE_PARSER.search(line)
+            if m:
+                stats_for(fallback, int(m.group(1)))['handshakes'] += 1
+                continue
+
+            m = APS_PARSER.search(line)
+            if m:
+                stats = stats_for(totals, int(m.group(2)))
+                stats['aps'] = max(stats['aps'], int(m.group(1)))
+
+    if not structured:
+        for ch, stats in fallback.items():
+            stats_for(totals, ch).update({k: v for k, v in stats.items() if k != 'aps'})
+
+    return totals
+
+
+def load_config(filename=None):
+    """
+    Loads defaults.toml with the given config, usually one overriding a few keys, merged over it.
+    """
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'defaults.toml'), 'rb') as fp:
+        config = tomllib.load(fp)
+    if filename:
+        with open(filename, 'rb') as fp:
+            config = merge_config(tomllib.load(fp), config)
+    return config
+
+
+def _poisson(rng, lam):
+    # Knuth, good enough for the small rates we deal with
+    if lam <= 0:
+        return 0
+    if lam > 30:
+        return max(0, int(round(rng.gauss(lam, math.sqrt(lam)))))
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def simulate(policy, totals, config, hours, seed=None):
+    """
+    Runs policy for the given hours against the per channel rates in totals,
+    returns the number of handshakes captured.
+    """
+    rng = random.Random(seed)
+    config = {**config, 'personality': {**config['personality'], 'channel_scheduler': policy}}
+    sched = scheduler.load(config)
+    hop_recon_time = config['personality']['hop_recon_time']
+
+    rates = {}
+    for ch, stats in totals.items():
+        dwell = max(stats['dwell'], 1.0)
+        rates[ch] = (stats['handshakes'] / dwell, stats['new_stations'] / dwell, stats['misses'] / dwell)
+    grouped = {ch: [None] * max(stats['aps'], 1) for ch, stats in totals.items()}
+
+    elapsed, epoch_elapsed, captured = 0.0, 0.0, 0
+    epoch_stats = {}
+    while elapsed < hours * 3600 and grouped:
+        for ch, _ in sched.order(grouped):
+            dwell = sched.dwell(ch, hop_recon_time)
+            hs_rate, sta_rate, miss_rate = rates[ch]
+            hs = _poisson(rng, hs_rate * SATURATION * (1.0 - math.exp(-dwell / SATURATION)))
+            stats = epoch_stats.setdefault(ch, {'dwell': 0.0, 'handshakes': 0, 'new_stations': 0, 'misses': 0})
+            stats['dwell'] += dwell
+            stats['handshakes'] += hs
+            stats['new_stations'] += _poisson(rng, sta_rate * dwell)
+            stats['misses'] += _poisson(rng, miss_rate * dwell)
+
+            captured += hs
+            elapsed += dwell + HOP_OVERHEAD
+            epoch_elapsed += dwell + HOP_OVERHEAD
+            if epoch_elapsed >= EPOCH_TIME:
+                sched.update(epoch_stats)
+                epoch_stats, epoch_elapsed = {}, 0.0
+
+    return captured
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares channel schedulers against a pwnagotchi log.")
+    parser.add_argument('log', help="pwnagotchi log file to take the per channel rates from.")
+    parser.add_argument('--config', default=None, help="TOML file with the [personality] section, defaults.toml if not set.")
+    parser.add_argument('--hours', type=float, default=8.0, help="Simulated hours.")
+    parser.add_argument('--policy', action='append', choices=list(scheduler.SCHEDULERS.keys()),
+                        help="Scheduler to simulate, can be repeated.")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed.")
+    args = parser.parse_args()
+
+    totals = parse_log(args.log)
+    if not totals:
+        print("no channel activity found in %s" % args.log)
+        return 1
+
+    config = load_config(args.config)
+    for policy in args.policy or list(scheduler.SCHEDULERS.keys()):
+        captured = simulate(policy, totals, config, args.hours, seed=args.seed)
+        print("%-8s %6d handshakes, %.2f/h" % (policy, captured, captured / args.hours))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,124 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pwnagotchi.pcap as pcap
+import pwnagotchi.captures as captures
+from pwnagotchi.utils import WifiInfo, FieldNotFoundError, _extract_from_pcap_scapy
+
+_analyzers = {}
+_lock = threading.Lock()
+
+
+def get(config):
+    """
+    Returns the capture analyzer shared by the plugins.
+    """
+    db = captures.get(config)
+    with _lock:
+        if db.path not in _analyzers:
+            _analyzers[db.path] = CaptureAnalyzer(db, config['main'].get('analysis_workers', 0))
+        return _analyzers[db.path]
+
+
+def _context():
+    # not fork: the agent's threads are running by now and a forked worker could inherit
+    # one of their locks held. the server preloads just this module, each worker still
+    # imports the main script as __mp_main__ (the cli and the agent modules) without running it.
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def analyze_file(path):
+    """
+    Returns the WifiInfo fields found in the capture, by name. Runs in the worker processes.
+    """
+    try:
+        info = pcap.parse(path)
+    except pcap.UnsupportedFormat:
+        info = {}
+        for field in WifiInfo:
+            try:
+                info.update({f.name.lower(): v for f, v in _extract_from_pcap_scapy(path, [field]).items()})
+            except FieldNotFoundError:
+                pass
+
+    if 'encryption' in info:
+        # so that it can be stored as json
+        info['encryption'] = sorted(info['encryption'])
+    return info
+
+
+class CaptureAnalyzer(object):
+    """
+    Parses captures in a pool of worker processes and keeps the results in the captures
+    database, keyed by path, size and modification time, so that a capture is only ever
+    parsed once no matter how many plugins ask for it.
+    """
+
+    def __init__(self, db, workers=0):
+        self._db = db
+        self._workers = workers or os.cpu_count() or 1
+        # one batch at a time, concurrent callers will find the results in the cache
+        self._lock = threading.Lock()
+
+    def info(self, path):
+        return self.analyze([path]).get(path)
+
+    def analyze(self, paths):
+        """
+        Returns path -> {WifiInfo: value} with the fields found in each capture, captures
+        that can't be read have no fields.
+        """
+        stats = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stats[path] = (st.st_size, st.st_mtime)
+            except OSError as e:
+                logging.debug("[analysis] %s", e)
+
+        with self._lock:
+            results = self._db.cached_analysis(stats)
+            missing = [path for path in stats if path not in results]
+            if missing:
+                logging.info("[analysis] parsing %d captures (%d cached) ...", len(missing), len(results))
+                fresh = self._run(missing)
+                self._db.store_analysis([(path, *stats[path], info) for path, info in fresh.items()])
+                results.update(fresh)
+
+        return {path: self._to_fields(info) for path, info in results.items()}
+
+    def _run(self, paths):
+        results = {}
+        if len(paths) == 1 or self._workers == 1:
+            for path in paths:
+                try:
+                    results[path] = analyze_file(path)
+                except Exception as e:
+                    # remembered as empty, not tried again until the file changes
+                    logging.debug("[analysis] can't parse %s: %s", path, e)
+                    results[path] = {}
+            return results
+
+        workers = min(self._workers, len(paths))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_context()) as pool:
+            for path, future in [(path, pool.submit(analyze_file, path)) for path in paths]:
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    logging.debug("[analysis] can't parse %s: %s", path, e)
+                    results[path] = {}
+        return results
+
+    @staticmethod
+    def _to_fields(info):
+        fields = {}
+        for field in WifiInfo:
+            name = field.name.lower()
+            if name in info:
+                fields[field] = set(info[name]) if field == WifiInfo.ENCRYPTION else info[name]
+        return fields
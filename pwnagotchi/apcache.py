@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import glob
+import logging
+import threading
+
+import pwnagotchi.catalog as catalog
+
+CACHE_FILENAME = 'apcache.json'
+# access points not seen for this long are forgotten
+default_ttl = 300
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def get(path, ttl=None):
+    """
+    Returns the access points cache shared by the plugins for the given cache directory.
+    Readers leave ttl out, the cache plugin which owns the cache sets it.
+    """
+    path = os.path.realpath(path)
+    with _lock:
+        if path not in _caches:
+            _caches[path] = APCache(path, default_ttl if ttl is None else ttl)
+            _caches[path].load()
+        elif ttl is not None:
+            _caches[path].ttl = ttl
+        return _caches[path]
+
+
+def read_ap_cache(cache_dir, file):
+    """
+    Returns what was last seen of the access point a capture (or its gps file) belongs to.
+    """
+    return get(cache_dir).lookup(file)
+
+
+def _key(mac):
+    return mac.lower().replace(':', '').replace('-', '')
+
+
+class APCache(object):
+    """
+    The access points recently seen, in memory. Written to disk as a single file when
+    flushed, so that they survive a restart without a write per access point.
+    """
+
+    def __init__(self, path, ttl=default_ttl):
+        self.path = path
+        self.filename = os.path.join(path, CACHE_FILENAME)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # mac without colons -> (last seen timestamp, access point)
+        self._entries = {}
+        self._dirty = False
+
+    def update(self, access_points):
+        now = time.time()
+        with self._lock:
+            for ap in access_points:
+                try:
+                    self._entries[_key(ap['mac'])] = (now, ap)
+                except (KeyError, AttributeError):
+                    continue
+                self._dirty = True
+
+    def lookup(self, filename):
+        """
+        Accepts a mac address or the name of a file saved as ESSID_BSSID.
+        """
+        name, _ = catalog.split(filename)
+        mac = catalog.bssid_of(name) if name else _key(filename)
+        with self._lock:
+            entry = self._entries.get(mac)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def evict(self):
+        expired_at = time.time() - self.ttl
+        with self._lock:
+            expired = [mac for mac, (seen, _) in self._entries.items() if seen < expired_at]
+            for mac in expired:
+                del self._entries[mac]
+            if expired:
+                self._dirty = True
+        return len(expired)
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {mac: [seen, ap] for mac, (seen, ap) in self._entries.items()}
+            self._dirty = False
+
+        temp = self.filename + '.tmp'
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(temp, 'wt') as fp:
+                json.dump(entries, fp)
+            os.replace(temp, self.filename)
+        except OSError as e:
+            logging.error("[apcache] can't write %s: %s", self.filename, e)
+            with self._lock:
+                self._dirty = True
+
+    def load(self):
+        # one file per access point is what older versions left behind
+        for old in glob.glob(os.path.join(self.path, '*.apcache')):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+        try:
+            with open(self.filename, 'rt') as fp:
+                entries = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning("[apcache] can't read %s: %s", self.filename, e)
+            return
+
+        expired_at = time.time() - self.ttl
+        with self._lock:
+            for mac, (seen, ap) in entries.items():
+                if seen >= expired_at:
+                    self._entries[mac] = (seen, ap)
+        logging.debug("[apcache] %d access points loaded from %s", len(self._entries), self.filename)
@@ -15,6 +15,7 @@ class Automata(object):
     def _on_miss(self, who):
         logging.info("it looks like %s is not in range anymore :/", who)
         self._epoch.track(miss=True)
+        self._epoch.track_channel(self._current_channel, misses=1)
         self._view.on_miss(who)
 
     def _on_error(self, who, e):
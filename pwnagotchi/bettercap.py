@@ -3,9 +3,16 @@ import requests
 import websockets
 import asyncio
 import random
+import json
+import threading
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from time import sleep
+from urllib3.util.retry import Retry
+from time import sleep, monotonic
 
 import pwnagotchi
 
@@ -18,6 +25,31 @@ max_queue = 10000
 min_sleep = 0.5
 max_sleep = 5.0
 
+# (connect, read) timeouts for the REST API, in seconds
+timeout = (3.05, 30.0)
+# transport level retries and exponential backoff between them
+retries = 5
+backoff = 0.3
+# max keep-alive connections kept open towards the API
+pool_size = 8
+# commands that do something every time they run, never sent twice on a read timeout
+unrepeatable_commands = ('wifi.assoc', 'wifi.deauth', '!')
+
+# sub-resources of /api/session and for how long (in seconds) a fetched copy is reused
+session_ttl = {'wifi': 2.0, 'modules': 5.0, 'interfaces': 5.0, 'gps': 1.0}
+# the ones bettercap serves on their own /api/session/<name> endpoint, the others
+# are sliced out of a full session fetch
+session_endpoints = ('wifi', 'modules')
+
+# max websocket events waiting to be dispatched
+event_queue_size = 1000
+# events that must never wait behind the noisy ones
+high_priority_events = ('wifi.client.handshake',)
+# noisy events, coalesced per mac and dropped first when we can't keep up
+low_priority_events = ('wifi.ap.new', 'wifi.client.probe')
+# low priority events are dropped once the queue is this full
+low_priority_watermark = 0.5
+
 
 def decode(r, verbose_errors=True):
     try:
@@ -33,8 +65,204 @@ def decode(r, verbose_errors=True):
         return r.text
 
 
+class SessionCache(object):
+    def __init__(self, client, ttl=None):
+        self._client = client
+        self._ttl = {**session_ttl, **(ttl or {})}
+        # name -> (fetched_at, data)
+        self._entries = {}
+        self._locks = {'session': threading.Lock()}
+        for name in session_endpoints:
+            self._locks[name] = threading.Lock()
+
+    def _fresh(self, name, max_age):
+        entry = self._entries.get(name)
+        if entry is not None and (monotonic() - entry[0]) < max_age:
+            return entry
+        return None
+
+    def get(self, name, max_age=None):
+        max_age = self._ttl.get(name, 0.0) if max_age is None else max_age
+        entry = self._fresh(name, max_age)
+        if entry is not None:
+            return entry[1]
+
+        # concurrent callers within the same window wait for a single request
+        with self._locks[name if name in session_endpoints else 'session']:
+            entry = self._fresh(name, max_age)
+            if entry is not None:
+                return entry[1]
+            return self._fetch(name)
+
+    def _fetch(self, name):
+        if name in session_endpoints:
+            data = self._client.session("session/%s" % name)
+            self._entries[name] = (monotonic(), data)
+            return data
+
+        s = self._client.session()
+        now = monotonic()
+        for key in self._ttl:
+            if key in s:
+                self._entries[key] = (now, s[key])
+        return s[name]
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(name, None)
+
+
+class EventDispatcher(object):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+    def __init__(self, consumer, max_size=event_queue_size, on_drop=None):
+        self._consumer = consumer
+        self._max_size = max_size
+        self._on_drop = on_drop
+        # one lane per priority, entries are (enqueued_at, event) except for the
+        # low lane which holds coalescing keys pointing into self._pending
+        self._lanes = (deque(), deque(), deque())
+        self._pending = {}
+        self._ready = None
+        # blocking handlers run here, one at a time and in order, off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bettercap-events")
+        self._metrics = {
+            'received': 0,
+            'dispatched': 0,
+            'dropped': 0,
+            'coalesced': 0,
+            'errors': 0,
+            'max_depth': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+            'handle_total': 0.0,
+            'handle_max': 0.0,
+        }
+
+    def depth(self):
+        return len(self._lanes[self.HIGH]) + len(self._lanes[self.NORMAL]) + len(self._pending)
+
+    def metrics(self):
+        m = dict(self._metrics)
+        done = m['dispatched'] or 1
+        m['depth'] = self.depth()
+        m['depth_by_lane'] = {'high': len(self._lanes[self.HIGH]),
+                              'normal': len(self._lanes[self.NORMAL]),
+                              'low': len(self._pending)}
+        m['wait_avg'] = m['wait_total'] / done
+        m['handle_avg'] = m['handle_total'] / done
+        return m
+
+    @staticmethod
+    def _priority(tag):
+        if tag in high_priority_events:
+            return EventDispatcher.HIGH
+        elif tag in low_priority_events:
+            return EventDispatcher.LOW
+        return EventDispatcher.NORMAL
+
+    def _drop(self, event):
+        self._metrics['dropped'] += 1
+        logging.debug("[bettercap] event queue full, dropping %s", event['tag'])
+        if self._on_drop is not None:
+            try:
+                self._on_drop(event['tag'])
+            except Exception as ex:
+                logging.debug("[bettercap] error in event drop callback (%s)", ex)
+
+    def _evict(self, priority):
+        # make room by dropping the oldest event of the lowest priority lane
+        # that is not more important than the incoming one
+        for lane in (self.LOW, self.NORMAL, self.HIGH):
+            if lane < priority:
+                break
+            if lane == self.LOW and self._lanes[lane]:
+                self._drop(self._pending.pop(self._lanes[lane].popleft())[1])
+                return True
+            elif lane != self.LOW and self._lanes[lane]:
+                self._drop(self._lanes[lane].popleft()[1])
+                return True
+        return False
+
+    def submit(self, msg):
+        """
+        Queues a raw websocket message, never blocks.
+        """
+        event = json.loads(msg)
+        self._metrics['received'] += 1
+        priority = self._priority(event['tag'])
+        now = monotonic()
+
+        if priority == self.LOW:
+            data = event.get('data')
+            key = (event['tag'], data.get('mac') if isinstance(data, dict) else id(event))
+            if key in self._pending:
+                # keep our place in the lane, but only the most recent copy
+                self._pending[key] = (self._pending[key][0], event)
+                self._metrics['coalesced'] += 1
+                return
+            if self.depth() >= self._max_size * low_priority_watermark:
+                self._drop(event)
+                return
+
+        if self.depth() >= self._max_size and not self._evict(priority):
+            self._drop(event)
+            return
+
+        if priority == self.LOW:
+            self._pending[key] = (now, event)
+            self._lanes[self.LOW].append(key)
+        else:
+            self._lanes[priority].append((now, event))
+
+        self._metrics['max_depth'] = max(self._metrics['max_depth'], self.depth())
+        if self._ready is not None:
+            self._ready.set()
+
+    def _next(self):
+        for lane in (self.HIGH, self.NORMAL):
+            if self._lanes[lane]:
+                return self._lanes[lane].popleft()
+        if self._lanes[self.LOW]:
+            return self._pending.pop(self._lanes[self.LOW].popleft())
+        return None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        while True:
+            item = self._next()
+            if item is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            enqueued_at, event = item
+            started = monotonic()
+            try:
+                if asyncio.iscoroutinefunction(self._consumer):
+                    await self._consumer(event)
+                else:
+                    await loop.run_in_executor(self._executor, self._consumer, event)
+            except Exception as ex:
+                self._metrics['errors'] += 1
+                logging.debug("[bettercap] error while handling event %s (%s)", event.get('tag'), ex)
+
+            done = monotonic()
+            self._metrics['dispatched'] += 1
+            self._metrics['wait_total'] += started - enqueued_at
+            self._metrics['wait_max'] = max(self._metrics['wait_max'], started - enqueued_at)
+            self._metrics['handle_total'] += done - started
+            self._metrics['handle_max'] = max(self._metrics['handle_max'], done - started)
+
+
 class Client(object):
-    def __init__(self, hostname='localhost', scheme='http', port=8081, username='user', password='pass'):
+    def __init__(self, hostname='localhost', scheme='http', port=8081, username='user', password='pass',
+                 timeout=timeout, retries=retries, backoff=backoff, pool_size=pool_size):
         self.hostname = hostname
         self.scheme = scheme
         self.port = port
@@ -43,16 +271,83 @@ class Client(object):
         self.url = "%s://%s:%d/api" % (scheme, hostname, port)
         self.websocket = "ws://%s:%s@%s:%d/api" % (username, password, hostname, port)
         self.auth = HTTPBasicAuth(username, password)
+        self.timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) else timeout
+        self._http = self._new_http_session(retries, backoff, pool_size)
+        self._latency = {}
+        self._latency_lock = threading.Lock()
+        self._session_cache = SessionCache(self)
+        self._events = None
+
+    def _new_http_session(self, retries, backoff, pool_size):
+        # one keep-alive connection pool for every REST call, so we don't pay for
+        # a new TCP handshake and auth setup on each command of the attack loop.
+        # POSTs are only retried on connection errors, never after the command
+        # might have reached bettercap.
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        http = requests.Session()
+        http.auth = self.auth
+        http.mount('http://', adapter)
+        http.mount('https://', adapter)
+        return http
+
+    def _track_latency(self, name, started, failed=False):
+        elapsed = monotonic() - started
+        with self._latency_lock:
+            if name not in self._latency:
+                self._latency[name] = {'calls': 0, 'errors': 0, 'total': 0.0, 'last': 0.0, 'max': 0.0}
+            stats = self._latency[name]
+            stats['calls'] += 1
+            stats['total'] += elapsed
+            stats['last'] = elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            if failed:
+                stats['errors'] += 1
+
+    def latency_stats(self):
+        """
+        Returns per-endpoint call counters and latencies (in seconds)
+        """
+        with self._latency_lock:
+            return {name: {**stats, 'avg': stats['total'] / stats['calls'] if stats['calls'] else 0.0}
+                    for name, stats in self._latency.items()}
+
+    def _request(self, name, method, path, **kwargs):
+        started = monotonic()
+        try:
+            r = self._http.request(method, "%s/%s" % (self.url, path), timeout=self.timeout, **kwargs)
+        except Exception:
+            self._track_latency(name, started, failed=True)
+            raise
+        self._track_latency(name, started, failed=r.status_code != 200)
+        return r
 
     # session takes optional argument to pull a sub-dictionary
     #  ex.: "session/wifi", "session/ble"
     def session(self, sess="session"):
-        r = requests.get("%s/%s" % (self.url, sess), auth=self.auth)
+        r = self._request(sess, 'GET', sess)
         return decode(r)
 
-    async def start_websocket(self, consumer):
+    # returns a single part of the session ("wifi", "modules", "interfaces", "gps"),
+    # shared between callers for a short ttl instead of fetching the whole session
+    def session_part(self, name, max_age=None):
+        return self._session_cache.get(name, max_age)
+
+    # returns queue depth, drops and dispatch latency of the websocket events
+    def event_metrics(self):
+        return self._events.metrics() if self._events is not None else {}
+
+    # consumer receives the decoded events, in priority order; plain functions are run
+    # on a worker thread so that they can block without stalling the websocket
+    async def start_websocket(self, consumer, on_drop=None):
         s = "%s/events" % self.websocket
 
+        if self._events is None:
+            self._events = EventDispatcher(consumer, on_drop=on_drop)
+            asyncio.get_running_loop().create_task(self._events.run())
+
         # More modern version of the approach below
         # logging.info("Creating new websocket...")
         # async for ws in websockets.connect(s):
@@ -79,7 +374,7 @@ class Client(object):
                         try:
                             async for msg in ws:
                                 try:
-                                    await consumer(msg)
+                                    self._events.submit(msg)
                                 except Exception as ex:
                                     logging.debug("[bettercap] error while parsing event (%s)", ex)
                         except websockets.ConnectionClosedError:
@@ -103,15 +398,31 @@ class Client(object):
                 logging.warning('connection to the bettercap endpoint failed...')
                 pwnagotchi.restart("AUTO")
 
+    @staticmethod
+    def _repeatable(command):
+        return not any(part.strip().startswith(unrepeatable_commands) for part in command.split(';'))
+
     def run(self, command, verbose_errors=True):
+        """
+        Runs the command, retrying for as long as bettercap can't be reached. When bettercap
+        takes too long to answer, the command might have run already: it is sent again only
+        if that is harmless, otherwise requests.exceptions.Timeout is raised.
+        """
         while True:
             try:
-                r = requests.post("%s/session" % self.url, auth=self.auth, json={'cmd': command})
+                r = self._request('run', 'POST', 'session', json={'cmd': command})
             except requests.exceptions.ConnectionError as e:
                 sleep_time = min_sleep + max_sleep*random.random()
                 logging.warning("[bettercap] can't run my request... connection to the bettercap endpoint failed...")
                 logging.warning('[bettercap] retrying run in {} sec'.format(sleep_time))
                 sleep(sleep_time)
+            except requests.exceptions.Timeout:
+                if not self._repeatable(command):
+                    logging.warning("[bettercap] timed out running '%s'", command)
+                    raise
+                sleep_time = min_sleep + max_sleep*random.random()
+                logging.warning("[bettercap] timed out running '%s', retrying in %.1f sec", command, sleep_time)
+                sleep(sleep_time)
             else:
                 break
 
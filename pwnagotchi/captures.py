@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+import pwnagotchi.catalog as catalog
+
+default_path = '/root/.pwnagotchi-captures.db'
+
+# upload states, a capture is pending for a service until it has one of FINAL_STATES
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+FINAL_STATES = (DONE, SKIPPED)
+
+FIELDS = ('bssid', 'essid', 'station', 'channel', 'encryption', 'captured_at',
+          'latitude', 'longitude', 'altitude', 'password', 'frequency', 'rssi')
+# columns added after the first version of the schema
+COLUMNS_ADDED = (('frequency', 'INTEGER'), ('rssi', 'INTEGER'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    path TEXT PRIMARY KEY,
+    bssid TEXT,
+    essid TEXT,
+    station TEXT,
+    channel INTEGER,
+    encryption TEXT,
+    captured_at REAL,
+    latitude REAL,
+    longitude REAL,
+    altitude REAL,
+    password TEXT,
+    frequency INTEGER,
+    rssi INTEGER
+);
+CREATE INDEX IF NOT EXISTS captures_bssid ON captures (bssid);
+CREATE TABLE IF NOT EXISTS uploads (
+    path TEXT NOT NULL,
+    service TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (path, service)
+);
+CREATE INDEX IF NOT EXISTS uploads_service ON uploads (service, status);
+CREATE TABLE IF NOT EXISTS analysis (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    info TEXT NOT NULL
+);
+"""
+
+_databases = {}
+_lock = threading.Lock()
+
+
+def get(config):
+    """
+    Returns the captures database shared by the agent and the plugins.
+    """
+    path = config['main'].get('captures_db', default_path)
+    with _lock:
+        if path not in _databases:
+            _databases[path] = CaptureDB(path)
+        return _databases[path]
+
+
+def _normalize_bssid(bssid):
+    bssid = bssid.lower().replace('-', ':')
+    if ':' not in bssid and len(bssid) == 12:
+        bssid = ':'.join(bssid[i:i + 2] for i in range(0, 12, 2))
+    return bssid
+
+
+class CaptureDB(object):
+    """
+    Indexed metadata about every capture: what network it belongs to, where it was
+    taken, whether it was cracked and to which services it was uploaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # fewer fsyncs on the sd card, still safe against crashes
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(captures)")}
+        with self._db:
+            for column, kind in COLUMNS_ADDED:
+                if column not in columns:
+                    self._db.execute("ALTER TABLE captures ADD COLUMN %s %s" % (column, kind))
+
+        # rows written under a symlinked handshakes directory before paths were normalized
+        for table in ('captures', 'uploads', 'analysis'):
+            paths = {row[0] for row in self._db.execute("SELECT DISTINCT path FROM %s" % table)}
+            moved = [(catalog.normpath(p), p) for p in paths if catalog.normpath(p) != p]
+            if moved:
+                with self._db:
+                    self._db.executemany("UPDATE OR IGNORE %s SET path = ? WHERE path = ?" % table, moved)
+                    self._db.executemany("DELETE FROM %s WHERE path = ?" % table, [(p,) for _, p in moved])
+                logging.info("[captures] normalized %d paths in %s", len(moved), table)
+
+    def add(self, path, **fields):
+        """
+        Inserts or updates a capture, fields set to None are left untouched.
+        """
+        fields = {k: v for k, v in fields.items() if v is not None}
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError("unknown capture fields: %s" % ', '.join(sorted(unknown)))
+        if 'bssid' in fields:
+            fields['bssid'] = _normalize_bssid(fields['bssid'])
+        path = catalog.normpath(path)
+
+        columns = ['path'] + list(fields)
+        updates = ', '.join('%s = excluded.%s' % (k, k) for k in fields) or 'path = path'
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO captures (%s) VALUES (%s) ON CONFLICT (path) DO UPDATE SET %s" % (
+                ', '.join(columns), ', '.join('?' * len(columns)), updates), [path] + list(fields.values()))
+
+    update = add
+
+    def sync(self, paths):
+        """
+        Makes sure every capture in paths is known, and forgets the ones not on disk anymore.
+        Upload states are kept so that a capture moved back in place is not uploaded twice.
+        """
+        paths = {catalog.normpath(p) for p in paths}
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT path FROM captures")}
+        new, gone = paths - known, known - paths
+        if not new and not gone:
+            return
+
+        rows = []
+        for path in new:
+            name, _ = catalog.split(path)
+            bssid = catalog.bssid_of(name or '')
+            essid = name[:-13] if bssid and len(name) > 13 else None
+            try:
+                captured_at = os.path.getmtime(path)
+            except OSError:
+                captured_at = None
+            rows.append((path, _normalize_bssid(bssid) if bssid else None, essid, captured_at))
+
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO captures (path, bssid, essid, captured_at) VALUES (?, ?, ?, ?)", rows)
+            self._db.executemany("DELETE FROM captures WHERE path = ?", [(p,) for p in gone])
+        logging.debug("[captures] %d new, %d gone", len(new), len(gone))
+
+    def get(self, path):
+        path = catalog.normpath(path)
+        with self._lock:
+            row = self._db.execute("SELECT * FROM captures WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def by_bssid(self, bssid):
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM captures WHERE bssid = ?", (_normalize_bssid(bssid),)).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending(self, service):
+        """
+        Returns the paths of the captures not uploaded to (or skipped by) service yet.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT c.path FROM captures c LEFT JOIN uploads u "
+                                    "ON u.path = c.path AND u.service = ? AND u.status IN (?, ?) "
+                                    "WHERE u.path IS NULL ORDER BY c.captured_at", (service,) + FINAL_STATES).fetchall()
+        return [row[0] for row in rows]
+
+    def is_uploaded(self, service, path):
+        path = catalog.normpath(path)
+        with self._lock:
+            row = self._db.execute("SELECT status FROM uploads WHERE path = ? AND service = ?", (path, service)).fetchone()
+        return row is not None and row[0] == DONE
+
+    def has_uploads(self, service):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM uploads WHERE service = ? LIMIT 1", (service,)).fetchone() is not None
+
+    def set_upload(self, service, paths, status=DONE):
+        """
+        Records the outcome of an upload attempt of one or more captures.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        paths = [catalog.normpath(p) for p in paths]
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO uploads (path, service, status, attempts, updated_at) VALUES (?, ?, ?, 1, ?) "
+                                 "ON CONFLICT (path, service) DO UPDATE SET status = excluded.status, "
+                                 "attempts = attempts + 1, updated_at = excluded.updated_at",
+                                 [(path, service, status, now) for path in paths])
+
+    def cached_analysis(self, stats):
+        """
+        stats is a dict path -> (size, mtime), returns path -> info for the captures
+        that were analysed and did not change since.
+        """
+        found = {}
+        keys = {catalog.normpath(p): p for p in stats}
+        paths = list(keys)
+        with self._lock:
+            # stay well below sqlite's limit of bound parameters
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = self._db.execute("SELECT path, size, mtime, info FROM analysis WHERE path IN (%s)" %
+                                        ', '.join('?' * len(chunk)), chunk).fetchall()
+                for path, size, mtime, info in rows:
+                    if (size, mtime) == stats[keys[path]]:
+                        found[keys[path]] = json.loads(info)
+        return found
+
+    def store_analysis(self, results):
+        """
+        results is a list of (path, size, mtime, info).
+        """
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO analysis (path, size, mtime, info) VALUES (?, ?, ?, ?)",
+                                 [(catalog.normpath(path), size, mtime, json.dumps(info))
+                                  for path, size, mtime, info in results])
+
+    def import_reported(self, service, status_file, to_path=None):
+        """
+        One time migration of the 'reported' list of the JSON status file a plugin used to keep.
+        """
+        if self.has_uploads(service) or not os.path.exists(status_file):
+            return
+        try:
+            with open(status_file) as fp:
+                reported = json.load(fp).get('reported', [])
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning("[captures] can't import %s: %s", status_file, e)
+            return
+        if to_path is not None:
+            reported = [to_path(r) for r in reported]
+        logging.info("[captures] importing %d %s uploads from %s", len(reported), service, status_file)
+        self.set_upload(service, reported)
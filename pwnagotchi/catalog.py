@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import ctypes
+import struct
+import logging
+import threading
+
+# files we keep track of next to each capture, longest first so that
+# .pcap.cracked is not mistaken for a .pcap
+SUFFIXES = ('.pcap.cracked', '.paw-gps.json', '.gps.json', '.geo.json', '.22000', '.pcap')
+# a full directory listing is done at most this often, inotify keeps us current in between
+rescan_interval = 300
+# without inotify we rely on the rescans alone
+fallback_rescan_interval = 30
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+
+_MAC_RE = re.compile(r'([0-9a-f]{12})$')
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def normpath(path):
+    """
+    The one spelling of a capture path used as a key everywhere, the configured handshakes
+    directory may well be a symlink.
+    """
+    return os.path.realpath(path)
+
+
+def get(path):
+    """
+    Returns the catalog shared by everybody for the given handshakes directory.
+    """
+    path = normpath(path)
+    with _lock:
+        if path not in _catalogs:
+            _catalogs[path] = HandshakeCatalog(path)
+            _catalogs[path].watch()
+        return _catalogs[path]
+
+
+def split(filename):
+    """
+    Returns (capture name, suffix) or (None, None) if filename is not something we track.
+    """
+    filename = os.path.basename(filename)
+    for suffix in SUFFIXES:
+        if filename.endswith(suffix) and len(filename) > len(suffix):
+            return filename[:-len(suffix)], suffix
+    return None, None
+
+
+def bssid_of(name):
+    """
+    Captures are saved as ESSID_BSSID.pcap or BSSID.pcap, with the mac without colons.
+    """
+    m = _MAC_RE.search(name.lower())
+    return m.group(1) if m else None
+
+
+def _normalize_bssid(bssid):
+    return bssid.lower().replace(':', '').replace('-', '')
+
+
+class HandshakeCatalog(object):
+    """
+    In-memory index of the captures inside the handshakes directory and of the
+    files saved next to them (gps positions, cracked passwords, hashes), so that
+    counting or listing them does not hit the sd card every time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # capture name -> set of suffixes found on disk
+        self._entries = {}
+        # bssid without colons -> set of capture names
+        self._by_bssid = {}
+        self._scanned_at = None
+        self._watching = False
+
+    def _add(self, name, suffix):
+        self._entries.setdefault(name, set()).add(suffix)
+        bssid = bssid_of(name)
+        if bssid:
+            self._by_bssid.setdefault(bssid, set()).add(name)
+
+    def _discard(self, name, suffix):
+        suffixes = self._entries.get(name)
+        if suffixes is None:
+            return
+        suffixes.discard(suffix)
+        if not suffixes:
+            del self._entries[name]
+            bssid = bssid_of(name)
+            if bssid in self._by_bssid:
+                self._by_bssid[bssid].discard(name)
+                if not self._by_bssid[bssid]:
+                    del self._by_bssid[bssid]
+
+    def rescan(self):
+        entries, by_bssid = {}, {}
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    name, suffix = split(entry.name)
+                    if name is not None:
+                        entries.setdefault(name, set()).add(suffix)
+                        bssid = bssid_of(name)
+                        if bssid:
+                            by_bssid.setdefault(bssid, set()).add(name)
+        except FileNotFoundError:
+            logging.debug("[catalog] %s does not exist (yet)", self.path)
+
+        with self._lock:
+            self._entries, self._by_bssid = entries, by_bssid
+            self._scanned_at = time.monotonic()
+
+    def _refresh(self):
+        interval = rescan_interval if self._watching else fallback_rescan_interval
+        if self._scanned_at is None or (time.monotonic() - self._scanned_at) >= interval:
+            self.rescan()
+
+    def add(self, filename):
+        """
+        Called when a file was saved inside the handshakes directory.
+        """
+        name, suffix = split(filename)
+        if name is not None:
+            with self._lock:
+                self._add(name, suffix)
+
+    def discard(self, filename):
+        name, suffix = split(filename)
+        if name is not None:
+            with self._lock:
+                self._discard(name, suffix)
+
+    def count(self):
+        self._refresh()
+        with self._lock:
+            return sum(1 for suffixes in self._entries.values() if '.pcap' in suffixes)
+
+    def files(self, suffix='.pcap'):
+        """
+        Returns the full path of every file with the given suffix.
+        """
+        self._refresh()
+        with self._lock:
+            return [os.path.join(self.path, name + suffix)
+                    for name, suffixes in self._entries.items() if suffix in suffixes]
+
+    def has(self, filename, suffix):
+        """
+        Returns True if the file sharing filename's capture name and ending with suffix exists,
+        e.g. has('/home/pi/handshakes/foo_001122334455.pcap', '.gps.json').
+        """
+        self._refresh()
+        name, _ = split(filename)
+        with self._lock:
+            return suffix in self._entries.get(name, ())
+
+    def find(self, bssid):
+        """
+        Returns the full path of the captures of the given access point.
+        """
+        self._refresh()
+        with self._lock:
+            return [os.path.join(self.path, name + '.pcap')
+                    for name in self._by_bssid.get(_normalize_bssid(bssid), ())
+                    if '.pcap' in self._entries.get(name, ())]
+
+    def watch(self):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+            os.makedirs(self.path, exist_ok=True)
+            mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if libc.inotify_add_watch(fd, self.path.encode(), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch")
+        except (OSError, AttributeError) as e:
+            logging.debug("[catalog] inotify not available (%s), rescanning every %ds", e, fallback_rescan_interval)
+            return
+
+        self._watching = True
+        threading.Thread(target=self._watcher, args=(fd,), name="Handshakes Catalog", daemon=True).start()
+
+    def _watcher(self, fd):
+        header = struct.Struct('iIII')
+        while True:
+            try:
+                buf = os.read(fd, 64 * 1024)
+            except OSError as e:
+                logging.error("[catalog] inotify: %s", e)
+                self._watching = False
+                return
+
+            offset = 0
+            while offset + header.size <= len(buf):
+                _, mask, _, size = header.unpack_from(buf, offset)
+                raw = buf[offset + header.size:offset + header.size + size]
+                offset += header.size + size
+
+                if mask & IN_Q_OVERFLOW:
+                    # we lost track, let the next read list the directory
+                    self._scanned_at = None
+                    continue
+
+                filename = raw.rstrip(b'\0').decode(errors='replace')
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.discard(filename)
+                else:
+                    self.add(filename)
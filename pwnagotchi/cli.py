@@ -59,20 +59,15 @@ def pwnagotchi_cli():
                 channels = agent.get_access_points_by_channel()
                 # for each channel
                 for ch, aps in channels:
-                    time.sleep(1)
+                    time.sleep(agent.attack_profile()['hop_delay'])
                     agent.set_channel(ch)
 
                     if not agent.is_stale() and agent.any_activity():
                         logging.info("%d access points on channel %d" % (len(aps), ch))
 
-                    # for each ap on this channel
-                    for ap in aps:
-                        # send an association frame in order to get for a PMKID
-                        agent.associate(ap)
-                        # deauth all client stations in order to get a full handshake
-                        for sta in ap['clients']:
-                            agent.deauth(ap, sta)
-                            time.sleep(1)  # delay to not trigger nexmon firmware bugs
+                    # send an association frame to every ap on this channel in order to get a PMKID,
+                    # and deauth all of their client stations in order to get a full handshake
+                    agent.attack(aps)
 
                 # An interesting effect of this:
                 #
@@ -0,0 +1,119 @@
+"""
+Wall clock time for a device that usually boots without a real time clock and
+gets its time from NTP only once it reaches the internet.
+
+Timestamps come from time.monotonic() anchored to the wall clock, so they never
+jump with the wall clock. They are anchored again when NTP synchronizes the clock,
+or when the wall clock is set by more than jump_threshold seconds.
+"""
+import time as _time
+import ctypes
+import logging
+from datetime import datetime
+
+# the wall clock moving away from us by more than this means somebody set it
+jump_threshold = 2.0
+# how often we ask the kernel whether NTP synchronized the clock
+sync_check_interval = 10.0
+
+# adjtimex() returns TIME_ERROR while the clock is not synchronized
+TIME_ERROR = 5
+
+try:
+    _adjtimex = ctypes.CDLL(None, use_errno=True).adjtimex
+except (OSError, AttributeError):
+    _adjtimex = None
+# struct timex, zeroed modes means read only and the kernel leaves them zeroed
+_timex = ctypes.create_string_buffer(256)
+
+
+def _kernel_synced():
+    """
+    Returns True/False as reported by adjtimex(), or None if we can't ask.
+    """
+    if _adjtimex is None:
+        return None
+    state = _adjtimex(_timex)
+    if state < 0:
+        return None
+    return state != TIME_ERROR
+
+
+class Clock(object):
+    def __init__(self):
+        # a single tuple so that readers never see half an update
+        self._anchor = (_time.time(), _time.monotonic())
+        self._synced = _kernel_synced()
+        self._checked_at = self._anchor[1]
+        self.jumps = 0
+
+    def _reanchor(self, wall, mono, reason):
+        offset = wall - (self._anchor[0] + mono - self._anchor[1])
+        self._anchor = (wall, mono)
+        self.jumps += 1
+        logging.info("[clock] %s, moved by %.3fs", reason, offset)
+
+    def time(self):
+        """
+        Seconds since the epoch, like time.time().
+        """
+        mono = _time.monotonic()
+        wall_at, mono_at = self._anchor
+        now = wall_at + mono - mono_at
+        wall = _time.time()
+
+        if mono - self._checked_at >= sync_check_interval:
+            self._checked_at = mono
+            synced = _kernel_synced()
+            if synced and not self._synced:
+                self._synced = synced
+                self._reanchor(wall, mono, "clock synchronized")
+                return wall
+            self._synced = synced
+
+        if abs(wall - now) > jump_threshold:
+            self._reanchor(wall, mono, "clock was set")
+            return wall
+        return now
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    @staticmethod
+    def monotonic():
+        """
+        For durations, unaffected by any change of the wall clock.
+        """
+        return _time.monotonic()
+
+    def synced(self):
+        """
+        True if NTP synchronized the clock, None if we can't tell.
+        """
+        return self._synced
+
+
+_clock = Clock()
+
+time = _clock.time
+now = _clock.now
+monotonic = _clock.monotonic
+synced = _clock.synced
+
+
+def install_logging():
+    """
+    Makes log records use our timestamps.
+    """
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, 'clock', False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.created = _clock.time()
+        record.msecs = (record.created - int(record.created)) * 1000
+        return record
+
+    record_factory.clock = True
+    logging.setLogRecordFactory(record_factory)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+HCXPCAPNGTOOL = shutil.which('hcxpcapngtool') or '/usr/bin/hcxpcapngtool'
+COMBINED_FILENAME = 'combined.hc22000'
+# seconds before giving up on a single conversion
+timeout = 60
+
+_converters = {}
+_lock = threading.Lock()
+
+
+def get(config):
+    """
+    Returns the hash converter shared by the plugins for the handshakes directory.
+    """
+    path = os.path.realpath(config['bettercap']['handshakes'])
+    with _lock:
+        if path not in _converters:
+            _converters[path] = HashConverter(path, config['main'].get('analysis_workers', 0))
+        return _converters[path]
+
+
+def hashfile_of(pcap_path):
+    return pcap_path[:-len('.pcap')] + '.22000' if pcap_path.endswith('.pcap') else pcap_path + '.22000'
+
+
+class HashConverter(object):
+    """
+    Converts every capture to the hashcat 22000 format exactly once, keeping the .22000
+    next to the .pcap, and appends the new hashes to a deduplicated combined hashfile.
+    A capture is converted again only if it changed after its .22000 was written.
+    """
+
+    def __init__(self, path, workers=0):
+        self.path = path
+        self.combined = os.path.join(path, COMBINED_FILENAME)
+        self._workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._known = None
+
+    def _is_converted(self, pcap_path):
+        try:
+            return os.path.getmtime(hashfile_of(pcap_path)) >= os.path.getmtime(pcap_path)
+        except OSError:
+            return False
+
+    def _convert(self, pcap_path):
+        output = hashfile_of(pcap_path)
+        # hcxpcapngtool appends to an existing output, a capture that changed is converted
+        # into a fresh file which then takes the place of the old one
+        temp = output + '.tmp'
+        try:
+            if os.path.exists(temp):
+                os.remove(temp)
+            subprocess.run([HCXPCAPNGTOOL, '-o', temp, pcap_path], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=timeout, check=False)
+            if not os.path.exists(temp):
+                # no hashes in there, an empty file saves us from trying again
+                open(temp, 'w').close()
+            os.replace(temp, output)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.error("[hashes] can't convert %s: %s", pcap_path, e)
+            if os.path.exists(temp):
+                os.remove(temp)
+            return False
+        return True
+
+    @staticmethod
+    def _read(hashfile):
+        try:
+            with open(hashfile, 'rt') as fp:
+                return [line.strip() for line in fp if line.strip()]
+        except OSError:
+            return []
+
+    def _append(self, lines):
+        if self._known is None:
+            self._known = set(self._read(self.combined))
+        new = [line for line in dict.fromkeys(lines) if line not in self._known]
+        if new:
+            with open(self.combined, 'at') as fp:
+                fp.write('\n'.join(new) + '\n')
+            self._known.update(new)
+        return new
+
+    def hashes(self, pcap_paths):
+        """
+        Returns pcap path -> list of 22000 hash lines, converting in parallel the
+        captures that were never converted or changed since.
+        """
+        with self._lock:
+            todo = [path for path in pcap_paths if not self._is_converted(path)]
+            if todo:
+                logging.info("[hashes] converting %d captures ...", len(todo))
+                with ThreadPoolExecutor(max_workers=min(self._workers, len(todo))) as pool:
+                    converted = [path for path, ok in zip(todo, pool.map(self._convert, todo)) if ok]
+                new = self._append(line for path in converted for line in self._read(hashfile_of(path)))
+                logging.info("[hashes] %d new hashes in %s", len(new), self.combined)
+
+        return {path: self._read(hashfile_of(path)) for path in pcap_paths}
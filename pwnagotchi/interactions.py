@@ -0,0 +1,124 @@
+import collections
+import threading
+import time
+
+# how many stations / access points we remember interacting with
+max_history = 10000
+# seconds after which an interaction only counts half
+history_half_life = 3600
+
+
+def normalize_mac(mac):
+    return mac.strip().lower()
+
+
+class HandshakeIndex(object):
+    """
+    The station -> access point pairs we captured a handshake for during this run,
+    indexed by normalised mac so that checking whether somebody is already pwned
+    does not depend on how many handshakes we have.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pairs = set()
+        self._pwned = set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pairs)
+
+    def __contains__(self, mac):
+        with self._lock:
+            return normalize_mac(mac) in self._pwned
+
+    def add(self, station_mac, ap_mac):
+        """
+        Returns True if this is a new handshake.
+        """
+        station_mac, ap_mac = normalize_mac(station_mac), normalize_mac(ap_mac)
+        with self._lock:
+            if (station_mac, ap_mac) in self._pairs:
+                return False
+            self._pairs.add((station_mac, ap_mac))
+            self._pwned.add(station_mac)
+            self._pwned.add(ap_mac)
+            return True
+
+    def dump(self):
+        with self._lock:
+            return [list(pair) for pair in self._pairs]
+
+    def load(self, data):
+        # older recovery files store the raw events keyed by "station -> ap"
+        if isinstance(data, dict):
+            data = [key.split(' -> ') for key in data.keys()]
+        for station_mac, ap_mac in data:
+            self.add(station_mac, ap_mac)
+
+
+class InteractionHistory(object):
+    """
+    How many times we interacted with each mac, decaying over time and bounded
+    in size by evicting the least recently seen entries.
+    """
+
+    def __init__(self, max_size=max_history, half_life=history_half_life):
+        self._lock = threading.Lock()
+        # mac -> (count, timestamp of the count), least recently seen first
+        self._entries = collections.OrderedDict()
+        self._max_size = max_size
+        self._half_life = half_life
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, mac):
+        with self._lock:
+            return normalize_mac(mac) in self._entries
+
+    def __getitem__(self, mac):
+        with self._lock:
+            return self._decayed(self._entries[normalize_mac(mac)], time.time())
+
+    def _decayed(self, entry, now):
+        count, at = entry
+        if self._half_life <= 0:
+            return count
+        return count * 0.5 ** (max(now - at, 0) / self._half_life)
+
+    def hit(self, mac):
+        """
+        Records one more interaction with mac and returns the updated count.
+        """
+        mac = normalize_mac(mac)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(mac, None)
+            count = 1.0 if entry is None else self._decayed(entry, now) + 1.0
+            self._entries[mac] = (count, now)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+            return count
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def dump(self):
+        with self._lock:
+            return [[mac, round(count, 3), int(at)] for mac, (count, at) in self._entries.items()]
+
+    def load(self, data):
+        now = time.time()
+        # older recovery files store a plain mac -> count dict
+        if isinstance(data, dict):
+            data = [[mac, count, now] for mac, count in data.items()]
+        with self._lock:
+            for mac, count, at in sorted(data, key=lambda e: e[2]):
+                mac = normalize_mac(mac)
+                self._entries.pop(mac, None)
+                self._entries[mac] = (float(count), at)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
@@ -8,6 +8,7 @@ import gzip
 import warnings
 from datetime import datetime
 
+import pwnagotchi.clock as clock
 from pwnagotchi.voice import Voice
 from pwnagotchi.mesh.peer import Peer
 from file_read_backwards import FileReadBackwards
@@ -219,6 +220,10 @@ def setup_logging(args, config):
     filename = cfg['path']
     filenameDebug = cfg['path-debug']
 
+    # log timestamps don't follow the wall clock being set, they move once when NTP
+    # synchronizes it
+    clock.install_logging()
+
     #global formatter
     formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(threadName)s] : %(message)s")
     logger = logging.getLogger()
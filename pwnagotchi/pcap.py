@@ -0,0 +1,292 @@
+"""
+Single pass pcap reader for the few things we need out of a capture: the access point
+bssid, essid, encryption and the radio information of the first frame. Handles the
+classic pcap format with radiotap or plain 802.11 frames, which is what bettercap writes.
+
+Run it as a module to compare it against scapy on a directory of captures:
+
+    python3 -m pwnagotchi.pcap /home/pi/handshakes
+"""
+import os
+import mmap
+import struct
+
+from pwnagotchi.mesh.wifi import freq_to_channel
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+# magic -> byte order, microsecond and nanosecond timestamps
+MAGICS = {
+    b'\xd4\xc3\xb2\xa1': '<',
+    b'\xa1\xb2\xc3\xd4': '>',
+    b'\x4d\x3c\xb2\xa1': '<',
+    b'\xa1\xb2\x3c\x4d': '>',
+}
+
+SUBTYPE_ASSOC_REQ = 0
+SUBTYPE_REASSOC_REQ = 2
+SUBTYPE_BEACON = 8
+# where the information elements start in the frame body
+IES_OFFSET = {
+    SUBTYPE_BEACON: 12,
+    SUBTYPE_ASSOC_REQ: 4,
+    SUBTYPE_REASSOC_REQ: 10,
+}
+
+# radiotap fields preceding dBm_AntSignal: (alignment, size)
+RADIOTAP_FIELDS = (
+    (8, 8),  # TSFT
+    (1, 1),  # Flags
+    (1, 1),  # Rate
+    (2, 4),  # Channel
+    (2, 2),  # FHSS
+    (1, 1),  # dBm_AntSignal
+)
+RADIOTAP_FLAGS = 1
+RADIOTAP_CHANNEL = 3
+RADIOTAP_ANTSIGNAL = 5
+
+# same names scapy's network_stats() uses
+AKM_SUITES = {
+    0: 'Reserved', 1: '802.1X', 2: 'PSK', 3: 'FT-802.1X', 4: 'FT-PSK', 5: 'WPA-SHA256',
+    6: 'PSK-SHA256', 7: 'TDLS', 8: 'SAE', 9: 'FT-SAE', 10: 'AP-PEER-KEY',
+    11: 'WPA-SHA256-SUITE-B', 12: 'WPA-SHA384-SUITE-B', 13: 'FT-802.1X-SHA384',
+    14: 'FILS-SHA256', 15: 'FILS-SHA384', 16: 'FT-FILS-SHA256', 17: 'FT-FILS-SHA384', 18: 'OWE',
+}
+WPA_OUI = b'\x00\x50\xf2\x01\x01\x00'
+
+FIELDS = ('bssid', 'essid', 'encryption', 'channel', 'frequency', 'rssi')
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def _mac(raw):
+    return ':'.join('%02x' % b for b in raw)
+
+
+def _radiotap(buf, offset, caplen, order):
+    """
+    Returns (802.11 frame offset, frequency, dBm antenna signal, has fcs) of a radiotap header.
+    """
+    if caplen < 8:
+        return None, None, None, False
+    it_len, = struct.unpack_from(order + 'H', buf, offset + 2)
+    present, = struct.unpack_from(order + 'I', buf, offset + 4)
+
+    # skip the extended presence bitmaps
+    pos = offset + 8
+    word = present
+    while word & 0x80000000 and pos + 4 <= offset + it_len:
+        word, = struct.unpack_from(order + 'I', buf, pos)
+        pos += 4
+
+    freq, signal, flags = None, None, 0
+    for bit, (align, size) in enumerate(RADIOTAP_FIELDS):
+        if not present & (1 << bit):
+            continue
+        rel = pos - offset
+        pos = offset + rel + (-rel % align)
+        if pos + size > offset + it_len:
+            break
+        if bit == RADIOTAP_FLAGS:
+            flags = buf[pos]
+        elif bit == RADIOTAP_CHANNEL:
+            freq, = struct.unpack_from(order + 'H', buf, pos)
+        elif bit == RADIOTAP_ANTSIGNAL:
+            signal, = struct.unpack_from('b', buf, pos)
+        pos += size
+
+    return offset + it_len, freq, signal, bool(flags & 0x10)
+
+
+def _elements(body):
+    pos = 0
+    while pos + 2 <= len(body):
+        eid, size = body[pos], body[pos + 1]
+        if pos + 2 + size > len(body):
+            break
+        yield eid, body[pos + 2:pos + 2 + size]
+        pos += 2 + size
+
+
+def _suites(info, pos):
+    """
+    Returns (list of suite types, next position) of a count prefixed suite list.
+    """
+    count, = struct.unpack_from('<H', info, pos)
+    pos += 2
+    suites = [info[pos + 4 * i + 3] for i in range(count)]
+    return suites, pos + 4 * count
+
+
+def _encryption(capability, elements):
+    """
+    Mirrors scapy's Dot11Beacon.network_stats()['crypto'].
+    """
+    crypto = set()
+    for eid, info in elements:
+        try:
+            if eid == 48:
+                # version, group cipher, pairwise ciphers, akm suites, capabilities
+                pairwise, pos = _suites(info, 6)
+                akm, pos = _suites(info, pos)
+                caps, = struct.unpack_from('<H', info, pos) if pos + 2 <= len(info) else (0,)
+                version = 'WPA2'
+                if 8 in akm:
+                    if all(s not in (2, 6) for s in akm) and caps & 0x80 and caps & 0x40 and \
+                            all(c not in (1, 2, 5) for c in pairwise):
+                        version = 'WPA3'
+                    elif 2 in akm:
+                        version = 'WPA3-transition'
+                crypto.add('%s/%s' % (version, AKM_SUITES.get(akm[0], akm[0])) if akm else version)
+
+            elif eid == 221 and info.startswith(WPA_OUI):
+                _, pos = _suites(info, 10)
+                akm, _ = _suites(info, pos)
+                crypto.add('WPA/%s' % AKM_SUITES.get(akm[0], akm[0]) if akm else 'WPA')
+        except (struct.error, IndexError):
+            continue
+
+    if not crypto:
+        crypto.add('WEP' if capability & 0x0010 else 'OPN')
+    return crypto
+
+
+def parse(path):
+    """
+    Returns a dict with the FIELDS found in the capture, reading it only once. Raises
+    UnsupportedFormat if this is not a capture we know how to read.
+    """
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size < 24:
+            raise UnsupportedFormat("%s is too short" % path)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _parse(buf, path)
+
+
+def _parse(buf, path):
+    order = MAGICS.get(bytes(buf[:4]))
+    if order is None:
+        raise UnsupportedFormat("%s is not a pcap file" % path)
+    linktype, = struct.unpack_from(order + 'I', buf, 20)
+    if linktype not in (LINKTYPE_IEEE802_11, LINKTYPE_IEEE802_11_RADIOTAP):
+        raise UnsupportedFormat("%s has unsupported link type %d" % (path, linktype))
+
+    info = {}
+    first = True
+    offset, end = 24, len(buf)
+    while offset + 16 <= end and len(info) < len(FIELDS):
+        caplen, = struct.unpack_from(order + 'I', buf, offset + 8)
+        data = offset + 16
+        offset = data + caplen
+        if offset > end:
+            # truncated capture
+            break
+
+        frame, frame_end = data, offset
+        if linktype == LINKTYPE_IEEE802_11_RADIOTAP:
+            frame, freq, signal, fcs = _radiotap(buf, data, caplen, order)
+            if frame is None:
+                continue
+            if fcs:
+                frame_end -= 4
+            if first:
+                # the radio information always comes from the first frame
+                if signal is not None:
+                    info['rssi'] = signal
+                if freq is not None:
+                    info['frequency'] = freq
+                    try:
+                        info['channel'] = freq_to_channel(freq)
+                    except ValueError:
+                        pass
+        first = False
+
+        if frame + 24 > frame_end:
+            continue
+        fc = buf[frame]
+        ftype, subtype = (fc >> 2) & 3, fc >> 4
+        if ftype != 0 or subtype not in IES_OFFSET:
+            continue
+
+        body_at = frame + 24 + IES_OFFSET[subtype]
+        if body_at > frame_end:
+            continue
+        elements = list(_elements(buf[body_at:frame_end]))
+
+        if 'essid' not in info and elements:
+            try:
+                info['essid'] = elements[0][1].decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+
+        if subtype == SUBTYPE_BEACON:
+            if 'bssid' not in info:
+                info['bssid'] = _mac(buf[frame + 16:frame + 22])
+            if 'encryption' not in info:
+                capability, = struct.unpack_from('<H', buf, frame + 24 + 10)
+                info['encryption'] = _encryption(capability, elements)
+
+    return info
+
+
+def _benchmark(directory, limit):
+    import time
+    import logging
+    from pwnagotchi.utils import WifiInfo, _extract_from_pcap_scapy
+
+    fields = list(WifiInfo)
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.pcap'))[:limit]
+    logging.disable(logging.CRITICAL)
+
+    def native_extract(path):
+        info = parse(path)
+        return {field: info[field.name.lower()] for field in fields if field.name.lower() in info}
+
+    def scapy_extract(path):
+        # what the plugins used to pay, one pass per field
+        found = {}
+        for field in fields:
+            try:
+                found.update(_extract_from_pcap_scapy(path, [field]))
+            except Exception:
+                pass
+        return found
+
+    def run(extract):
+        results, started = {}, time.perf_counter()
+        for path in files:
+            try:
+                results[path] = extract(path)
+            except Exception:
+                results[path] = {}
+        return results, time.perf_counter() - started
+
+    native, native_time = run(native_extract)
+    scapy, scapy_time = run(scapy_extract)
+
+    mismatches = 0
+    for path in files:
+        for field in fields:
+            if native[path].get(field) != scapy[path].get(field):
+                mismatches += 1
+                print("%s %s: native=%r scapy=%r" % (os.path.basename(path), field.name,
+                                                     native[path].get(field), scapy[path].get(field)))
+
+    print("%d captures, %d fields each" % (len(files), len(fields)))
+    print("native: %.3fs (%.2fms per capture)" % (native_time, 1000 * native_time / max(len(files), 1)))
+    print("scapy:  %.3fs (%.2fms per capture)" % (scapy_time, 1000 * scapy_time / max(len(files), 1)))
+    print("%d mismatching fields" % mismatches)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks the native pcap parser against scapy.")
+    parser.add_argument('directory', help="Directory with the .pcap files to parse.")
+    parser.add_argument('--limit', type=int, default=500, help="Maximum number of captures to parse.")
+    args = parser.parse_args()
+    _benchmark(args.directory, args.limit)
@@ -251,7 +251,7 @@ class auto_tune(plugins.Plugin):
                     else:
                         ret += "<td></td>"
                 if lmac in self._agent._history:
-                    ret += "<td>%s</td>" % self._agent._history[lmac]
+                    ret += "<td>%.1f</td>" % self._agent._history[lmac]
                 else:
                     ret += "<td>no attacks yet</td>"
                 ret += "</tr>\n"
@@ -386,7 +386,7 @@ class auto_tune(plugins.Plugin):
     def on_ready(self, agent):
         self._agent = agent
         if self.options['reset_history']:
-            self._agent._history = {}  # clear "max_interactions" data
+            self._agent._history.clear()  # clear "max_interactions" data
             self._agent.run("wifi.recon clear")
             self._agent.run("wifi.clear")
 
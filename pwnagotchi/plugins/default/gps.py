@@ -3,6 +3,7 @@ import logging
 import os
 
 import pwnagotchi.plugins as plugins
+import pwnagotchi.captures as captures
 import pwnagotchi.ui.fonts as fonts
 from pwnagotchi.ui.components import LabeledValue
 from pwnagotchi.ui.view import BLACK
@@ -46,8 +47,7 @@ class GPS(plugins.Plugin):
 
     def on_handshake(self, agent, filename, access_point, client_station):
         if self.running:
-            info = agent.session()
-            self.coordinates = info["gps"]
+            self.coordinates = agent.session_part("gps")
             gps_filename = filename.replace(".pcap", ".gps.json")
 
             if self.coordinates and all([
@@ -57,6 +57,10 @@ class GPS(plugins.Plugin):
                 logging.info(f"saving GPS to {gps_filename} ({self.coordinates})")
                 with open(gps_filename, "w+t") as fp:
                     json.dump(self.coordinates, fp)
+                captures.get(agent.config()).update(filename,
+                                                    latitude=self.coordinates["Latitude"],
+                                                    longitude=self.coordinates["Longitude"],
+                                                    altitude=self.coordinates.get("Altitude"))
             else:
                 logging.info("not saving GPS. Couldn't find location.")
 
@@ -5,6 +5,7 @@ import subprocess
 import threading
 
 import pwnagotchi.plugins as plugins
+import pwnagotchi.captures as captures
 import pwnagotchi.ui.fonts as fonts
 from pwnagotchi.ui.components import LabeledValue
 from pwnagotchi.ui.view import BLACK
@@ -204,8 +205,7 @@ class GPS(plugins.Plugin):
             logging.warning("no GPS detected")
 
     def on_handshake(self, agent, filename, access_point, client_station):
-        info = agent.session()
-        coordinates = info["gps"]
+        coordinates = agent.session_part("gps")
         gps_filename = filename.replace(".pcap", ".gps.json")
 
         if coordinates and all([
@@ -216,6 +216,10 @@ class GPS(plugins.Plugin):
             logging.info(f"saving GPS to {gps_filename} ({coordinates})")
             with open(gps_filename, "w+t") as fp:
                 json.dump(coordinates, fp)
+            captures.get(agent.config()).update(filename,
+                                                latitude=coordinates["Latitude"],
+                                                longitude=coordinates["Longitude"],
+                                                altitude=coordinates.get("Altitude"))
         else:
             logging.warning("not saving GPS. Couldn't find location.")
 
@@ -1,16 +1,18 @@
 import os
 import logging
 import time
-import glob
 import re
 
 import pwnagotchi.grid as grid
+import pwnagotchi.catalog as catalog
+import pwnagotchi.captures as captures
 import pwnagotchi.plugins as plugins
-from pwnagotchi.utils import StatusFile, WifiInfo, extract_from_pcap
+import pwnagotchi.analysis as analysis
+from pwnagotchi.utils import WifiInfo
 from threading import Lock
 
 
-def parse_pcap(filename):
+def parse_pcap(filename, parsed=None):
     logging.info("grid: parsing %s ..." % filename)
 
     net_id = os.path.basename(filename).replace('.pcap', '')
@@ -34,10 +36,11 @@ def parse_pcap(filename):
         WifiInfo.BSSID: bssid,
     }
 
-    try:
-        info = extract_from_pcap(filename, [WifiInfo.BSSID, WifiInfo.ESSID])
-    except Exception as e:
-        logging.error("grid: %s" % e)
+    # what the capture analysis found, if it found both
+    if parsed and WifiInfo.BSSID in parsed and WifiInfo.ESSID in parsed:
+        info = parsed
+    else:
+        logging.error("grid: could not find the bssid and essid in %s" % filename)
 
     return info[WifiInfo.ESSID], info[WifiInfo.BSSID]
 
@@ -51,7 +54,6 @@ class Grid(plugins.Plugin):
 
     def __init__(self):
         self.options = dict()
-        self.report = StatusFile('/root/.api-report.json', data_format='json')
 
         self.unread_messages = 0
         self.total_messages = 0
@@ -74,10 +76,8 @@ class Grid(plugins.Plugin):
         response = make_response(redirect("https://opwngrid.xyz", code=302))
         return response
 
-    def set_reported(self, reported, net_id):
-        if net_id not in reported:
-            reported.append(net_id)
-        self.report.update(data={'reported': reported})
+    def set_reported(self, db, pcap_file, status=captures.DONE):
+        db.set_upload('grid', pcap_file, status)
 
     def check_inbox(self, agent):
         logging.debug("checking mailbox ...")
@@ -94,11 +94,13 @@ class Grid(plugins.Plugin):
         logging.debug("checking pcap's")
         config = agent.config()
 
-        pcap_files = glob.glob(os.path.join(config['bettercap']['handshakes'], "*.pcap"))
-        num_networks = len(pcap_files)
-        reported = self.report.data_field_or('reported', default=[])
-        num_reported = len(reported)
-        num_new = num_networks - num_reported
+        handshake_dir = config['bettercap']['handshakes']
+        db = captures.get(config)
+        db.import_reported('grid', '/root/.api-report.json',
+                           lambda net_id: os.path.join(handshake_dir, net_id + '.pcap'))
+        db.sync(catalog.get(handshake_dir).files())
+        pcap_files = db.pending('grid')
+        num_new = len(pcap_files)
 
         if num_new > 0:
             if self.options['report']:
@@ -106,25 +108,30 @@ class Grid(plugins.Plugin):
                 logging.debug("self.options: %s" % self.options)
                 logging.debug("  exclude: %s" % config['main']['whitelist'])
 
+                to_parse = []
                 for pcap_file in pcap_files:
                     net_id = os.path.basename(pcap_file).replace('.pcap', '')
-                    if net_id not in reported:
-                        if self.is_excluded(net_id, agent):
-                            logging.debug("skipping %s due to exclusion filter" % pcap_file)
-                            self.set_reported(reported, net_id)
-                            continue
-
-                        essid, bssid = parse_pcap(pcap_file)
-                        if bssid:
-                            if self.is_excluded(essid, agent) or self.is_excluded(bssid, agent):
-                                logging.debug("not reporting %s due to exclusion filter" % pcap_file)
-                                self.set_reported(reported, net_id)
-                            else:
-                                if grid.report_ap(essid, bssid):
-                                    self.set_reported(reported, net_id)
-                                time.sleep(1.5)
+                    if self.is_excluded(net_id, agent):
+                        logging.debug("skipping %s due to exclusion filter" % pcap_file)
+                        self.set_reported(db, pcap_file, captures.SKIPPED)
+                    else:
+                        to_parse.append(pcap_file)
+
+                # parsed in parallel, and only once across plugins
+                parsed = analysis.get(config).analyze(to_parse)
+                for pcap_file in to_parse:
+                    essid, bssid = parse_pcap(pcap_file, parsed.get(pcap_file))
+                    if bssid:
+                        db.update(pcap_file, essid=essid, bssid=bssid)
+                        if self.is_excluded(essid, agent) or self.is_excluded(bssid, agent):
+                            logging.debug("not reporting %s due to exclusion filter" % pcap_file)
+                            self.set_reported(db, pcap_file, captures.SKIPPED)
                         else:
-                            logging.warning("no bssid found?!")
+                            if grid.report_ap(essid, bssid):
+                                self.set_reported(db, pcap_file)
+                            time.sleep(1.5)
+                    else:
+                        logging.warning("no bssid found?!")
             else:
                 logging.debug("grid: reporting disabled")
 
@@ -1,16 +1,24 @@
 import os
+import re
 import logging
 import threading
-from itertools import islice
 from time import sleep
-from datetime import datetime,timedelta
 from pwnagotchi import plugins
-from pwnagotchi.utils import StatusFile
 from flask import render_template_string
-from flask import jsonify
 from flask import abort
 from flask import Response
 
+# how often a stream looks for new lines, a quiet poll sends a comment so that closed
+# browsers are noticed
+poll_interval = 0.5
+# bytes read at a time when looking for the last lines
+tail_chunk = 8192
+default_max_streams = 2
+
+LEVELS = {'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARNING': logging.WARNING, 'ERROR': logging.ERROR,
+          'CRITICAL': logging.CRITICAL}
+LEVEL_PARSER = re.compile(r'^\[[^\]]*\] \[([A-Z]+)\]')
+
 
 TEMPLATE = """
 {% extends "base.html" %}
@@ -93,125 +101,110 @@ TEMPLATE = """
 {% block script %}
     var table = document.getElementById('table');
     var filter = document.getElementById('filter');
-    var filterVal = filter.value.toUpperCase();
-
-    var xhr = new XMLHttpRequest();
-    xhr.open('GET', '{{ url_for('plugins') }}/logtail/stream');
-    xhr.send();
-    var position = 0;
-    var data;
-    var time;
-    var level;
-    var msg;
-    var colorClass;
-
-    function handleNewData() {
-        var messages = xhr.responseText.split('\\n');
-        filterVal = filter.value.toUpperCase();
-        messages.slice(position, -1).forEach(function(value) {
-
-            if (value.charAt(0) != '[') {
-                msg = value;
-                time = '';
-                level = '';
-            } else {
-                data = value.split(']');
-                time = data.shift() + ']';
-                level = data.shift() + ']';
-                msg = data.join(']');
-
-                switch(level) {
-                    case ' [INFO]':
-                        colorClass = 'info';
-                        break;
-                    case ' [WARNING]':
-                        colorClass = 'warning';
-                        break;
-                    case ' [ERROR]':
-                        colorClass = 'error';
-                        break;
-                    case ' [DEBUG]':
-                        colorClass = 'debug';
-                        break;
-                    default:
-                        colorClass = 'default';
-                        break;
-                }
-            }
-
-            var tr = document.createElement('tr');
-            var td1 = document.createElement('td');
-            var td2 = document.createElement('td');
-            var td3 = document.createElement('td');
+    var levelElm = document.getElementById('level');
+    var scrollElm = document.getElementById('autoscroll');
+    var scrollingElement = (document.scrollingElement || document.body);
+    var maxLines = {{ max_lines }};
+    var source = null;
 
-            td1.textContent = time;
-            td2.textContent = level;
-            td3.textContent = msg;
+    function addLine(value) {
+        var time, level, msg, data, colorClass;
+        if (value.charAt(0) != '[') {
+            msg = value;
+            time = '';
+            level = '';
+            colorClass = 'default';
+        } else {
+            data = value.split(']');
+            time = data.shift() + ']';
+            level = data.shift() + ']';
+            msg = data.join(']');
 
-            tr.appendChild(td1);
-            tr.appendChild(td2);
-            tr.appendChild(td3);
+            switch(level) {
+                case ' [INFO]':
+                    colorClass = 'info';
+                    break;
+                case ' [WARNING]':
+                    colorClass = 'warning';
+                    break;
+                case ' [ERROR]':
+                    colorClass = 'error';
+                    break;
+                case ' [DEBUG]':
+                    colorClass = 'debug';
+                    break;
+                default:
+                    colorClass = 'default';
+                    break;
+            }
+        }
 
-            tr.className = colorClass;
+        var tr = document.createElement('tr');
+        var td1 = document.createElement('td');
+        var td2 = document.createElement('td');
+        var td3 = document.createElement('td');
 
-            if (filterVal.length > 0 && value.toUpperCase().indexOf(filterVal) == -1) {
-                tr.style.display = "none";
-            }
+        td1.textContent = time;
+        td2.textContent = level;
+        td3.textContent = msg;
 
-            table.appendChild(tr);
-        });
-        position = messages.length - 1;
-    }
+        tr.appendChild(td1);
+        tr.appendChild(td2);
+        tr.appendChild(td3);
 
-    var scrollingElement = (document.scrollingElement || document.body)
-    function scrollToBottom () {
-       scrollingElement.scrollTop = scrollingElement.scrollHeight;
+        tr.className = colorClass;
+        table.tBodies[0].appendChild(tr);
     }
 
-    var timer;
-    var scrollElm = document.getElementById('autoscroll');
-    timer = setInterval(function() {
-        handleNewData();
-        if (scrollElm.checked) {
-            scrollToBottom();
+    function connect() {
+        // the server does the filtering, a new filter means a new stream
+        if (source) {
+            source.close();
         }
-        if (xhr.readyState == XMLHttpRequest.DONE) {
-            clearInterval(timer);
-        }
-    }, 1000);
+        table.tBodies[0].innerHTML = '';
+        source = new EventSource('{{ url_for('plugins') }}/logtail/stream?level=' + encodeURIComponent(levelElm.value) +
+                                 '&filter=' + encodeURIComponent(filter.value));
+        source.onmessage = function(event) {
+            addLine(event.data);
+            var rows = table.tBodies[0].rows;
+            while (rows.length > maxLines) {
+                rows[0].remove();
+            }
+            if (scrollElm.checked) {
+                scrollingElement.scrollTop = scrollingElement.scrollHeight;
+            }
+        };
+        source.addEventListener('failure', function(event) {
+            addLine(event.data);
+            source.close();
+        });
+    }
 
     var typingTimer;
     var doneTypingInterval = 1000;
 
     filter.onkeyup = function() {
         clearTimeout(typingTimer);
-        typingTimer = setTimeout(doneTyping, doneTypingInterval);
+        typingTimer = setTimeout(connect, doneTypingInterval);
     }
 
     filter.onkeydown = function() {
         clearTimeout(typingTimer);
     }
 
-    function doneTyping() {
-        document.body.style.cursor = 'progress';
-        var tr, tds, td, i, txtValue;
-        filterVal = filter.value.toUpperCase();
-        tr = table.getElementsByTagName("tr");
-        for (i = 1; i < tr.length; i++) {
-            txtValue = tr[i].textContent || tr[i].innerText;
-            if (txtValue.toUpperCase().indexOf(filterVal) > -1) {
-                tr[i].style.display = "table-row";
-            } else {
-                tr[i].style.display = "none";
-            }
-        }
-        document.body.style.cursor = 'default';
-    }
+    levelElm.onchange = connect;
+    connect();
 {% endblock %}
 
 {% block content %}
     <div class="sticky">
-        <input type="text" id="filter" placeholder="Search for ..." title="Type in a filter">
+        <input type="text" id="filter" placeholder="Search for ... (regular expression)" title="Type in a filter">
+        <span><select id="level">
+            <option value="DEBUG">Debug</option>
+            <option value="INFO" selected>Info</option>
+            <option value="WARNING">Warning</option>
+            <option value="ERROR">Error</option>
+        </select></span>
         <span><input checked type="checkbox" id="autoscroll"></span>
         <span><label for="autoscroll"> Autoscroll to bottom</label><br></span>
     </div>
@@ -227,6 +220,7 @@ TEMPLATE = """
                 Message
             </th>
         </thead>
+        <tbody></tbody>
     </table>
 {% endblock %}
 """
@@ -245,6 +239,7 @@ class Logtail(plugins.Plugin):
 
     def on_config_changed(self, config):
         self.config = config
+        self.streams = threading.BoundedSemaphore(self.options.get('max-streams', default_max_streams))
         self.ready = True
 
     def on_loaded(self):
@@ -253,20 +248,132 @@ class Logtail(plugins.Plugin):
         """
         logging.info("Logtail plugin loaded.")
 
+    def tail(self, path, max_lines):
+        """
+        Returns the last max_lines complete lines of the file, reading it from the end, and
+        the offset the lines written after them start at.
+        """
+        with open(path, 'rb') as fp:
+            pos = os.fstat(fp.fileno()).st_size
+            data = b''
+            while pos > 0 and data.count(b'\n') <= max_lines:
+                step = min(tail_chunk, pos)
+                pos -= step
+                fp.seek(pos)
+                data = fp.read(step) + data
+
+        # a line still being written is left for follow()
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].decode('utf-8', errors='replace').split('\n')[:-1]
+        if pos > 0:
+            # the first one is cut
+            lines = lines[1:]
+        return lines[-max_lines:], pos + end
+
+    @staticmethod
+    def follow(path, offset):
+        """
+        Yields the lines appended to the file from offset on, or None after each poll
+        that found nothing. Starts over when the file gets rotated.
+        """
+        fp = open(path, encoding='utf-8', errors='replace')
+        fp.seek(offset)
+        inode = os.fstat(fp.fileno()).st_ino
+        pending = ''
+        try:
+            while True:
+                data = fp.readline()
+                if data:
+                    pending += data
+                    if pending.endswith('\n'):
+                        yield pending.rstrip('\n')
+                        pending = ''
+                    continue
+
+                yield None
+                sleep(poll_interval)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if st.st_ino != inode or st.st_size < fp.tell():
+                    fp.close()
+                    fp = open(path, encoding='utf-8', errors='replace')
+                    inode = os.fstat(fp.fileno()).st_ino
+                    pending = ''
+        finally:
+            fp.close()
+
+    @staticmethod
+    def line_filter(level, pattern):
+        """
+        Returns a function telling if a line should be sent, lines without a level
+        (like tracebacks) go with the line before them.
+        """
+        min_level = LEVELS.get(level.upper(), logging.DEBUG) if level else logging.DEBUG
+        regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+        state = {'level': logging.INFO}
+
+        def accept(line):
+            m = LEVEL_PARSER.match(line)
+            if m:
+                state['level'] = LEVELS.get(m.group(1), logging.INFO)
+            if state['level'] < min_level:
+                return False
+            return regex is None or regex.search(line) is not None
+
+        return accept
+
+    @staticmethod
+    def event(line, name=None):
+        return (f"event: {name}\n" if name else "") + f"data: {line}\n\n"
+
+    def stream(self, request):
+        try:
+            accept = self.line_filter(request.args.get('level'), request.args.get('filter'))
+        except re.error as e:
+            return Response(self.event(f"bad filter: {e}", 'failure'), mimetype='text/event-stream')
+
+        if not self.streams.acquire(blocking=False):
+            # not a 429, EventSource would drop it without letting the page show why
+            return Response(self.event("too many log streams open, close another tab", 'failure'),
+                            mimetype='text/event-stream')
+
+        path = self.config['main']['log']['path']
+        max_lines = self.options.get('max-lines', 4096)
+
+        released = threading.Event()
+
+        def release():
+            # the server closes the response once, whether it was streamed or not
+            if not released.is_set():
+                released.set()
+                self.streams.release()
+
+        def generate():
+            lines, offset = self.tail(path, max_lines)
+            for line in lines:
+                if accept(line):
+                    yield self.event(line)
+            for line in self.follow(path, offset):
+                if line is None:
+                    # writing to a closed connection is how the browser going away is noticed
+                    yield ": keepalive\n\n"
+                elif accept(line):
+                    yield self.event(line)
+
+        response = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+        response.call_on_close(release)
+        return response
+
     def on_webhook(self, path, request):
         if not self.ready:
             return "Plugin not ready"
 
         if not path or path == "/":
-            return render_template_string(TEMPLATE)
+            return render_template_string(TEMPLATE, max_lines=self.options.get('max-lines', 4096))
 
         if path == 'stream':
-            def generate():
-                with open(self.config['main']['log']['path']) as f:
-                    yield ''.join(f.readlines()[-self.options.get('max-lines', 4096):])
-                    while True:
-                        yield f.readline()
-
-            return Response(generate(), mimetype='text/plain')
+            return self.stream(request)
 
         abort(404)
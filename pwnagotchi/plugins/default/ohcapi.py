@@ -1,12 +1,12 @@
-import os
 import logging
 import requests
 import time
 from datetime import datetime
 from threading import Lock
-from pwnagotchi.utils import StatusFile
 import pwnagotchi.plugins as plugins
-from json.decoder import JSONDecodeError
+import pwnagotchi.catalog as catalog
+import pwnagotchi.captures as captures
+import pwnagotchi.hashes as hashes
 
 class ohcapi(plugins.Plugin):
     __author__ = 'Rohan Dayaram'
@@ -17,11 +17,6 @@ class ohcapi(plugins.Plugin):
     def __init__(self):
         self.ready = False
         self.lock = Lock()
-        try:
-            self.report = StatusFile('/root/handshakes/.ohc_uploads', data_format='json')
-        except JSONDecodeError:
-            os.remove('/root/.ohc_newapi_uploads')
-            self.report = StatusFile('/root/handshakes/.ohc_uploads', data_format='json')
         self.skip = list()
         self.last_run = 0  # Track last time periodic tasks were run
         self.internet_active = False  # Track whether internet is currently available
@@ -117,20 +112,18 @@ class ohcapi(plugins.Plugin):
         with self.lock:
             display = agent.view()
             config = agent.config()
-            reported = self.report.data_field_or('reported', default=[])
-            processed_stations = self.report.data_field_or('processed_stations', default=[])
             handshake_dir = config['bettercap']['handshakes']
 
-            # Find .pcap files
-            handshake_filenames = os.listdir(handshake_dir)
-            handshake_paths = [os.path.join(handshake_dir, filename)
-                                for filename in handshake_filenames if filename.endswith('.pcap')]
+            handshakes = catalog.get(handshake_dir)
+            db = captures.get(config)
+            db.import_reported('ohc', '/root/handshakes/.ohc_uploads')
+            db.sync(handshakes.files())
 
-            # If the corresponding .22000 file exists, skip re-upload
-            handshake_paths = [p for p in handshake_paths if not os.path.exists(p.replace('.pcap', '.22000'))]
+            # Find the .pcap files not reported yet
+            handshake_paths = db.pending('ohc')
 
-            # Filter out already reported and skipped .pcap files
-            handshake_new = set(handshake_paths) - set(reported) - set(self.skip)
+            # Filter out skipped .pcap files
+            handshake_new = set(handshake_paths) - set(self.skip)
 
             if handshake_new:
                 logging.info(f"OHC NewAPI: Processing {len(handshake_new)} new PCAP handshakes.")
@@ -139,17 +132,19 @@ class ohcapi(plugins.Plugin):
                 successfully_extracted = []
                 essid_bssid_map = {}
 
+                # converted in parallel, captures converted before are not converted again
+                converted = hashes.get(config).hashes(list(handshake_new))
                 for idx, pcap_path in enumerate(handshake_new):
-                    hashes = self._extract_hashes_from_handshake(pcap_path)
-                    if hashes:
+                    pcap_hashes = converted.get(pcap_path)
+                    if pcap_hashes:
                         # Extract ESSID and BSSID from the first hash line
-                        essid, bssid = self._extract_essid_bssid_from_hash(hashes[0])
-                        if (essid, bssid) in processed_stations:
+                        essid, bssid = self._extract_essid_bssid_from_hash(pcap_hashes[0])
+                        if self._is_processed(db, essid, bssid):
                             logging.debug(f"OHC NewAPI: Station {essid}/{bssid} already processed, skipping {pcap_path}.")
                             self.skip.append(pcap_path)
                             continue
 
-                        all_hashes.extend(hashes)
+                        all_hashes.extend(pcap_hashes)
                         successfully_extracted.append(pcap_path)
                         essid_bssid_map[pcap_path] = (essid, bssid)
                     else:
@@ -169,15 +164,16 @@ class ohcapi(plugins.Plugin):
                     if upload_success:
                         # Mark all successfully extracted pcaps as reported
                         for pcap_path in successfully_extracted:
-                            reported.append(pcap_path)
                             essid, bssid = essid_bssid_map[pcap_path]
-                            processed_stations.append((essid, bssid))
-                        self.report.update(data={'reported': reported, 'processed_stations': processed_stations})
+                            if bssid != '00:00:00:00:00:00':
+                                db.update(pcap_path, essid=essid, bssid=bssid)
+                        db.set_upload('ohc', successfully_extracted)
                         logging.debug("OHC NewAPI: Successfully reported all new handshakes.")
                     else:
                         # Upload failed, skip these pcaps for future attempts
                         for pcap_path in successfully_extracted:
                             self.skip.append(pcap_path)
+                        db.set_upload('ohc', successfully_extracted, captures.FAILED)
                         logging.debug("OHC NewAPI: Failed to upload tasks, added to skip list.")
                 else:
                     logging.debug("OHC NewAPI: No hashes were extracted from the new pcaps. Nothing to upload.")
@@ -186,6 +182,15 @@ class ohcapi(plugins.Plugin):
             else:
                 logging.debug("OHC NewAPI: No new PCAP files to process.")
 
+    @staticmethod
+    def _is_processed(db, essid, bssid):
+        """
+        Returns True if a capture of the same station was already reported.
+        """
+        if not bssid:
+            return False
+        return any(c['essid'] == essid and db.is_uploaded('ohc', c['path']) for c in db.by_bssid(bssid))
+
     def _add_tasks(self, hashes, timeout=30):
         clean_hashes = [h.strip() for h in hashes if h.strip()]
         if not clean_hashes:
@@ -211,19 +216,3 @@ class ohcapi(plugins.Plugin):
         except requests.exceptions.RequestException as e:
             logging.debug(f"OHC NewAPI: Exception while adding tasks -> {e}")
             return False
-
-    def _extract_hashes_from_handshake(self, pcap_path):
-        hashes = []
-        hcxpcapngtool = '/usr/bin/hcxpcapngtool'
-        hccapx_path = pcap_path.replace('.pcap', '.22000')
-        hcxpcapngtool_cmd = f"{hcxpcapngtool} -o {hccapx_path} {pcap_path}"
-        os.popen(hcxpcapngtool_cmd).read()
-        if os.path.exists(hccapx_path) and os.path.getsize(hccapx_path) > 0:
-            logging.debug(f"OHC NewAPI: Extracted hashes from {pcap_path}")
-            with open(hccapx_path, 'r') as hccapx_file:
-                hashes = hccapx_file.readlines()
-        else:
-            logging.debug(f"OHC NewAPI: Failed to extract hashes from {pcap_path}")
-            if os.path.exists(hccapx_path):
-                os.remove(hccapx_path)
-        return hashes
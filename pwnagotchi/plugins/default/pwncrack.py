@@ -1,10 +1,12 @@
 import time
 import os
-import subprocess
 import requests
 import logging
 import socket
 from pwnagotchi.plugins import Plugin
+from pwnagotchi import catalog
+from pwnagotchi import captures
+from pwnagotchi import hashes
 
 class UploadConvertPlugin(Plugin):
     __author__ = 'Terminatoror'
@@ -26,7 +28,6 @@ class UploadConvertPlugin(Plugin):
         self.handshake_dir = config["bettercap"].get("handshakes")
         self.key = self.options.get('key', "")  # Change this to your key
         self.whitelist = config["main"].get("whitelist", [])
-        self.combined_file = os.path.join(self.handshake_dir, 'combined.hc22000')
         self.potfile_path = os.path.join(self.handshake_dir, 'cracked.pwncrack.potfile')
 
     def on_internet_available(self, agent):
@@ -38,34 +39,32 @@ class UploadConvertPlugin(Plugin):
         self.last_run_time = current_time
         logging.info(f"[pwncrack] Running upload process. Key: {self.key}, waiting: {self.timewait} seconds.")
         try:
-            self._convert_and_upload()
+            self._convert_and_upload(agent.config())
             self._download_potfile()
         except Exception as e:
             logging.error(f"[pwncrack] Error occurred during upload process: {e}", exc_info=True)
 
-    def _convert_and_upload(self):
-        # Convert all .pcap files to .hc22000, excluding files matching whitelist items
-        pcap_files = [f for f in os.listdir(self.handshake_dir)
-                      if f.endswith('.pcap') and not any(item in f for item in self.whitelist)]
+    def _convert_and_upload(self, config):
+        db = captures.get(config)
+        db.sync(catalog.get(self.handshake_dir).files())
+        # Only the .pcap files not uploaded yet, excluding files matching whitelist items
+        pcap_files = [f for f in db.pending('pwncrack')
+                      if not any(item in os.path.basename(f) for item in self.whitelist)]
+        # Each capture is converted to .22000 once, and shared with the other plugins
+        converted = hashes.get(config).hashes(pcap_files)
+        pcap_files = [f for f in pcap_files if converted[f]]
         if pcap_files:
-            for pcap_file in pcap_files:
-                subprocess.run(['hcxpcapngtool', '-o', self.combined_file, os.path.join(self.handshake_dir, pcap_file)])
-
-            # Ensure the combined file is created
-            if not os.path.exists(self.combined_file):
-                open(self.combined_file, 'w').close()
-
-            # Upload the combined .hc22000 file
-            with open(self.combined_file, 'rb') as file:
-                files = {'handshake': file}
-                data = {'key': self.key}
-                response = requests.post(self.server_url, files=files, data=data)
+            lines = dict.fromkeys(line for f in pcap_files for line in converted[f])
+            files = {'handshake': ('combined.hc22000', '\n'.join(lines) + '\n')}
+            data = {'key': self.key}
+            response = requests.post(self.server_url, files=files, data=data)
 
             # Log the response
             logging.info(f"[pwncrack] Upload response: {response.json()}")
-            os.remove(self.combined_file)  # Remove the combined.hc22000 file
+            if response.status_code == 200:
+                db.set_upload('pwncrack', pcap_files)
         else:
-            logging.info("[pwncrack] No .pcap files found to convert (or all files are whitelisted).")
+            logging.info("[pwncrack] No new hashes to upload (or all files are whitelisted).")
 
     def _download_potfile(self):
         response = requests.get(self.potfile_url, params={'key': self.key})
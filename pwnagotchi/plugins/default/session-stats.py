@@ -1,13 +1,20 @@
 import os
+import json
 import logging
 import threading
-from time import sleep
+from bisect import bisect_left, bisect_right
 from datetime import datetime,timedelta
 from pwnagotchi import plugins
-from pwnagotchi.utils import StatusFile
+from pwnagotchi import clock
 from flask import render_template_string
 from flask import jsonify
 
+# points per series sent to a chart unless it asks for another resolution
+default_resolution = 500
+# sessions saved by older versions, one json document rewritten on every epoch
+LEGACY_SUFFIX = '.json'
+SUFFIX = '.jsonl'
+
 TEMPLATE = """
 {% extends "base.html" %}
 {% set active_page = "plugins" %}
@@ -68,7 +75,14 @@ TEMPLATE = """
     }
 
     function loadData(url, elm, title, fill) {
+        // only what the chart can show: the selected window, about one point per pixel
+        var span = $("#window").val();
+        url += '&resolution=' + Math.max(100, Math.round($('#' + elm).width()));
+        if (span) {
+            url += "&range=-" + span;
+        }
         var data = ajaxDataRenderer(url);
+        $('#' + elm).empty();
         var plot_os = $.jqplot(elm, data.values,{
         title: title,
         stackSeries: fill,
@@ -120,7 +134,7 @@ TEMPLATE = """
 
     function loadSessionFiles() {
         loadFiles('/plugins/session-stats/session', 'session');
-        $("#session").change(function() {
+        $("#session, #window").change(function() {
             loadSessionData();
         });
     }
@@ -147,6 +161,11 @@ TEMPLATE = """
     <select id="session">
         <option selected>Current</option>
     </select>
+    <select id="window">
+        <option value="" selected>Whole session</option>
+        <option value="3600">Last hour</option>
+        <option value="21600">Last 6 hours</option>
+    </select>
     <div id="chart_os" class="chart"></div>
     <div id="chart_temp" class="chart"></div>
     <div id="chart_wifi" class="chart"></div>
@@ -156,23 +175,111 @@ TEMPLATE = """
 {% endblock %}
 """
 
-class GhettoClock:
-    def __init__(self):
-        self.lock = threading.Lock()
-        self._track = datetime.now()
-        self._counter_thread = threading.Thread(target=self.counter)
-        self._counter_thread.daemon = True
-        self._counter_thread.start()
-
-    def counter(self):
-        while True:
-            with self.lock:
-                self._track += timedelta(seconds=1)
-            sleep(1)
-
-    def now(self):
-        with self.lock:
-            return self._track
+class SeriesStore(object):
+    """
+    The epochs of a session in columns, one list per key, backed by a JSON lines file
+    that only ever gets one line appended per epoch.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.timestamps = list()
+        self.columns = dict()
+        self._fp = None
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        if path.endswith(LEGACY_SUFFIX):
+            store._load_legacy(path)
+            return store
+        with open(path) as fp:
+            for line in fp:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # the last line of a session that was cut short
+                    continue
+                store._add(row.pop('ts'), row)
+        return store
+
+    def _load_legacy(self, path):
+        # keys were HH:MM:SS, the day comes from the name stats_%Y_%m_%d_%H_%M.json
+        with open(path) as fp:
+            data = json.load(fp).get('data', dict())
+        try:
+            day = datetime.strptime(os.path.basename(path), "stats_%Y_%m_%d_%H_%M.json")
+        except ValueError:
+            day = datetime.fromtimestamp(os.path.getmtime(path))
+        started, last = day.replace(hour=0, minute=0, second=0), None
+        for hhmmss, row in data.items():
+            try:
+                ts = datetime.combine(started.date(), datetime.strptime(hhmmss, "%H:%M:%S").time())
+            except ValueError:
+                continue
+            if last is not None and ts < last:
+                # past midnight
+                started += timedelta(days=1)
+                ts += timedelta(days=1)
+            last = ts
+            self._add(ts.timestamp(), row)
+
+    def _add(self, ts, row):
+        index = len(self.timestamps)
+        self.timestamps.append(ts)
+        for key, value in row.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = [None] * index
+            column.append(value)
+        for key, column in self.columns.items():
+            if len(column) == index:
+                column.append(None)
+
+    def append(self, ts, row):
+        self._add(ts, row)
+        if self._fp is None:
+            self._fp = open(self.path, 'a')
+        self._fp.write(json.dumps(dict(ts=ts, **row)) + '\n')
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    def keys(self):
+        return list(self.columns)
+
+    def range(self, start=None, end=None):
+        """
+        Returns the (from, to) indexes of the epochs between start and end, negative
+        values are seconds before the last epoch.
+        """
+        if not self.timestamps:
+            return 0, 0
+        last = self.timestamps[-1]
+        if start is not None and start < 0:
+            start = last + start
+        if end is not None and end < 0:
+            end = last + end
+        lo = 0 if start is None else bisect_left(self.timestamps, start)
+        hi = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+        return lo, hi
+
+    def query(self, keys, start=None, end=None, resolution=default_resolution):
+        """
+        Returns a [timestamp in ms, value] series per key, averaged over buckets of epochs
+        so that no series has more than resolution points.
+        """
+        lo, hi = self.range(start, end)
+        step = max(1, -(-(hi - lo) // max(resolution, 1)))
+        series = list()
+        for key in keys:
+            column = self.columns.get(key, ())
+            points = list()
+            for i in range(lo, hi, step):
+                values = [v for v in column[i:min(i + step, hi)] if isinstance(v, (int, float))]
+                if values:
+                    points.append([int(self.timestamps[i] * 1000), sum(values) / len(values)])
+            series.append(points)
+        return series
 
 
 class SessionStats(plugins.Plugin):
@@ -184,8 +291,9 @@ class SessionStats(plugins.Plugin):
     def __init__(self):
         self.lock = threading.Lock()
         self.options = dict()
-        self.stats = dict()
-        self.clock = GhettoClock()
+        self.stats = None
+        # session name -> (mtime, SeriesStore) of the last past session looked at
+        self.past_sessions = dict()
 
     def on_loaded(self):
         """
@@ -194,28 +302,39 @@ class SessionStats(plugins.Plugin):
         # this has to happen in "loaded" because the options are not yet
         # available in the __init__
         os.makedirs(self.options['save_directory'], exist_ok=True)
-        self.session_name = "stats_{}.json".format(self.clock.now().strftime("%Y_%m_%d_%H_%M"))
-        self.session = StatusFile(os.path.join(self.options['save_directory'],
-                                               self.session_name),
-                                  data_format='json')
+        self.session_name = "stats_{}{}".format(clock.now().strftime("%Y_%m_%d_%H_%M"), SUFFIX)
+        self.stats = SeriesStore(os.path.join(self.options['save_directory'], self.session_name))
         logging.info("Session-stats plugin loaded.")
 
     def on_epoch(self, agent, epoch, epoch_data):
         """
-        Save the epoch_data to self.stats
+        Append the epoch_data to self.stats
         """
         with self.lock:
-            self.stats[self.clock.now().strftime("%H:%M:%S")] = epoch_data
-            self.session.update(data={'data': self.stats})
+            try:
+                self.stats.append(clock.time(), epoch_data)
+            except OSError as e:
+                logging.error("[session-stats] can't save epoch %d: %s", epoch, e)
+
+    def load_session(self, name):
+        path = os.path.join(self.options['save_directory'], os.path.basename(name))
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError as e:
+            # no such session, nothing to show
+            logging.debug("[session-stats] %s", e)
+            return SeriesStore()
+        cached = self.past_sessions.get(name)
+        if cached is None or cached[0] != mtime:
+            # only the last one is kept, it is the one being looked at
+            self.past_sessions = {name: (mtime, SeriesStore.load(path))}
+        return self.past_sessions[name][1]
 
     @staticmethod
-    def extract_key_values(data, subkeys):
+    def extract_key_values(store, subkeys, start=None, end=None, resolution=default_resolution):
         result = dict()
-        result['values'] = list()
+        result['values'] = store.query(subkeys, start, end, resolution)
         result['labels'] = subkeys
-        for plot_key in subkeys:
-            v = [ [ts,d[plot_key]] for ts, d in data.items()]
-            result['values'].append(v)
         return result
 
     def on_webhook(self, path, request):
@@ -253,11 +372,27 @@ class SessionStats(plugins.Plugin):
                 'active_for_epochs',
             ]
         elif path == "session":
-            return jsonify({'files': os.listdir(self.options['save_directory'])})
+            return jsonify({'files': sorted(os.listdir(self.options['save_directory']), reverse=True)})
+        elif path == "keys":
+            extract_keys = None
+        elif path == "series":
+            extract_keys = [key for key in request.args.get('keys', '').split(',') if key]
+        else:
+            return "unknown path", 404
+
+        # range=<start>,<end> in seconds since the epoch, negative values are relative
+        # to the end of the session and either one can be left out
+        start, end = None, None
+        if request.args.get('range'):
+            start, _, end = request.args.get('range').partition(',')
+            start = float(start) if start else None
+            end = float(end) if end else None
+        resolution = request.args.get('resolution', default_resolution, type=int)
 
         with self.lock:
-            data = self.stats
+            store = self.stats
             if session_param and session_param != 'Current':
-                file_stats = StatusFile(os.path.join(self.options['save_directory'], session_param), data_format='json')
-                data = file_stats.data_field_or('data', default=dict())
-            return jsonify(SessionStats.extract_key_values(data, extract_keys))
+                store = self.load_session(session_param)
+            if extract_keys is None:
+                return jsonify({'keys': store.keys()})
+            return jsonify(SessionStats.extract_key_values(store, extract_keys, start, end, resolution))
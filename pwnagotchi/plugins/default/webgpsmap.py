@@ -1,12 +1,16 @@
 import sys
 
 import pwnagotchi.plugins as plugins
+import pwnagotchi.catalog as catalog
 import logging
 import os
 import json
 import re
+import gzip
+import math
+import time
+import threading
 from flask import Response
-from functools import lru_cache
 from dateutil.parser import parse
 
 '''
@@ -20,9 +24,285 @@ from dateutil.parser import parse
               position as green instead of red and the password inside the infopox of the position
     special:
         you can save the html-map as one file for offline use or host on your own webspace with "/plugins/webgpsmap/offlinemap"
+        "/plugins/webgpsmap/all?since=<timestamp>" only returns the positions added or changed after timestamp,
+        the X-Positions-Timestamp header of each response is the value to use for the next call.
+        "offset" and "limit" page through the positions, X-Total-Count has how many there are.
+        "/plugins/webgpsmap/clusters?bbox=<west>,<south>,<east>,<north>&zoom=<zoom>" returns what the map shows
+        at that zoom: counts of positions per grid cell, and the positions themselves from points_zoom on.
 
 '''
 
+INDEX_FILENAME = '.webgpsmap-index.json'
+# position files are checked for changes at most this often
+refresh_interval = 10
+# smaller responses are not worth compressing
+gzip_min_size = 1024
+# from this map zoom on every position is shown on its own
+points_zoom = 16
+# clusters are computed on cells 2^CLUSTER_GRID times smaller than the 256px map tiles
+CLUSTER_GRID = 2
+MAX_LATITUDE = 85.0511
+
+
+def _cell(lat, lng, level):
+    """
+    Returns the (x, y) web mercator cell of a position in a 2^level x 2^level grid.
+    """
+    n = 1 << level
+    lat = math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def matches(position, filter_text):
+    """
+    Same filter as the map page: every word has to be found in the ssid, mac or password,
+    #cracked and #notcracked select on the password.
+    """
+    if not filter_text:
+        return True
+    mac = position['mac'].upper()
+    pattern = f"{position['ssid']} {':'.join(mac[i:i + 2] for i in range(0, len(mac), 2))} {position['mac']}"
+    pattern += f"{position['pass']} #cracked" if position.get('pass') else " #notcracked"
+    pattern = pattern.lower()
+    return all(word.lower() in pattern for word in filter_text.split())
+
+
+class ClusterIndex(object):
+    """
+    Grid quadtree of the positions: at each level the map is split in 2^level x 2^level
+    cells, each one keeping the count and centroid of the positions inside. A map query
+    only touches the cells of its bounding box at the level matching its zoom.
+    """
+
+    def __init__(self, positions, max_level=points_zoom + CLUSTER_GRID):
+        self.positions = positions
+        self.max_level = max_level
+        # level -> (x, y) -> [count, sum of lat, sum of lng, cracked count, key if alone]
+        self.levels = [dict() for _ in range(max_level + 1)]
+        # cell of the last level -> keys of its positions
+        self.members = dict()
+        self.bounds = None
+
+        south, west, north, east = 90.0, 180.0, -90.0, -180.0
+        for key, pos in positions.items():
+            lat, lng = pos.get('lat'), pos.get('lng')
+            if lat is None or lng is None:
+                continue
+            south, west, north, east = min(south, lat), min(west, lng), max(north, lat), max(east, lng)
+            cracked = 1 if pos.get('pass') else 0
+            x, y = _cell(lat, lng, max_level)
+            self.members.setdefault((x, y), []).append(key)
+            for level in range(max_level, -1, -1):
+                shift = max_level - level
+                cells = self.levels[level]
+                cell = cells.get((x >> shift, y >> shift))
+                if cell is None:
+                    cells[(x >> shift, y >> shift)] = [1, lat, lng, cracked, key]
+                else:
+                    cell[0] += 1
+                    cell[1] += lat
+                    cell[2] += lng
+                    cell[3] += cracked
+                    cell[4] = None
+        if self.members:
+            self.bounds = [[south, west], [north, east]]
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.members.values())
+
+    def _cells(self, level, bbox):
+        cells = self.levels[level] if level < len(self.levels) else None
+        if bbox is None:
+            return cells.items()
+        west, south, east, north = bbox
+        n = 1 << level
+        x0, y0 = _cell(north, west, level)
+        x1, y1 = _cell(south, east, level)
+        if west >= east or east - west >= 360:
+            # around the antimeridian or the whole world
+            x0, x1 = 0, n - 1
+        if (x1 - x0 + 1) * (y1 - y0 + 1) < len(cells):
+            return [((x, y), cells[(x, y)]) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in cells]
+        return [(xy, cell) for xy, cell in cells.items() if x0 <= xy[0] <= x1 and y0 <= xy[1] <= y1]
+
+    @staticmethod
+    def _cluster(cell):
+        count, lat, lng, cracked, _ = cell
+        return [lat / count, lng / count, count, cracked]
+
+    def query(self, bbox=None, zoom=0):
+        """
+        bbox is (west, south, east, north), returns a dict with the clusters as
+        [lat, lng, count, cracked count] and the positions shown on their own.
+        """
+        clusters, points = list(), dict()
+        if zoom >= points_zoom:
+            for xy, _ in self._cells(self.max_level, bbox):
+                for key in self.members[xy]:
+                    points[key] = self.positions[key]
+        else:
+            for _, cell in self._cells(min(max(zoom, 0) + CLUSTER_GRID, self.max_level), bbox):
+                if cell[0] == 1:
+                    points[cell[4]] = self.positions[cell[4]]
+                else:
+                    clusters.append(self._cluster(cell))
+        return {'clusters': clusters, 'points': points, 'bounds': self.bounds, 'total': len(self)}
+
+    def export(self):
+        """
+        The clusters of every zoom for the offline map, without the zooms where there are none left.
+        """
+        levels = dict()
+        for zoom in range(points_zoom):
+            level = min(zoom + CLUSTER_GRID, self.max_level)
+            cells = self.levels[level].values()
+            if all(cell[0] == 1 for cell in cells):
+                break
+            levels[zoom] = [self._cluster(cell) if cell[0] > 1 else cell[4] for cell in cells]
+        return {'levels': levels, 'points_zoom': points_zoom, 'bounds': self.bounds}
+
+
+class PositionIndex(object):
+    """
+    The position of every capture, kept on disk next to the handshakes and invalidated by
+    the modification time of the position and cracked files, so that each file is only
+    read again when it changes.
+    """
+
+    def __init__(self, handshake_dir):
+        self.handshake_dir = handshake_dir
+        self.filename = os.path.join(handshake_dir, INDEX_FILENAME)
+        self.version = 0
+        self._lock = threading.Lock()
+        # capture name -> {'pos_file', 'mtime', 'cracked_mtime', 'updated', 'data'}
+        self._entries = dict()
+        self._refreshed_at = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as fp:
+                self._entries = json.load(fp)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as error:
+            logging.warning(f"[webgpsmap] can't read {self.filename}, rebuilding it: {error}")
+
+    def _save(self):
+        temp = self.filename + '.tmp'
+        try:
+            with open(temp, 'w') as fp:
+                json.dump(self._entries, fp)
+            os.replace(temp, self.filename)
+        except OSError as error:
+            logging.error(f"[webgpsmap] can't write {self.filename}: {error}")
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and self._refreshed_at is not None and \
+                    time.monotonic() - self._refreshed_at < refresh_interval:
+                return
+
+            handshakes = catalog.get(self.handshake_dir)
+            all_pcap_files = handshakes.files()
+            seen, changed = set(), 0
+            for filename_pcap in all_pcap_files:
+                filename_base = filename_pcap[:-5]  # remove ".pcap"
+                # a .geo.json wins over a .gps.json
+                if handshakes.has(filename_pcap, ".geo.json"):
+                    pos_file = filename_base + ".geo.json"
+                elif handshakes.has(filename_pcap, ".gps.json"):
+                    pos_file = filename_base + ".gps.json"
+                else:
+                    continue
+
+                mtime = self._mtime(pos_file)
+                if mtime is None:
+                    continue
+                name = os.path.basename(filename_base)
+                seen.add(name)
+                cracked_file = filename_pcap + ".cracked"
+                cracked_mtime = self._mtime(cracked_file) if handshakes.has(filename_pcap, ".pcap.cracked") else None
+
+                entry = self._entries.get(name)
+                if entry and entry['pos_file'] == pos_file and entry['mtime'] == mtime and \
+                        entry['cracked_mtime'] == cracked_mtime:
+                    continue
+                self._entries[name] = {
+                    'pos_file': pos_file,
+                    'mtime': mtime,
+                    'cracked_mtime': cracked_mtime,
+                    'updated': time.time(),
+                    # unreadable files are remembered too, until they change
+                    'data': self._read(pos_file, cracked_file if cracked_mtime is not None else None),
+                }
+                changed += 1
+
+            gone = set(self._entries) - seen
+            for name in gone:
+                del self._entries[name]
+
+            if changed or gone:
+                self.version += 1
+                self._save()
+                logging.info(f"[webgpsmap] {changed} positions updated, {len(gone)} removed, "
+                             f"{len(self._entries)} from {len(all_pcap_files)} handshakes")
+            self._refreshed_at = time.monotonic()
+
+    @staticmethod
+    def _read(pos_file, cracked_file):
+        try:
+            pos = PositionFile(pos_file)
+            ssid, mac = pos.ssid(), pos.mac()
+            ssid = "unknown" if not ssid else ssid
+            # invalid mac is strange and should abort; ssid is ok
+            if not mac:
+                raise ValueError("Mac can't be parsed from filename")
+            data = {
+                'ssid': ssid,
+                'mac': mac,
+                'type': 'gps' if pos.type() == PositionFile.GPS else 'geo',
+                'lng': pos.lng(),
+                'lat': pos.lat(),
+                'acc': pos.accuracy(),
+                'ts_first': pos.timestamp_first(),
+                'ts_last': pos.timestamp_last(),
+            }
+            # get ap password if exist
+            if cracked_file is not None:
+                with open(cracked_file, 'r') as password_file:
+                    data['pass'] = password_file.read()
+            return data
+        except json.JSONDecodeError as error:
+            logging.error(f"[webgpsmap] JSONDecodeError in: {pos_file} - error: {error}")
+        except ValueError as error:
+            logging.error(f"[webgpsmap] ValueError: {pos_file} - error: {error}")
+        except OSError as error:
+            logging.error(f"[webgpsmap] OSError: {pos_file} - error: {error}")
+        return None
+
+    def positions(self, since=None):
+        """
+        Returns ssid_mac -> position of the captures, only of the ones updated after since if given.
+        """
+        self.refresh()
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            entry['data']['ssid'] + "_" + entry['data']['mac']: entry['data']
+            for entry in entries
+            if entry['data'] is not None and (since is None or entry['updated'] > since)
+        }
+
 
 class Webgpsmap(plugins.Plugin):
     __author__ = 'https://github.com/xenDE and https://github.com/dadav'
@@ -31,14 +311,17 @@ class Webgpsmap(plugins.Plugin):
     __license__ = 'GPL3'
     __description__ = 'a plugin for pwnagotchi that shows a openstreetmap with positions of ap-handshakes in your webbrowser'
 
-    ALREADY_SENT = list()
-    SKIP = list()
-
     def __init__(self):
         self.ready = False
+        self.index = None
+        # (index version, json, gzip'd json) of the last full answer
+        self._all_cache = None
+        # (index version, filter, ClusterIndex) of the last map query
+        self._clusters = None
 
     def on_config_changed(self, config):
         self.config = config
+        self.index = PositionIndex(config['bettercap']['handshakes'])
         self.ready = True
 
     def on_loaded(self):
@@ -74,7 +357,6 @@ class Webgpsmap(plugins.Plugin):
             if request.method == "GET":
                 if path == '/' or not path:
                     # returns the html template
-                    self.ALREADY_SENT = list()
                     try:
                         response_data = bytes(self.get_html(), "utf-8")
                     except Exception as error:
@@ -84,25 +366,26 @@ class Webgpsmap(plugins.Plugin):
                     response_mimetype = "application/xhtml+xml"
                     response_header_contenttype = 'text/html'
                 elif path.startswith('all'):
-                    # returns all positions
+                    # returns all positions, or the ones changed since a timestamp
                     try:
-                        self.ALREADY_SENT = list()
-                        response_data = bytes(
-                            json.dumps(self.load_gps_from_dir(self.config['bettercap']['handshakes'])), "utf-8")
-                        response_status = 200
-                        response_mimetype = "application/json"
-                        response_header_contenttype = 'application/json'
+                        return self.positions_response(request)
                     except Exception as error:
                         logging.error(f"[webgpsmap] on_webhook all error: {error}")
                         return
+                elif path.startswith('clusters'):
+                    # returns the clusters and positions inside a bounding box at a zoom
+                    try:
+                        return self.clusters_response(request)
+                    except Exception as error:
+                        logging.error(f"[webgpsmap] on_webhook clusters error: {error}")
+                        return
                 elif path.startswith('offlinemap'):
-                    # for download an all-in-one html file with positions.json inside
+                    # for download an all-in-one html file with the positions and their clusters inside
                     try:
-                        self.ALREADY_SENT = list()
-                        json_data = json.dumps(self.load_gps_from_dir(self.config['bettercap']['handshakes']))
+                        clusters = self.get_clusters()
+                        json_data = json.dumps({'positions': clusters.positions, 'clusters': clusters.export()})
                         html_data = self.get_html()
-                        html_data = html_data.replace('var positions = [];',
-                                                      'var positions = ' + json_data + ';positionsLoaded=true;drawPositions();')
+                        html_data = html_data.replace('var offlineData = null;', 'var offlineData = ' + json_data + ';')
                         response_data = bytes(html_data, "utf-8")
                         response_status = 200
                         response_mimetype = "application/xhtml+xml"
@@ -111,12 +394,6 @@ class Webgpsmap(plugins.Plugin):
                     except Exception as error:
                         logging.error(f"[webgpsmap] on_webhook offlinemap: error: {error}")
                         return
-                # elif path.startswith('/newest'):
-                #     # returns all positions newer then timestamp
-                #     response_data = bytes(json.dumps(self.load_gps_from_dir(self.config['bettercap']['handshakes']), newest_only=True), "utf-8")
-                #     response_status = 200
-                #     response_mimetype = "application/json"
-                #     response_header_contenttype = 'application/json'
                 else:
                     # unknown GET path
                     response_data = bytes('''<html>
@@ -148,101 +425,65 @@ class Webgpsmap(plugins.Plugin):
             logging.error(f"[webgpsmap] on_webhook CREATING_RESPONSE error: {error}")
             return
 
-    # cache 2048 items
-    @lru_cache(maxsize=2048, typed=False)
-    def _get_pos_from_file(self, path):
-        return PositionFile(path)
-
-    def load_gps_from_dir(self, gpsdir, newest_only=False):
+    def positions_response(self, request):
+        since = request.args.get('since', type=float)
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        positions = self.index.positions(since)
+        # after the refresh, whatever changes next gets a later timestamp
+        timestamp = time.time()
+        total = len(positions)
+
+        if since is None and not offset and limit is None:
+            # the common case, reuse the last answer until something changes
+            if self._all_cache is None or self._all_cache[0] != self.index.version:
+                data = json.dumps(positions).encode('utf-8')
+                self._all_cache = (self.index.version, data, gzip.compress(data, 6))
+            _, data, compressed = self._all_cache
+        else:
+            keys = sorted(positions)[offset:None if limit is None else offset + limit]
+            data = json.dumps({key: positions[key] for key in keys}).encode('utf-8')
+            compressed = None
+
+        r = self.json_response(request, data, compressed)
+        r.headers["X-Positions-Timestamp"] = "%.3f" % timestamp
+        r.headers["X-Total-Count"] = str(total)
+        return r
+
+    def get_clusters(self, filter_text=''):
+        positions = self.index.positions()
+        if self._clusters is None or self._clusters[:2] != (self.index.version, filter_text):
+            if filter_text:
+                positions = {key: pos for key, pos in positions.items() if matches(pos, filter_text)}
+            self._clusters = (self.index.version, filter_text, ClusterIndex(positions))
+        return self._clusters[2]
+
+    def clusters_response(self, request):
+        bbox = request.args.get('bbox')
+        if bbox:
+            bbox = [float(value) for value in bbox.split(',')]
+            if len(bbox) != 4:
+                raise ValueError(f"bad bbox {request.args.get('bbox')}")
+        zoom = request.args.get('zoom', 0, type=int)
+        data = json.dumps(self.get_clusters(request.args.get('filter', '').strip()).query(bbox, zoom)).encode('utf-8')
+        return self.json_response(request, data)
+
+    @staticmethod
+    def json_response(request, data, compressed=None):
+        r = Response(response=data, status=200, mimetype="application/json")
+        if len(data) >= gzip_min_size and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            r.set_data(compressed if compressed is not None else gzip.compress(data, 6))
+            r.headers["Content-Encoding"] = 'gzip'
+            r.headers["Vary"] = 'Accept-Encoding'
+        r.headers["Content-Type"] = 'application/json'
+        return r
+
+    def load_gps_from_dir(self, gpsdir):
         """
-        Parses the gps-data from disk
+        Returns the positions of the captures in gpsdir
         """
-
-        handshake_dir = gpsdir
-        gps_data = dict()
-
-        logging.info(f"[webgpsmap] scanning {handshake_dir}")
-
-        all_files = os.listdir(handshake_dir)
-        # print(all_files)
-        all_pcap_files = [os.path.join(handshake_dir, filename) for filename in all_files if
-                          filename.endswith('.pcap')]
-        all_geo_or_gps_files = []
-        for filename_pcap in all_pcap_files:
-            filename_base = filename_pcap[:-5]  # remove ".pcap"
-            logging.debug(f"[webgpsmap] found: {filename_base}")
-            filename_position = None
-
-            logging.debug("[webgpsmap] search for .gps.json")
-            check_for = os.path.basename(filename_base) + ".gps.json"
-            if check_for in all_files:
-                filename_position = str(os.path.join(handshake_dir, check_for))
-
-            logging.debug("[webgpsmap] search for .geo.json")
-            check_for = os.path.basename(filename_base) + ".geo.json"
-            if check_for in all_files:
-                filename_position = str(os.path.join(handshake_dir, check_for))
-
-            logging.debug(f"[webgpsmap] end search for position data files and use {filename_position}")
-
-            if filename_position is not None:
-                all_geo_or_gps_files.append(filename_position)
-
-        #    all_geo_or_gps_files = set(all_geo_or_gps_files) - set(SKIP)   # remove skipped networks? No!
-
-        if newest_only:
-            all_geo_or_gps_files = set(all_geo_or_gps_files) - set(self.ALREADY_SENT)
-
-        logging.info(
-            f"[webgpsmap] Found {len(all_geo_or_gps_files)} position-data files from {len(all_pcap_files)} handshakes. Fetching positions ...")
-
-        for pos_file in all_geo_or_gps_files:
-            try:
-                pos = self._get_pos_from_file(pos_file)
-                if not pos.type() == PositionFile.GPS and not pos.type() == PositionFile.GEO and not pos.type() == PositionFile.PAWGPS:
-                    continue
-
-                ssid, mac = pos.ssid(), pos.mac()
-                ssid = "unknown" if not ssid else ssid
-                # invalid mac is strange and should abort; ssid is ok
-                if not mac:
-                    raise ValueError("Mac can't be parsed from filename")
-                pos_type = 'unknown'
-                if pos.type() == PositionFile.GPS:
-                    pos_type = 'gps'
-                elif pos.type() == PositionFile.GEO:
-                    pos_type = 'geo'
-                gps_data[ssid + "_" + mac] = {
-                    'ssid': ssid,
-                    'mac': mac,
-                    'type': pos_type,
-                    'lng': pos.lng(),
-                    'lat': pos.lat(),
-                    'acc': pos.accuracy(),
-                    'ts_first': pos.timestamp_first(),
-                    'ts_last': pos.timestamp_last(),
-                }
-
-                # get ap password if exist
-                check_for = os.path.basename(pos_file).split(".")[0] + ".pcap.cracked"
-                if check_for in all_files:
-                    gps_data[ssid + "_" + mac]["pass"] = pos.password()
-
-                self.ALREADY_SENT += pos_file
-            except json.JSONDecodeError as error:
-                self.SKIP += pos_file
-                logging.error(f"[webgpsmap] JSONDecodeError in: {pos_file} - error: {error}")
-                continue
-            except ValueError as error:
-                self.SKIP += pos_file
-                logging.error(f"[webgpsmap] ValueError: {pos_file} - error: {error}")
-                continue
-            except OSError as error:
-                self.SKIP += pos_file
-                logging.error(f"[webgpsmap] OSError: {pos_file} - error: {error}")
-                continue
-        logging.info(f"[webgpsmap] loaded {len(gps_data)} positions")
-        return gps_data
+        index = self.index if self.index is not None and self.index.handshake_dir == gpsdir else PositionIndex(gpsdir)
+        return index.positions()
 
     def get_html(self):
         """
@@ -1,33 +1,85 @@
 import os
+import glob
+import shutil
 import logging
 import json
 import csv
 import requests
 import pwnagotchi
 import re
-from glob import glob
 from threading import Lock
-from io import StringIO
 from datetime import datetime, UTC
 from dataclasses import dataclass
 
 from flask import make_response, redirect
 from pwnagotchi.utils import (
     WifiInfo,
-    FieldNotFoundError,
-    extract_from_pcap,
-    StatusFile,
     remove_whitelisted,
 )
 from pwnagotchi import plugins
-from pwnagotchi.plugins.default.cache import read_ap_cache
+from pwnagotchi import catalog
+from pwnagotchi import captures
+from pwnagotchi import analysis
+from pwnagotchi.apcache import read_ap_cache
 from pwnagotchi._version import __version__ as __pwnagotchi_version__
 
 import pwnagotchi.ui.fonts as fonts
 from pwnagotchi.ui.components import Text
 from pwnagotchi.ui.view import BLACK
 
-from scapy.all import Scapy_Exception
+# a backlog is exported to csv files of about this size, each one uploaded on its own
+default_max_chunk_size = 512 * 1024
+
+
+class ChunkWriter(object):
+    """
+    Streams csv rows to files of at most about max_size bytes. Each file gets a manifest
+    with the captures in it, so that its upload can be retried on its own.
+    """
+
+    def __init__(self, directory, basename, header, max_size):
+        self.directory = directory
+        self.basename = basename
+        self.header = header
+        self.max_size = max_size
+        self.chunks = list()
+        self._fp = None
+        self._writer = None
+        self._captures = None
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, row, capture):
+        if self._fp is None:
+            self._open()
+        self._writer.writerow(row)
+        self._captures.append(capture)
+        if self._fp.tell() >= self.max_size:
+            self._finish()
+
+    def close(self):
+        if self._fp is not None:
+            self._finish()
+        return self.chunks
+
+    def _open(self):
+        self._path = os.path.join(self.directory, f"{self.basename}_{len(self.chunks) + 1:03d}.csv")
+        self._fp = open(self._path + ".part", "w", newline="")
+        self._fp.write(self.header)
+        self._writer = csv.writer(self._fp, delimiter=",", quoting=csv.QUOTE_NONE, escapechar="\\")
+        self._captures = list()
+
+    def _finish(self):
+        self._fp.close()
+        with open(manifest_of(self._path), "w") as f:
+            json.dump(self._captures, f)
+        # only complete chunks are ever uploaded
+        os.replace(self._path + ".part", self._path)
+        self.chunks.append((self._path, self._captures))
+        self._fp = self._writer = self._captures = None
+
+
+def manifest_of(chunk):
+    return re.sub(r"\.csv$", ".json", chunk)
 
 
 @dataclass
@@ -72,7 +124,6 @@ class Wigle(plugins.Plugin):
 
     def __init__(self):
         self.ready = False
-        self.report = None
         self.skip = list()
         self.lock = Lock()
         self.options = dict()
@@ -90,8 +141,11 @@ class Wigle(plugins.Plugin):
             return
         self.donate = self.options.get("donate", False)
         self.handshake_dir = config["bettercap"].get("handshakes")
-        report_filename = os.path.join(self.handshake_dir, ".wigle_uploads")
-        self.report = StatusFile(report_filename, data_format="json")
+        self.report_filename = os.path.join(self.handshake_dir, ".wigle_uploads")
+        self.spool_dir = os.path.join(self.handshake_dir, ".wigle")
+        self.max_chunk_size = self.options.get("max_chunk_size", default_max_chunk_size)
+        self.captures = captures.get(config)
+        self.analysis = analysis.get(config)
         self.cache_dir = os.path.join(self.handshake_dir, "cache")
         self.cvs_dir = self.options.get("cvs_dir", None)
         self.whitelist = config["main"].get("whitelist", [])
@@ -104,11 +158,22 @@ class Wigle(plugins.Plugin):
     def on_webhook(self, path, request):
         return make_response(redirect("https://www.wigle.net/", code=302))
 
-    def get_new_gps_files(self, reported):
-        all_gps_files = glob(os.path.join(self.handshake_dir, "*.gps.json"))
-        all_gps_files += glob(os.path.join(self.handshake_dir, "*.geo.json"))
+    def get_new_gps_files(self, chunks):
+        handshakes = catalog.get(self.handshake_dir)
+        self.captures.import_reported("wigle", self.report_filename,
+                                      lambda gps_file: re.sub(r"\.(geo|gps)\.json$", ".pcap", gps_file))
+        self.captures.sync(handshakes.files())
+        spooled = {capture for _, captures_in_chunk in chunks for capture in captures_in_chunk}
+        all_gps_files = list()
+        for pcap_filename in self.captures.pending("wigle"):
+            if pcap_filename in spooled:
+                continue
+            for suffix in (".gps.json", ".geo.json"):
+                if handshakes.has(pcap_filename, suffix):
+                    all_gps_files.append(re.sub(r"\.pcap$", suffix, pcap_filename))
+                    break
         all_gps_files = remove_whitelisted(all_gps_files, self.whitelist)
-        return set(all_gps_files) - set(reported) - set(self.skip)
+        return set(all_gps_files) - set(self.skip)
 
     @staticmethod
     def get_pcap_filename(gps_file):
@@ -152,9 +217,26 @@ class Wigle(plugins.Plugin):
             return None
         return gps_data
 
-    def get_pcap_data(self, pcap_filename):
+    @staticmethod
+    def get_metadata(capture):
+        """
+        What the agent recorded about the access point when the capture was taken.
+        """
+        if not capture:
+            return None
+        data = {field: capture.get(field.name.lower()) for field in WifiInfo}
+        if any(value is None for value in data.values()):
+            return None
+        return data
+
+    def get_pcap_data(self, pcap_filename, parsed=None, probe=False):
+        """
+        probe only looks at what is already known about the capture, it doesn't parse it.
+        """
+        if metadata := self.get_metadata(self.captures.get(pcap_filename)):
+            return metadata
         try:
-            if cache := read_ap_cache(self.cache_dir, self.pcap_filename):
+            if cache := read_ap_cache(self.cache_dir, pcap_filename):
                 logging.info(f"[WIGLE] Using cache for {pcap_filename}")
                 return {
                     WifiInfo.BSSID: cache["mac"],
@@ -166,123 +248,153 @@ class Wigle(plugins.Plugin):
                 }
         except (AttributeError, KeyError):
             pass
-        try:
-            pcap_data = extract_from_pcap(
-                pcap_filename,
-                [
-                    WifiInfo.BSSID,
-                    WifiInfo.ESSID,
-                    WifiInfo.ENCRYPTION,
-                    WifiInfo.CHANNEL,
-                    WifiInfo.FREQUENCY,
-                    WifiInfo.RSSI,
-                ],
-            )
-            logging.debug(f"[WIGLE] PCAP data for {pcap_filename}: {pcap_data}")
-        except FieldNotFoundError:
-            logging.debug(f"[WIGLE] Cannot extract all data: {pcap_filename} (skipped)")
+        if probe:
             return None
-        except Scapy_Exception as sc_e:
-            logging.debug(f"[WIGLE] {sc_e}")
+        if parsed is None:
+            parsed = self.analysis.info(pcap_filename)
+        if not parsed or any(field not in parsed for field in WifiInfo):
+            logging.debug(f"[WIGLE] Cannot extract all data: {pcap_filename} (skipped)")
             return None
-        return pcap_data
+        logging.debug(f"[WIGLE] PCAP data for {pcap_filename}: {parsed}")
+        return parsed
 
-    def generate_csv(self, data):
-        date = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{pwnagotchi.name()}_{date}.csv"
-
-        content = StringIO()
-        # write kismet header + header
-        content.write(
+    def csv_header(self):
+        # kismet header + header
+        return (
             f"WigleWifi-1.6,appRelease={self.__version__},model=pwnagotchi,release={__pwnagotchi_version__},"
             f"device={pwnagotchi.name()},display=kismet,board=RaspberryPi,brand=pwnagotchi,star=Sol,body=3,subBody=0\n"
             f"MAC,SSID,AuthMode,FirstSeen,Channel,Frequency,RSSI,CurrentLatitude,CurrentLongitude,AltitudeMeters,AccuracyMeters,RCOIs,MfgrId,Type\n"
         )
-        writer = csv.writer(content, delimiter=",", quoting=csv.QUOTE_NONE, escapechar="\\")
-        for gps_data, pcap_data in data:  # write WIFIs
+
+    @staticmethod
+    def csv_row(gps_data, pcap_data):
+        try:
+            timestamp = datetime.strptime(
+                gps_data["Updated"].rsplit(".")[0], "%Y-%m-%dT%H:%M:%S"
+            ).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            timestamp = datetime.strptime(
+                gps_data["Updated"].rsplit(".")[0], "%Y-%m-%d %H:%M:%S"
+            ).strftime("%Y-%m-%d %H:%M:%S")
+        encryption = pcap_data[WifiInfo.ENCRYPTION]
+        if isinstance(encryption, str):
+            # bettercap gives a single string, the captures a set
+            encryption = [encryption]
+        return [
+            pcap_data[WifiInfo.BSSID],
+            pcap_data[WifiInfo.ESSID],
+            f"[{']['.join(sorted(encryption))}]",
+            timestamp,
+            pcap_data[WifiInfo.CHANNEL],
+            pcap_data[WifiInfo.FREQUENCY],
+            pcap_data[WifiInfo.RSSI],
+            gps_data["Latitude"],
+            gps_data["Longitude"],
+            gps_data["Altitude"],
+            gps_data["Accuracy"],
+            "",  # RCOIs to populate
+            "",  # MfgrId always empty
+            "WIFI",
+        ]
+
+    def get_spooled_chunks(self):
+        """
+        Returns (chunk file, captures in it) of the chunks exported but not uploaded yet.
+        """
+        chunks = list()
+        for leftover in glob.glob(os.path.join(self.spool_dir, "*.csv.part")):
+            # interrupted export, its captures are still pending
+            os.remove(leftover)
+        for chunk in sorted(glob.glob(os.path.join(self.spool_dir, "*.csv"))):
             try:
-                timestamp = datetime.strptime(
-                    gps_data["Updated"].rsplit(".")[0], "%Y-%m-%dT%H:%M:%S"
-                ).strftime("%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                timestamp = datetime.strptime(
-                    gps_data["Updated"].rsplit(".")[0], "%Y-%m-%d %H:%M:%S"
-                ).strftime("%Y-%m-%d %H:%M:%S")
-            writer.writerow(
-                [
-                    pcap_data[WifiInfo.BSSID],
-                    pcap_data[WifiInfo.ESSID],
-                    f"[{']['.join(pcap_data[WifiInfo.ENCRYPTION])}]",
-                    timestamp,
-                    pcap_data[WifiInfo.CHANNEL],
-                    pcap_data[WifiInfo.FREQUENCY],
-                    pcap_data[WifiInfo.RSSI],
-                    gps_data["Latitude"],
-                    gps_data["Longitude"],
-                    gps_data["Altitude"],
-                    gps_data["Accuracy"],
-                    "",  # RCOIs to populate
-                    "",  # MfgrId always empty
-                    "WIFI",
-                ]
-            )
-        content.seek(0)
-        return filename, content
+                with open(manifest_of(chunk), "r") as f:
+                    chunks.append((chunk, json.load(f)))
+            except (OSError, json.JSONDecodeError) as exp:
+                logging.error(f"[WIGLE] Dropping {chunk}, can't read its manifest: {exp}")
+                os.remove(chunk)
+        return chunks
+
+    def export(self, new_gps_files):
+        """
+        Writes a row for each capture with complete data to the spool directory, returns
+        (chunk file, captures in it) of the chunks written.
+        """
+        date = datetime.now().strftime("%Y%m%d_%H%M%S")
+        writer = ChunkWriter(self.spool_dir, f"{pwnagotchi.name()}_{date}", self.csv_header(), self.max_chunk_size)
+        pcap_filenames = {gps_file: self.get_pcap_filename(gps_file) for gps_file in new_gps_files}
+
+        rows, unknown = dict(), list()
+        for gps_file, pcap_filename in pcap_filenames.items():
+            if pcap_filename and (gps_data := self.get_gps_data(gps_file)):
+                rows[gps_file] = (gps_data, self.get_pcap_data(pcap_filename, probe=True))
+                if rows[gps_file][1] is None:
+                    unknown.append(pcap_filename)
+            else:
+                self.skip.append(gps_file)
+        # only the captures we know nothing about are parsed, all at once
+        parsed = self.analysis.analyze(unknown) if unknown else {}
 
-    def save_to_file(self, cvs_filename, cvs_content):
+        written = 0
+        try:
+            for gps_file, (gps_data, pcap_data) in rows.items():
+                pcap_filename = pcap_filenames[gps_file]
+                if pcap_data is None:
+                    pcap_data = self.get_pcap_data(pcap_filename, parsed.get(pcap_filename, {}))
+                if pcap_data is None:
+                    self.skip.append(gps_file)
+                    continue
+                writer.write(self.csv_row(gps_data, pcap_data), pcap_filename)
+                written += 1
+        finally:
+            chunks = writer.close()
+        logging.info(f"[WIGLE] Wifi to upload: {written} in {len(chunks)} files")
+        return chunks
+
+    def finish_chunk(self, chunk):
+        os.remove(manifest_of(chunk))
         if not self.cvs_dir:
+            os.remove(chunk)
             return
-        filename = os.path.join(self.cvs_dir, cvs_filename)
-        logging.info(f"[WIGLE] Saving to file {filename}")
+        logging.info(f"[WIGLE] Saving to file {os.path.join(self.cvs_dir, os.path.basename(chunk))}")
         try:
-            with open(filename, mode="w") as f:
-                f.write(cvs_content.getvalue())
-        except Exception as exp:
+            shutil.move(chunk, os.path.join(self.cvs_dir, os.path.basename(chunk)))
+        except OSError as exp:
             logging.error(f"[WIGLE] Error while writing CSV file(skipping): {exp}")
+            os.remove(chunk)
 
-    def post_wigle(self, reported, cvs_filename, cvs_content, no_err_entries):
+    def post_wigle(self, chunk, captures_in_chunk):
         try:
-            json_res = requests.post(
-                "https://api.wigle.net/api/v2/file/upload",
-                headers={
-                    "Authorization": f"Basic {self.api_key}",
-                    "Accept": "application/json",
-                },
-                data={"donate": "on" if self.donate else "false"},
-                files=dict(file=(cvs_filename, cvs_content, "text/csv")),
-                timeout=self.timeout,
-            ).json()
+            with open(chunk, "rb") as cvs_content:
+                json_res = requests.post(
+                    "https://api.wigle.net/api/v2/file/upload",
+                    headers={
+                        "Authorization": f"Basic {self.api_key}",
+                        "Accept": "application/json",
+                    },
+                    data={"donate": "on" if self.donate else "false"},
+                    files=dict(file=(os.path.basename(chunk), cvs_content, "text/csv")),
+                    timeout=self.timeout,
+                ).json()
             if not json_res["success"]:
                 raise requests.exceptions.RequestException(json_res["message"])
-            reported += no_err_entries
-            self.report.update(data={"reported": reported})
-            logging.info(f"[WIGLE] Successfully uploaded {len(no_err_entries)} wifis")
-        except (requests.exceptions.RequestException, OSError) as exp:
-            self.skip += no_err_entries
-            logging.debug(f"[WIGLE] Exception while uploading: {exp}")
-
-    def upload_new_handshakes(self, reported, new_gps_files, agent):
+            self.captures.set_upload("wigle", captures_in_chunk)
+            logging.info(f"[WIGLE] Successfully uploaded {len(captures_in_chunk)} wifis")
+            return True
+        except (requests.exceptions.RequestException, OSError, ValueError) as exp:
+            logging.debug(f"[WIGLE] Exception while uploading {chunk}: {exp}")
+            return False
+
+    def upload_chunks(self, agent, chunks):
+        """
+        Uploads the spooled chunks, a chunk that fails stays for the next time.
+        """
         logging.info("[WIGLE] Uploading new handshakes to wigle.net")
-        csv_entries, no_err_entries = list(), list()
-        for gps_file in new_gps_files:
-            logging.info(f"[WIGLE] Processing {os.path.basename(gps_file)}")
-            if (
-                (pcap_filename := self.get_pcap_filename(gps_file))
-                and (gps_data := self.get_gps_data(gps_file))
-                and (pcap_data := self.get_pcap_data(pcap_filename))
-            ):
-                csv_entries.append((gps_data, pcap_data))
-                no_err_entries.append(gps_file)
-            else:
-                self.skip.append(gps_file)
-        logging.info(f"[WIGLE] Wifi to upload: {len(csv_entries)}")
-        if csv_entries:
-            cvs_filename, cvs_content = self.generate_csv(csv_entries)
-            self.save_to_file(cvs_filename, cvs_content)
-            display = agent.view()
-            display.on_uploading("wigle.net")
-            self.post_wigle(reported, cvs_filename, cvs_content, no_err_entries)
-            display.on_normal()
+        display = agent.view()
+        for idx, (chunk, captures_in_chunk) in enumerate(chunks):
+            display.on_uploading(f"wigle.net ({idx + 1}/{len(chunks)})")
+            if self.post_wigle(chunk, captures_in_chunk):
+                self.finish_chunk(chunk)
+        display.on_normal()
 
     def request_statistics(self, url):
         try:
@@ -329,9 +441,12 @@ class Wigle(plugins.Plugin):
         if not self.ready:
             return
         with self.lock:
-            reported = self.report.data_field_or("reported", default=list())
-            if new_gps_files := self.get_new_gps_files(reported):
-                self.upload_new_handshakes(reported, new_gps_files, agent)
+            # the spool directory is read once per pass
+            chunks = self.get_spooled_chunks()
+            if new_gps_files := self.get_new_gps_files(chunks):
+                chunks += self.export(new_gps_files)
+            if chunks:
+                self.upload_chunks(agent, chunks)
             else:
                 self.get_statistics()
 
@@ -1,14 +1,29 @@
 import os
+import time
 import logging
 import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from threading import Lock
-from pwnagotchi.utils import StatusFile, remove_whitelisted
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pwnagotchi.utils import remove_whitelisted
 from pwnagotchi import plugins
+from pwnagotchi import catalog
+from pwnagotchi import captures
 from pwnagotchi.ui.components import LabeledValue
 from pwnagotchi.ui.view import BLACK
 import pwnagotchi.ui.fonts as fonts
-from json.decoder import JSONDecodeError
+
+# concurrent uploads while draining the queue
+default_workers = 4
+# retries of a single request on connection errors and server errors
+default_retries = 3
+default_backoff = 1.0
+# a capture that failed to upload waits this long before the next attempt, doubling up to max_retry_delay
+retry_delay = 60
+max_retry_delay = 3600
 
 
 class WpaSec(plugins.Plugin):
@@ -21,24 +36,41 @@ class WpaSec(plugins.Plugin):
     def __init__(self):
         self.ready = False
         self.lock = Lock()
-        try:
-            self.report = StatusFile('/home/pi/.wpa_sec_uploads', data_format='json')
-        except JSONDecodeError:
-            os.remove("/home/pi/.wpa_sec_uploads")
-            self.report = StatusFile('/home/pi/.wpa_sec_uploads', data_format='json')
+        self.draining = Lock()
         self.options = dict()
-        self.skip = list()
+        self.session = None
+        # captures waiting for the next connectivity window, in capture order. the
+        # captures database is the durable copy, this is filled from it on the first drain.
+        self.queue = OrderedDict()
+        self.queue_loaded = False
+        # path -> (failed attempts, monotonic time of the next attempt)
+        self.backoff = dict()
+
+    def _new_http_session(self):
+        # wpa-sec answers ' already submitted' to a duplicate, so retrying a POST is harmless
+        retries = self.options.get('retries', default_retries)
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=self.options.get('backoff', default_backoff),
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+        workers = self.options.get('workers', default_workers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     def _upload_to_wpasec(self, path, timeout=30):
         """
-        Uploads the file to https://wpa-sec.stanev.org, or another endpoint.
+        Uploads the file to https://wpa-sec.stanev.org, or another endpoint. Returns the
+        upload state to record, or None if it should be tried again later.
         """
         with open(path, 'rb') as file_to_upload:
             cookie = {"key": self.options['api_key']}
             payload = {"file": file_to_upload}
             headers = {"HTTP_USER_AGENT": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:15.0) Gecko/20100101 Firefox/15.0.1"}
             try:
-                result = requests.post(self.options['api_url'],
+                result = self.session.post(self.options['api_url'],
                                        cookies=cookie,
                                        files=payload,
                                        headers=headers,
@@ -46,11 +78,10 @@ class WpaSec(plugins.Plugin):
                 if result.status_code == 200:
                     if ' already submitted' in result.text:
                         logging.info("%s was already submitted.", path)
-                        return False
-                    return True
+                    return captures.DONE
                 elif result.status_code != 200:
                     logging.error("WPA_SEC: Error code: %s", result.text)
-                    return False
+                    return None
             except requests.exceptions.RequestException as req_e:
                 raise req_e
 
@@ -67,7 +98,7 @@ class WpaSec(plugins.Plugin):
 
         cookie = {'key': self.options['api_key']}
         try:
-            result = requests.get(api_url, cookies=cookie, timeout=timeout)
+            result = self.session.get(api_url, cookies=cookie, timeout=timeout)
             with open(output, 'wb') as output_file:
                 output_file.write(result.content)
         except requests.exceptions.RequestException as req_e:
@@ -87,9 +118,67 @@ class WpaSec(plugins.Plugin):
             logging.error("WPA_SEC: API-URL isn't set. Can't upload, no endpoint configured.")
             return
 
+        self.session = self._new_http_session()
         self.ready = True
         logging.info("WPA_SEC: plugin loaded")
 
+    def on_handshake(self, agent, filename, access_point, client_station):
+        # the agent already recorded the capture in the database, which is what survives a restart
+        with self.lock:
+            self.queue[catalog.normpath(filename)] = None
+
+    def _load_queue(self, config, db):
+        db.import_reported('wpa-sec', '/home/pi/.wpa_sec_uploads')
+        db.sync(catalog.get(config['bettercap']['handshakes']).files())
+        with self.lock:
+            for path in db.pending('wpa-sec'):
+                self.queue[path] = None
+            self.queue_loaded = True
+
+    def _take_ready(self, config):
+        """
+        Removes from the queue and returns the captures that are due for an upload.
+        """
+        now = time.monotonic()
+        with self.lock:
+            paths = [path for path in self.queue if self.backoff.get(path, (0, 0))[1] <= now]
+            for path in paths:
+                del self.queue[path]
+        return remove_whitelisted(paths, config['main']['whitelist'])
+
+    def _failed(self, db, path):
+        attempts = self.backoff.get(path, (0, 0))[0] + 1
+        delay = min(retry_delay * 2 ** (attempts - 1), max_retry_delay)
+        self.backoff[path] = (attempts, time.monotonic() + delay)
+        with self.lock:
+            self.queue[path] = None
+        db.set_upload('wpa-sec', path, captures.FAILED)
+        logging.debug("WPA_SEC: will try %s again in %ds", path, delay)
+
+    def _upload_queue(self, display, db, paths):
+        done = 0
+        workers = max(1, min(self.options.get('workers', default_workers), len(paths)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wpa-sec") as pool:
+            futures = {pool.submit(self._upload_to_wpasec, path): path for path in paths}
+            for idx, future in enumerate(as_completed(futures)):
+                path = futures[future]
+                display.on_uploading(f"wpa-sec.stanev.org ({idx + 1}/{len(paths)})")
+                try:
+                    status = future.result()
+                except (requests.exceptions.RequestException, OSError) as e:
+                    logging.debug("WPA_SEC: %s", e)
+                    status = None
+
+                if status is None:
+                    self._failed(db, path)
+                    continue
+                # one row per upload, nothing else is rewritten
+                db.set_upload('wpa-sec', path, status)
+                self.backoff.pop(path, None)
+                done += 1
+                logging.debug("WPA_SEC: Successfully uploaded %s", path)
+        return done
+
     def on_webhook(self, path, request):
         from flask import make_response, redirect
         response = make_response(redirect(self.options['api_url'], code=302))
@@ -100,39 +189,25 @@ class WpaSec(plugins.Plugin):
         """
         Called when there's internet connectivity
         """
-        if not self.ready or self.lock.locked():
+        if not self.ready or self.draining.locked():
             return
 
-        with self.lock:
+        with self.draining:
             config = agent.config()
             display = agent.view()
-            reported = self.report.data_field_or('reported', default=list())
             handshake_dir = config['bettercap']['handshakes']
-            try:
-                handshake_filenames = os.listdir(handshake_dir)
-            except FileNotFoundError:
-                logging.info("WPA_SEC: Handshake directory doesn't exist.")
-                return
-            handshake_paths = [os.path.join(handshake_dir, filename) for filename in handshake_filenames if filename.endswith('.pcap')]
-            handshake_paths = remove_whitelisted(handshake_paths, config['main']['whitelist'])
-            handshake_new = set(handshake_paths) - set(reported) - set(self.skip)
+            db = captures.get(config)
+            if not self.queue_loaded:
+                self._load_queue(config, db)
 
+            handshake_new = self._take_ready(config)
             if handshake_new:
-                logging.info("WPA_SEC: Internet connectivity detected. Uploading new handshakes to wpa-sec.stanev.org")
-                for idx, handshake in enumerate(handshake_new):
-                    display.on_uploading(f"wpa-sec.stanev.org ({idx + 1}/{len(handshake_new)})")
-                    try:
-                        if self._upload_to_wpasec(handshake):
-                            reported.append(handshake)
-                            self.report.update(data={'reported': reported})
-                            logging.debug("WPA_SEC: Successfully uploaded %s", handshake)
-                    except requests.exceptions.RequestException as req_e:
-                        self.skip.append(handshake)
-                        logging.debug("WPA_SEC: %s", req_e)
-                        continue
-                    except OSError as os_e:
-                        logging.debug("WPA_SEC: %s", os_e)
-                        continue
+                logging.info("WPA_SEC: Internet connectivity detected. Uploading %d new handshakes to wpa-sec.stanev.org",
+                             len(handshake_new))
+                started = time.monotonic()
+                done = self._upload_queue(display, db, handshake_new)
+                logging.info("WPA_SEC: uploaded %d/%d handshakes in %.1fs", done, len(handshake_new),
+                             time.monotonic() - started)
                 display.on_normal()
 
             if 'download_results' in self.options and self.options['download_results']:
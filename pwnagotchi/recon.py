@@ -0,0 +1,101 @@
+import threading
+import time
+
+# bettercap events that keep the table current
+TRACKED_EVENTS = ('wifi.ap.new', 'wifi.ap.lost', 'wifi.client.new', 'wifi.client.lost')
+
+# a full /api/session/wifi fetch is done at most this often to fix any drift
+reconcile_interval = 60
+
+
+class AccessPointTable(object):
+    """
+    In-memory access points / client stations table, kept current from the bettercap
+    websocket events and reconciled from time to time against the full session.
+    """
+
+    def __init__(self, reconcile_every=reconcile_interval):
+        self._lock = threading.Lock()
+        # ap mac -> (ap without clients, {sta mac -> sta})
+        self._aps = {}
+        self._reconcile_every = reconcile_every
+        self._synced_at = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._aps)
+
+    def needs_sync(self):
+        with self._lock:
+            return self._synced_at is None or (time.monotonic() - self._synced_at) >= self._reconcile_every
+
+    def invalidate(self):
+        with self._lock:
+            self._synced_at = None
+
+    def sync(self, aps):
+        """
+        Replaces the whole table with the access points list of a bettercap session.
+        """
+        table = {}
+        for ap in aps:
+            mac, entry = self._entry(ap)
+            table[mac] = entry
+        with self._lock:
+            self._aps = table
+            self._synced_at = time.monotonic()
+
+    def on_event(self, event):
+        """
+        Applies a bettercap websocket event, returns True if the table changed.
+        """
+        tag = event['tag']
+        if tag not in TRACKED_EVENTS:
+            return False
+
+        data = event['data']
+        with self._lock:
+            if tag == 'wifi.ap.new':
+                mac, (ap, stations) = self._entry(data)
+                if mac in self._aps:
+                    # keep what we already know about its clients
+                    stations = {**stations, **self._aps[mac][1]}
+                self._aps[mac] = (ap, stations)
+
+            elif tag == 'wifi.ap.lost':
+                self._aps.pop(data['mac'].lower(), None)
+
+            elif tag == 'wifi.client.new':
+                ap_mac = data['AP']['mac'].lower()
+                if ap_mac not in self._aps:
+                    self._aps[ap_mac] = self._entry(data['AP'])[1]
+                self._aps[ap_mac][1][data['Client']['mac'].lower()] = data['Client']
+
+            elif tag == 'wifi.client.lost':
+                ap_mac = data['AP']['mac'].lower()
+                if ap_mac in self._aps:
+                    self._aps[ap_mac][1].pop(data['Client']['mac'].lower(), None)
+
+        return True
+
+    def access_points(self):
+        """
+        Returns the access points in the same format as session['wifi']['aps'].
+        """
+        with self._lock:
+            return [{**ap, 'clients': list(stations.values())} for ap, stations in self._aps.values()]
+
+    def find(self, station_mac, ap_mac):
+        with self._lock:
+            entry = self._aps.get(ap_mac.lower())
+            if entry is None:
+                return None
+            ap, stations = entry
+            sta = stations.get(station_mac.lower(), {'mac': station_mac, 'vendor': ''})
+            return {**ap, 'clients': list(stations.values())}, sta
+
+    @staticmethod
+    def _entry(ap):
+        stations = {sta['mac'].lower(): sta for sta in ap.get('clients') or []}
+        ap = {k: v for k, v in ap.items() if k != 'clients'}
+        return ap['mac'].lower(), (ap, stations)
@@ -2,6 +2,10 @@ from PIL import Image, ImageOps
 from textwrap import TextWrapper
 
 
+def _snapshot(xy):
+    return tuple(tuple(p) if isinstance(p, list) else p for p in xy)
+
+
 class Widget(object):
     def __init__(self, xy, color=0):
         self.xy = xy
@@ -10,6 +14,13 @@ class Widget(object):
     def draw(self, canvas, drawer):
         raise Exception("not implemented")
 
+    def cache_key(self):
+        """
+        Everything the widget looks like depends on, it is only drawn again when this
+        changes. None means it can't tell, and the whole view is drawn every frame.
+        """
+        return None
+
 # canvas.paste: https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.paste
 # takes mask variable, to identify color system. (not used for pwnagotchi yet)
 # Pwn should use "1" since its mainly black or white displays.
@@ -19,9 +30,11 @@ class Bitmap(Widget):
         self.image = Image.open(path)
 
     def draw(self, canvas, drawer):
-        if self.color == 0xFF:
-            self.image = ImageOps.invert(self.image)
-        canvas.paste(self.image, self.xy)
+        image = ImageOps.invert(self.image) if self.color == 0xFF else self.image
+        canvas.paste(image, self.xy)
+
+    def cache_key(self):
+        return self.image, _snapshot(self.xy), self.color
 
 
 class Line(Widget):
@@ -32,16 +45,25 @@ class Line(Widget):
     def draw(self, canvas, drawer):
         drawer.line(self.xy, fill=self.color, width=self.width)
 
+    def cache_key(self):
+        return _snapshot(self.xy), self.color, self.width
+
 
 class Rect(Widget):
     def draw(self, canvas, drawer):
         drawer.rectangle(self.xy, outline=self.color)
 
+    def cache_key(self):
+        return _snapshot(self.xy), self.color
+
 
 class FilledRect(Widget):
     def draw(self, canvas, drawer):
         drawer.rectangle(self.xy, fill=self.color)
 
+    def cache_key(self):
+        return _snapshot(self.xy), self.color
+
 
 class Text(Widget):
     def __init__(self, value="", position=(0, 0), font=None, color=0, wrap=False, max_length=0, png=False):
@@ -76,6 +98,9 @@ class Text(Widget):
                 self.image = self._image.convert('1')
                 canvas.paste(self.image, self.xy)
 
+    def cache_key(self):
+        return self.value, _snapshot(self.xy), self.font, self.color, self.wrap, self.max_length, self.png
+
 
 class LabeledValue(Widget):
     def __init__(self, label, value="", position=(0, 0), label_font=None, text_font=None, color=0, label_spacing=5):
@@ -93,3 +118,7 @@ class LabeledValue(Widget):
             pos = self.xy
             drawer.text(pos, self.label, font=self.label_font, fill=self.color)
             drawer.text((pos[0] + self.label_spacing + 5 * len(self.label), pos[1]), self.value, font=self.text_font, fill=self.color)
+
+    def cache_key(self):
+        return (self.label, self.value, _snapshot(self.xy), self.label_font, self.text_font, self.color,
+                self.label_spacing)
@@ -0,0 +1,137 @@
+from PIL import Image, ImageChops, ImageDraw
+
+
+def intersection(a, b):
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+def union(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def merge(boxes):
+    """
+    Merges the overlapping boxes, so that no pixel is painted twice.
+    """
+    merged = []
+    for box in boxes:
+        overlapping = True
+        while overlapping:
+            overlapping = False
+            for i, other in enumerate(merged):
+                if intersection(box, other):
+                    box = union(box, other)
+                    del merged[i]
+                    overlapping = True
+                    break
+        merged.append(box)
+    return merged
+
+
+class Layer(object):
+    """
+    A widget as it was last drawn, cropped to what it painted.
+    """
+    __slots__ = ('widget', 'key', 'box', 'image', 'mask')
+
+    def __init__(self, widget, key, box, image, mask):
+        self.widget = widget
+        self.key = key
+        self.box = box
+        self.image = image
+        self.mask = mask
+
+
+class Compositor(object):
+    """
+    Keeps a bitmap of every widget and the canvas they were pasted on. A widget is drawn
+    again only when its cache_key() changes, and only the areas it covered before and
+    covers now are painted again, with whatever else is in there.
+    """
+
+    def __init__(self, width, height, background):
+        self.size = (width, height)
+        self.background = background
+        self.damage = []
+        self._full = (0, 0, width, height)
+        self._canvas = Image.new('1', self.size, background)
+        # the widget is drawn over both, what it painted is the same on the two
+        self._scratch = Image.new('1', self.size, background)
+        self._inverse = Image.new('1', self.size, 0xFF - background)
+        self._ones = Image.new('1', self.size, 0xFF)
+        self._layers = {}
+        self._order = []
+
+    def _rasterize(self, widget, key):
+        for scratch, background in ((self._scratch, self.background), (self._inverse, 0xFF - self.background)):
+            scratch.paste(background, self._full)
+            widget.draw(scratch, ImageDraw.Draw(scratch))
+
+        painted = ImageChops.logical_xor(ImageChops.logical_xor(self._scratch, self._inverse), self._ones)
+        box = painted.getbbox()
+        if not box:
+            return Layer(widget, key, None, None, None)
+        return Layer(widget, key, box, self._scratch.crop(box), painted.crop(box))
+
+    def _paste(self, layer, box):
+        x0, y0 = layer.box[0], layer.box[1]
+        area = (box[0] - x0, box[1] - y0, box[2] - x0, box[3] - y0)
+        self._canvas.paste(layer.image.crop(area), box[:2], layer.mask.crop(area))
+
+    def render(self, widgets, force=False):
+        """
+        Brings the canvas up to date with the widgets, (name, widget) pairs in drawing order,
+        and returns a copy of it. The areas that were painted again are left in self.damage.
+        """
+        widgets = list(widgets)
+        order = [name for name, _ in widgets]
+        full = force or order != self._order
+        damage = []
+        layers = {}
+
+        for name, widget in widgets:
+            key = widget.cache_key()
+            if key is None:
+                # drawn straight on the canvas, along with everything else
+                full = True
+                continue
+
+            layer = self._layers.get(name)
+            if layer is not None and layer.widget is widget and layer.key == key:
+                layers[name] = layer
+                continue
+
+            layers[name] = self._rasterize(widget, key)
+            for box in (layer.box if layer else None, layers[name].box):
+                if box:
+                    damage.append(box)
+
+        for name, layer in self._layers.items():
+            if name not in layers and layer.box:
+                damage.append(layer.box)
+
+        self._layers = layers
+        self._order = order
+
+        if full:
+            self._canvas.paste(self.background, self._full)
+            drawer = ImageDraw.Draw(self._canvas)
+            for name, widget in widgets:
+                layer = layers.get(name)
+                if layer is None:
+                    widget.draw(self._canvas, drawer)
+                elif layer.box:
+                    self._paste(layer, layer.box)
+            self.damage = [self._full]
+        else:
+            self.damage = merge(damage)
+            for box in self.damage:
+                self._canvas.paste(self.background, box)
+                for name in order:
+                    layer = layers[name]
+                    area = intersection(box, layer.box) if layer.box else None
+                    if area:
+                        self._paste(layer, area)
+
+        return self._canvas.copy()
@@ -2,10 +2,16 @@ import os
 import logging
 import threading
 
+import pwnagotchi.clock as clock
 import pwnagotchi.plugins as plugins
 import pwnagotchi.ui.hw as hw
+from pwnagotchi.ui.compositor import merge
+from pwnagotchi.ui.governor import RenderGovernor
 from pwnagotchi.ui.view import View
 
+# seconds between the render stats in the logs
+report_interval = 60
+
 
 class Display(View):
     def __init__(self, config, state={}):
@@ -14,11 +20,20 @@ class Display(View):
 
         self._enabled = config['enabled']
         self._rotation = config['rotation']
+        # seconds between full refreshes of the panels that refresh a window at a time
+        self._full_refresh_interval = config.get('full_refresh_interval', 300)
+        self._full_refresh_at = clock.monotonic()
+        self._governor = RenderGovernor(config.get('min_refresh_interval',
+                                                   self._implementation.min_refresh_interval))
+        self._reported_at = clock.monotonic()
 
         self.init_display()
 
         self._canvas_next_event = threading.Event()
         self._canvas_next = None
+        # what changed since the renderer took the last frame, None for everything
+        self._damage_next = None
+        self._canvas_next_lock = threading.Lock()
         self._render_thread_instance = threading.Thread(
             target=self._render_thread,
             daemon=True,
@@ -315,6 +330,16 @@ class Display(View):
 
     def clear(self):
         self._implementation.clear()
+        self._governor.forget()
+        with self._canvas_next_lock:
+            # the panel is blank, the next frame has to be drawn whole
+            self._damage_next = None
+
+    def render_stats(self):
+        """
+        Achieved frame rate and what happened to the frames handed to the panel.
+        """
+        return self._governor.stats()
 
     def image(self):
         img = None
@@ -322,13 +347,62 @@ class Display(View):
             img = self._canvas if self._rotation == 0 else self._canvas.rotate(-self._rotation)
         return img
 
+    def _rotated_damage(self):
+        """
+        The areas that changed with the last frame on the rotated canvas, None for all of it.
+        """
+        damage = self.damage()
+        if not damage or damage == [(0, 0, self._width, self._height)]:
+            return None
+        if self._rotation == 0:
+            return damage
+        if self._rotation == 180:
+            return [(self._width - x1, self._height - y1, self._width - x0, self._height - y0)
+                    for x0, y0, x1, y1 in damage]
+        return None
+
     def _render_thread(self):
         """Used for non-blocking screen updating."""
 
         while True:
             self._canvas_next_event.wait()
+            # frames coming in meanwhile replace this one
+            self._governor.wait()
             self._canvas_next_event.clear()
-            self._implementation.render(self._canvas_next)
+            with self._canvas_next_lock:
+                canvas, damage = self._canvas_next, self._damage_next
+                self._damage_next = []
+            if not self._governor.changed(canvas):
+                continue
+
+            started = clock.monotonic()
+            try:
+                self._render(canvas, damage)
+            except Exception as e:
+                logging.error("error while rendering on the display: %s", e)
+                # no telling what the panel shows now
+                self._governor.forget()
+                with self._canvas_next_lock:
+                    self._damage_next = None
+            self._governor.done(started)
+
+            if started - self._reported_at >= report_interval:
+                self._reported_at = started
+                logging.debug("[display] %(fps).2f fps, %(dropped)d frames dropped, %(skipped)d identical, "
+                              "%(render_time).3fs per refresh", self._governor.stats())
+
+    def _render(self, canvas, damage):
+        impl = self._implementation
+        if not impl.supports_partial_window:
+            impl.render(canvas)
+        elif self._full_refresh_interval and \
+                clock.monotonic() - self._full_refresh_at >= self._full_refresh_interval:
+            impl.full_refresh(canvas)
+            self._full_refresh_at = clock.monotonic()
+        elif damage is None:
+            impl.render(canvas)
+        elif damage:
+            impl.render_window(canvas, merge(damage))
 
     def _on_view_rendered(self, img):
         try:
@@ -340,5 +414,12 @@ class Display(View):
         if self._enabled:
             self._canvas = (img if self._rotation == 0 else img.rotate(self._rotation))
             if self._implementation is not None:
-                self._canvas_next = self._canvas
+                damage = self._rotated_damage()
+                with self._canvas_next_lock:
+                    self._governor.submit(self._canvas_next_event.is_set())
+                    self._canvas_next = self._canvas
+                    if damage is None or self._damage_next is None:
+                        self._damage_next = None
+                    else:
+                        self._damage_next += damage
                 self._canvas_next_event.set()
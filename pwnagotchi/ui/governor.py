@@ -0,0 +1,77 @@
+import time
+import hashlib
+from collections import deque
+
+import pwnagotchi.clock as clock
+
+# refreshes the achieved frame rate is measured over
+fps_window = 20
+
+
+class RenderGovernor(object):
+    """
+    Decides which frames reach the panel. Frames queue up as the latest one only, the
+    panel is refreshed no sooner than min_interval seconds after the previous refresh,
+    and never with a frame identical to the one it shows.
+    """
+
+    def __init__(self, min_interval=0.0):
+        self.min_interval = min_interval
+        self.submitted = 0
+        self.rendered = 0
+        # replaced by a newer frame before the panel took them
+        self.dropped = 0
+        # identical to what the panel showed already
+        self.skipped = 0
+        self.render_time = 0.0
+        self._hash = None
+        self._rendered_at = deque(maxlen=fps_window)
+
+    def submit(self, pending):
+        self.submitted += 1
+        if pending:
+            self.dropped += 1
+
+    def wait(self):
+        if self._rendered_at:
+            delay = self._rendered_at[-1] + self.min_interval - clock.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def changed(self, canvas):
+        digest = hashlib.blake2b(canvas.tobytes(), digest_size=16).digest()
+        if digest == self._hash:
+            self.skipped += 1
+            return False
+        self._hash = digest
+        return True
+
+    def forget(self):
+        """
+        The panel was cleared or lost what it showed, the next frame goes through.
+        """
+        self._hash = None
+
+    def done(self, started):
+        now = clock.monotonic()
+        self.rendered += 1
+        # moving average, a single slow refresh doesn't tell much
+        self.render_time = (now - started) if self.rendered == 1 else (0.8 * self.render_time + 0.2 * (now - started))
+        self._rendered_at.append(now)
+
+    def fps(self):
+        if len(self._rendered_at) < 2:
+            return 0.0
+        span = clock.monotonic() - self._rendered_at[0]
+        return (len(self._rendered_at) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        return {
+            'fps': round(self.fps(), 2),
+            'min_interval': self.min_interval,
+            'render_time': round(self.render_time, 3),
+            'submitted': self.submitted,
+            'rendered': self.rendered,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+        }
@@ -5,6 +5,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class Adafruit2in13V3(DisplayImpl):
+    # e-paper, partial refreshes
+    min_refresh_interval = 1.0
     def __init__(self, config):
         super(Adafruit2in13V3, self).__init__(config, 'adafruit2in13_v3')
 
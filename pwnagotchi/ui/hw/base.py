@@ -2,6 +2,13 @@ import pwnagotchi.ui.fonts as fonts
 
 
 class DisplayImpl(object):
+    # drivers that can send only some areas of the frame to the panel set this and
+    # implement render_window()
+    supports_partial_window = False
+    # seconds the panel needs between two refreshes, frames coming sooner wait for the
+    # next one and only the latest is drawn
+    min_refresh_interval = 0.0
+
     def __init__(self, config, name):
         self._display = None
         if fonts.Medium is None:
@@ -39,5 +46,17 @@ class DisplayImpl(object):
     def render(self, canvas):
         raise NotImplementedError
 
+    def render_window(self, canvas, boxes):
+        """
+        Sends only the (x0, y0, x1, y1) areas of the canvas that changed to the panel.
+        """
+        raise NotImplementedError
+
+    def full_refresh(self, canvas):
+        """
+        Redraws the whole panel, clearing what partial refreshes left behind.
+        """
+        self.render(canvas)
+
     def clear(self):
         raise NotImplementedError
@@ -5,6 +5,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class DFRobotV1(DisplayImpl):
+    # e-paper, full refreshes only
+    min_refresh_interval = 5.0
     def __init__(self, config):
         super(DFRobotV1, self).__init__(config, 'dfrobot_1')
 
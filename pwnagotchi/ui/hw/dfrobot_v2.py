@@ -5,6 +5,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class DFRobotV2(DisplayImpl):
+    # e-paper, full refreshes only
+    min_refresh_interval = 5.0
     def __init__(self, config):
         super(DFRobotV2, self).__init__(config, 'dfrobot_2')
 
@@ -5,8 +5,13 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class Inky(DisplayImpl):
+    # e-paper, full refreshes only
+    min_refresh_interval = 5.0
     def __init__(self, config):
         super(Inky, self).__init__(config, 'inky')
+        if self.config['color'] == 'fastAndFurious':
+            # the fast driver refreshes with shorter waveforms
+            self.min_refresh_interval = 1.0
 
     def layout(self):
         fonts.setup(10, 8, 10, 28, 25, 9)
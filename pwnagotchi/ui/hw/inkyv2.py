@@ -5,6 +5,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class InkyV2(DisplayImpl):
+    # e-paper, full refreshes only
+    min_refresh_interval = 5.0
     def __init__(self, config):
         super(InkyV2, self).__init__(config, 'inkyv2')
 
@@ -24,12 +24,12 @@
 
 import numbers
 import time
-import numpy as np
 
 from PIL import Image
 from PIL import ImageDraw
 
 import spidev
+import pwnagotchi.ui.hw.libs.rgb565 as rgb565
 import RPi.GPIO as GPIO
 
 __version__ = '0.0.1'
@@ -168,6 +168,10 @@ class ILI9341(object):
         # Convert scalar argument to list so either can be passed as parameter.
         if isinstance(data, numbers.Number):
             data = [data & 0xFF]
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            # no list to build, spidev splits it in transfers of its buffer size
+            self._spi.writebytes2(data)
+            return
         # Write data a chunk at a time.
         for start in range(0, len(data), chunk_size):
             end = min(start+chunk_size, len(data))
@@ -340,23 +344,7 @@ class ILI9341(object):
         pixelbytes = self.image_to_data(image, self._rotation)
 
         # Write data to hardware.
-        for i in range(0, len(pixelbytes), 4096):
-            self.data(pixelbytes[i:i + 4096])
+        self.data(pixelbytes)
 
     def image_to_data(self, image, rotation=0):
-        if not isinstance(image, np.ndarray):
-            image = np.array(image.convert('RGB'))
-
-        # Rotate the image
-        pb = np.rot90(image, rotation // 90).astype('uint16')
-
-        # Mask and shift the 888 RGB into 565 RGB
-        red   = (pb[..., [0]] & 0xf8) << 8
-        green = (pb[..., [1]] & 0xfc) << 3
-        blue  = (pb[..., [2]] & 0xf8) >> 3
-
-        # Stick 'em together
-        result = red | green | blue
-
-        # Output the raw bytes
-        return result.byteswap().tobytes()
\ No newline at end of file
+        return rgb565.pack(image, rotation)
\ No newline at end of file
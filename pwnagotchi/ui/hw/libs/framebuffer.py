@@ -0,0 +1,123 @@
+"""
+1-bit frame buffers shared by the e-paper drivers.
+
+The panel memory is rows of MSB first bytes, 1 for white, each row padded to a whole
+byte. For every size of image a driver is given, each bit of that memory is mapped once
+to the pixel it shows, so that packing a frame is a single lookup whatever the image
+orientation. The buffers are kept from one frame to the next.
+"""
+import logging
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=16)
+def fill(size, value):
+    """
+    A buffer of size bytes all set to value, to clear the panel with.
+    """
+    return bytes((value,)) * int(size)
+
+
+class FrameBuffer(object):
+    """
+    Packs images of width x height pixels, or of height x width ones which are turned by
+    90 degrees counterclockwise on the way, like image.rotate(90, expand=True) would.
+
+    mirrored is the layout of the 2.13 V2 and DFRobot drivers, which flip upright images
+    horizontally one pixel off and transpose the rotated ones. inverted is for panels
+    taking 1 for black.
+    """
+
+    def __init__(self, width, height, mirrored=False, inverted=False):
+        self.width = width
+        self.height = height
+        self.mirrored = mirrored
+        self.inverted = inverted
+        self.stride = (width + 7) // 8
+        self.size = self.stride * height
+        self._tables = {}
+        self._sources = {}
+        self._bits = np.empty(self.size * 8, dtype=bool)
+        # black and red planes, and numpy views of them
+        self._frames = (bytearray(self.size), bytearray(self.size))
+        self._planes = tuple(np.frombuffer(frame, dtype=np.uint8) for frame in self._frames)
+
+    def _table(self, size):
+        if size in self._tables:
+            return self._tables[size]
+
+        w, h = size
+        y, x = np.mgrid[0:h, 0:w]
+        if size == (self.width, self.height):
+            col, row = (self.width - x, y) if self.mirrored else (x, y)
+        elif size == (self.height, self.width):
+            col, row = (y, x) if self.mirrored else (y, self.height - 1 - x)
+        else:
+            logging.warning("wrong image dimensions %dx%d: must be %dx%d or %dx%d", w, h,
+                            self.width, self.height, self.height, self.width)
+            return None
+
+        bit = row * self.stride * 8 + col
+        inside = bit < self._bits.size
+        # the padding reads the white pixel past the end of the image
+        table = np.full(self._bits.size, w * h, dtype=np.intp)
+        table[bit[inside]] = (y * w + x)[inside]
+        self._tables[size] = table
+        return table
+
+    def _source(self, size, planes=1):
+        key = (size, planes)
+        if key not in self._sources:
+            source = np.empty((planes, size[0] * size[1] + 1), dtype=bool)
+            source[:, -1] = True
+            self._sources[key] = source
+        return self._sources[key]
+
+    def _emit(self, pixels, table, plane):
+        np.take(pixels, table, out=self._bits)
+        packed = np.packbits(self._bits)
+        if self.inverted:
+            np.invert(packed, out=packed)
+        np.copyto(self._planes[plane], packed)
+        return self._frames[plane]
+
+    def blank(self, plane=0):
+        self._planes[plane].fill(0x00 if self.inverted else 0xFF)
+        return self._frames[plane]
+
+    def pack(self, image):
+        """
+        Returns the bytes to send for the image, only good until the next call.
+        """
+        table = self._table(image.size)
+        if table is None:
+            return self.blank()
+
+        source = self._source(image.size)
+        pixels = np.asarray(image if image.mode == '1' else image.convert('1'))
+        np.copyto(source[0, :-1].reshape(pixels.shape), pixels)
+        return self._emit(source[0], table, 0)
+
+    def planes(self, image):
+        """
+        Returns the black and the red planes of the image, 0 where the pixel has
+        that colour. The pixels are sorted out in one pass over the image, dark ones are
+        black and the ones only bright in red are red. Images with no colour have no red.
+        """
+        if image.mode not in ('RGB', 'RGBA', 'P'):
+            return self.pack(image), self.blank(1)
+
+        table = self._table(image.size)
+        if table is None:
+            return self.blank(0), self.blank(1)
+
+        source = self._source(image.size, 2)
+        bright = np.asarray(image if image.mode == 'RGB' else image.convert('RGB')) > 127
+        white, red = (plane[:-1].reshape(bright.shape[:2]) for plane in source)
+        np.any(bright, axis=2, out=white)
+        # red is bright in red only, and not black either
+        np.greater(bright[..., 0], bright[..., 1] | bright[..., 2], out=red)
+        np.invert(red, out=red)
+        return self._emit(source[0], table, 0), self._emit(source[1], table, 1)
@@ -0,0 +1,60 @@
+"""
+RGB888 to RGB565 conversion shared by the LCD drivers.
+
+The pixels are packed in a buffer kept from one frame to the next, and handed out as a
+memoryview of big endian bytes that spidev's writebytes2() sends as it is.
+"""
+import sys
+
+import numpy as np
+
+
+class RGB565Packer(object):
+    def __init__(self):
+        self._shape = None
+        self._pixels = None
+        self._scratch = None
+
+    def _buffers(self, shape):
+        if shape != self._shape:
+            self._shape = shape
+            self._pixels = np.empty(shape, dtype=np.uint16)
+            self._scratch = np.empty(shape, dtype=np.uint16)
+        return self._pixels, self._scratch
+
+    def pack(self, image, rotation=0):
+        """
+        Returns the pixels of the image, a PIL image or an RGB array, rotated counterclockwise
+        by the given degrees. The memoryview is only good until the next call.
+        """
+        if not isinstance(image, np.ndarray):
+            image = np.asarray(image if image.mode == 'RGB' else image.convert('RGB'))
+        if rotation:
+            image = np.rot90(image, rotation // 90)
+
+        pixels, scratch = self._buffers(image.shape[:2])
+        # rrrrrggg gggbbbbb
+        np.copyto(pixels, image[..., 0])
+        pixels &= 0xF8
+        pixels <<= 8
+        np.copyto(scratch, image[..., 1])
+        scratch &= 0xFC
+        scratch <<= 3
+        pixels |= scratch
+        np.copyto(scratch, image[..., 2])
+        scratch >>= 3
+        pixels |= scratch
+        if sys.byteorder == 'little':
+            pixels.byteswap(inplace=True)
+
+        return memoryview(pixels).cast('B')
+
+
+_packer = RGB565Packer()
+
+
+def pack(image, rotation=0):
+    """
+    Packs with a buffer shared by the callers, only one display is driven at a time.
+    """
+    return _packer.pack(image, rotation)
@@ -81,6 +81,7 @@
 
 import logging
 from pwnagotchi.ui.hw.libs.waveshare.epaper import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 # Display resolution
 EPD_WIDTH = 200
@@ -97,6 +98,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self._framebuffer = framebuffer.FrameBuffer(self.width, self.height)
 
     lut_full_update = [
         0x02, 0x02, 0x01, 0x11, 0x12, 0x12, 0x22, 0x22,
@@ -204,26 +206,7 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if (imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif (imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return self._framebuffer.pack(image)
 
     def display(self, image):
         if (image == None):
@@ -30,6 +30,7 @@
 
 import logging
 from pwnagotchi.ui.hw.libs.waveshare.epaper import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 # Display resolution
 EPD_WIDTH = 122
@@ -46,6 +47,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self._framebuffer = framebuffer.FrameBuffer(self.width, self.height)
 
     '''
     function :Hardware reset
@@ -246,20 +248,7 @@ class EPD:
         image : Image data
     '''
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+        return self._framebuffer.pack(image)
 
     '''
     function : Sends the image buffer in RAM to e-Paper and displays
@@ -308,6 +297,41 @@ class EPD:
         self.send_data2(image)
         self.TurnOnDisplayPart()
 
+    '''
+    function : Sends only some windows of the image buffer to e-Paper and partial refresh
+    parameter:
+        image : Image data
+        windows : (x_start, y_start, x_end, y_end) areas to send, the ends excluded
+    '''
+    def displayPartialWindows(self, image, windows):
+        linewidth = (self.width + 7) // 8
+
+        self.send_command(0x3C) # BorderWavefrom
+        self.send_data(0x80)
+
+        self.send_command(0x11) # data entry mode
+        self.send_data(0x03)
+
+        for x_start, y_start, x_end, y_end in windows:
+            # the RAM is addressed by whole bytes along x
+            x_start = max(x_start, 0) // 8
+            x_end = min((x_end + 7) // 8, linewidth)
+            y_start = max(y_start, 0)
+            y_end = min(y_end, self.height)
+            if x_start >= x_end or y_start >= y_end:
+                continue
+
+            self.SetWindow(x_start * 8, y_start, x_end * 8 - 1, y_end - 1)
+            self.SetCursor(x_start, y_start)
+            self.send_command(0x24) # WRITE_RAM
+            self.send_data2(b''.join(image[y * linewidth + x_start:y * linewidth + x_end]
+                                     for y in range(y_start, y_end)))
+        self.TurnOnDisplayPart()
+
+        # the other writes expect the whole RAM
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+
     '''
     function : Refresh a base image
     parameter:
@@ -333,7 +357,7 @@ class EPD:
         # logger.debug(linewidth)
 
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))
+        self.send_data2(framebuffer.fill(int(self.height * linewidth), color))
         self.TurnOnDisplay()
 
     '''
@@ -29,6 +29,7 @@
 
 import logging
 from pwnagotchi.ui.hw.libs.waveshare.epaper import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 # Display resolution
 EPD_WIDTH = 122
@@ -45,6 +46,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self._framebuffer = framebuffer.FrameBuffer(self.width, self.height)
 
     # hardware reset
     def reset(self):
@@ -147,21 +149,11 @@ class EPD:
 
     # image converted to bytearray
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if (imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif (imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " +
-                           str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
+        return self._framebuffer.pack(image)
 
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+    # black and red planes of the image, split in one pass
+    def getbuffers(self, image):
+        return self._framebuffer.planes(image)
 
     # display image
     def display(self, imageblack, imagered):
@@ -180,7 +172,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0xff] * (int(linewidth * self.height))
+        buf = framebuffer.fill(linewidth * self.height, 0xff)
 
         self.send_command(0x24)
         self.send_data2(buf)
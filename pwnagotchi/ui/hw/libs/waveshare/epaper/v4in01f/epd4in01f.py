@@ -31,6 +31,7 @@
 
 import logging
 from pwnagotchi.ui.hw.libs.waveshare.epaper import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 # Display resolution
 EPD_WIDTH = 640
@@ -212,7 +213,7 @@ class EPD:
         self.send_data(0x01)
         self.send_data(0x90)
         self.send_command(0x10)
-        self.send_data2([0x11] * int(EPD_HEIGHT) * int(EPD_WIDTH / 2))
+        self.send_data2(framebuffer.fill(int(EPD_HEIGHT) * int(EPD_WIDTH / 2), 0x11))
         # BLACK   0x00    /// 0000
         # WHITE   0x11    /// 0001
         # GREEN   0x22    /// 0010
@@ -30,6 +30,7 @@
 
 import logging
 from pwnagotchi.ui.hw.libs.waveshare.epaper import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 # Display resolution
 EPD_WIDTH = 792
@@ -51,6 +52,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self._framebuffer = framebuffer.FrameBuffer(self.width, self.height)
         self.GRAY1 = GRAY1  # white
         self.GRAY2 = GRAY2
         self.GRAY3 = GRAY3  # gray
@@ -372,28 +374,7 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return self._framebuffer.pack(image)
 
     def getbuffer_4Gray(self, image):
         # logger.debug("bufsiz = ",int(self.width/8) * self.height)
@@ -443,13 +424,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1: i * Width1 + Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1: i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.TurnOnDisplay()
 
@@ -461,13 +442,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1: i * Width1 + Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1: i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.TurnOnDisplay()
 
@@ -484,22 +465,22 @@ class EPD:
         Width1 = int(self.width / 8)
 
         self.send_command(0x24)
-        self.send_data2([color] * 13600)
+        self.send_data2(framebuffer.fill(13600, color))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.send_command(0xA4)
-        self.send_data2([color] * 13600)
+        self.send_data2(framebuffer.fill(13600, color))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.TurnOnDisplay()
 
         self.send_command(0x26)
-        self.send_data2([color] * 13600)
+        self.send_data2(framebuffer.fill(13600, color))
 
         self.send_command(0xA6)
-        self.send_data2([color] * 13600)
+        self.send_data2(framebuffer.fill(13600, color))
 
     def display_Fast(self, imageblack):
         Width = int(self.width / 16) + 1
@@ -509,13 +490,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1: i * Width1 + Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1: i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.TurnOnDisplay_Fast()
 
@@ -655,14 +636,14 @@ class EPD:
 
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0xFF))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.send_command(0xA4)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0xFF))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(framebuffer.fill(13600, 0x00))
 
         self.TurnOnDisplay()
 
@@ -30,6 +30,7 @@
 
 import logging
 from pwnagotchi.ui.hw.libs.waveshare.epaper import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 from PIL import Image
 
@@ -234,7 +235,7 @@ class EPD:
 
     def Clear(self, color=0x11):
         self.send_command(0x10)
-        self.send_data2([color] * int(self.height) * int(self.width / 2))
+        self.send_data2(framebuffer.fill(int(self.height) * int(self.width / 2), color))
 
         self.TurnOnDisplay()
 
@@ -81,6 +81,11 @@ class RaspberryPi:
         if self.SPI != None:
             self.SPI.writebytes(data)
 
+    def spi_writebytes2(self, data):
+        # takes bytes or a memoryview as they are, any length
+        if self.SPI != None:
+            self.SPI.writebytes2(data)
+
     def bl_DutyCycle(self, duty):
         self.BL_PIN.value = duty / 100
 
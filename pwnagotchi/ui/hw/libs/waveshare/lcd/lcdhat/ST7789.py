@@ -1,7 +1,7 @@
 import spidev
 import RPi.GPIO as GPIO
 import time
-import numpy as np
+import pwnagotchi.ui.hw.libs.rgb565 as rgb565
 
 
 class ST7789(object):
@@ -147,15 +147,10 @@ class ST7789(object):
         if imwidth != self.width or imheight != self.height:
             raise ValueError('Image must be same dimensions as display \
                 ({0}x{1}).'.format(self.width, self.height))
-        img = np.asarray(Image)
-        pix = np.zeros((self.width, self.height, 2), dtype=np.uint8)
-        pix[..., [0]] = np.add(np.bitwise_and(img[..., [0]], 0xF8), np.right_shift(img[..., [1]], 5))
-        pix[..., [1]] = np.add(np.bitwise_and(np.left_shift(img[..., [1]], 3), 0xE0), np.right_shift(img[..., [2]], 3))
-        pix = pix.flatten().tolist()
+        pix = rgb565.pack(Image)
         self.SetWindows(0, 0, self.width, self.height)
         GPIO.output(self._dc, GPIO.HIGH)
-        for i in range(0, len(pix), 4096):
-            self._spi.writebytes(pix[i:i + 4096])
+        self._spi.writebytes2(pix)
 
     def clear(self):
         """Clear contents of image buffer"""
@@ -27,8 +27,8 @@
 
 
 import RPi.GPIO as GPIO
-import numpy as np
 from . import config
+import pwnagotchi.ui.hw.libs.rgb565 as rgb565
 
 LCD_1IN44 = 1
 LCD_1IN8 = 0
@@ -307,12 +307,7 @@ class LCD:
 		if imwidth != self.width or imheight != self.height:
 			raise ValueError('Image must be same dimensions as display \
 				({0}x{1}).' .format(self.width, self.height))
-		img = np.asarray(Image)
-		pix = np.zeros((self.width,self.height,2), dtype = np.uint8)
-		pix[...,[0]] = np.add(np.bitwise_and(img[...,[0]],0xF8),np.right_shift(img[...,[1]],5))
-		pix[...,[1]] = np.add(np.bitwise_and(np.left_shift(img[...,[1]],3),0xE0),np.right_shift(img[...,[2]],3))
-		pix = pix.flatten().tolist()
+		pix = rgb565.pack(Image)
 		self.LCD_SetWindows(0, 0, self.width , self.height)
 		GPIO.output(config.LCD_DC_PIN, GPIO.HIGH)
-		for i in range(0,len(pix),4096):
-			config.SPI_Write_Byte(pix[i:i + 4096])
+		config.SPI_Write_Bytes2(pix)
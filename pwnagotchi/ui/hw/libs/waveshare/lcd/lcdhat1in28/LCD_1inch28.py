@@ -1,5 +1,6 @@
 import time
 from pwnagotchi.ui.hw.libs.waveshare.lcd import lcdconfig
+import pwnagotchi.ui.hw.libs.rgb565 as rgb565
 
 
 class LCD_1inch28(lcdconfig.RaspberryPi):
@@ -283,16 +284,10 @@ class LCD_1inch28(lcdconfig.RaspberryPi):
         if imwidth != self.width or imheight != self.height:
             raise ValueError('Image must be same dimensions as display \
                 ({0}x{1}).'.format(self.width, self.height))
-        img = self.np.asarray(Image)
-        pix = self.np.zeros((self.width, self.height, 2), dtype=self.np.uint8)
-        pix[..., [0]] = self.np.add(self.np.bitwise_and(img[..., [0]], 0xF8), self.np.right_shift(img[..., [1]], 5))
-        pix[..., [1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[..., [1]], 3), 0xE0),
-                                    self.np.right_shift(img[..., [2]], 3))
-        pix = pix.flatten().tolist()
+        pix = rgb565.pack(Image)
         self.SetWindows(0, 0, self.width, self.height)
         self.digital_write(self.DC_PIN, True)
-        for i in range(0, len(pix), 4096):
-            self.spi_writebyte(pix[i:i + 4096])
+        self.spi_writebytes2(pix)
 
     def clear(self):
         """Clear contents of image buffer"""
@@ -1,5 +1,6 @@
 import time
 from pwnagotchi.ui.hw.libs.waveshare.lcd import lcdconfig
+import pwnagotchi.ui.hw.libs.rgb565 as rgb565
 
 
 class LCD_2inch(lcdconfig.RaspberryPi):
@@ -139,37 +140,22 @@ class LCD_2inch(lcdconfig.RaspberryPi):
         """Write display buffer to physical display"""
         imwidth, imheight = Image.size
         if imwidth == self.height and imheight == self.width:
-            img = self.np.asarray(Image)
-            pix = self.np.zeros((self.width, self.height, 2), dtype=self.np.uint8)
-            # RGB888 >> RGB565
-            pix[..., [0]] = self.np.add(self.np.bitwise_and(img[..., [0]], 0xF8), self.np.right_shift(img[..., [1]], 5))
-            pix[..., [1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[..., [1]], 3), 0xE0),
-                                        self.np.right_shift(img[..., [2]], 3))
-            pix = pix.flatten().tolist()
+            pix = rgb565.pack(Image)
 
             self.command(0x36)
             self.data(0x70)
             self.SetWindows(0, 0, self.height, self.width)
             self.digital_write(self.DC_PIN, True)
-            for i in range(0, len(pix), 4096):
-                self.spi_writebyte(pix[i:i + 4096])
+            self.spi_writebytes2(pix)
 
         else:
-            img = self.np.asarray(Image)
-            pix = self.np.zeros((imheight, imwidth, 2), dtype=self.np.uint8)
-
-            pix[..., [0]] = self.np.add(self.np.bitwise_and(img[..., [0]], 0xF8), self.np.right_shift(img[..., [1]], 5))
-            pix[..., [1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[..., [1]], 3), 0xE0),
-                                        self.np.right_shift(img[..., [2]], 3))
-
-            pix = pix.flatten().tolist()
+            pix = rgb565.pack(Image)
 
             self.command(0x36)
             self.data(0x00)
             self.SetWindows(0, 0, self.width, self.height)
             self.digital_write(self.DC_PIN, True)
-            for i in range(0, len(pix), 4096):
-                self.spi_writebyte(pix[i:i + 4096])
+            self.spi_writebytes2(pix)
 
     def clear(self):
         """Clear contents of image buffer"""
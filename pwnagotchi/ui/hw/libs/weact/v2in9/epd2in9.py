@@ -1,5 +1,6 @@
 import logging
 from .. import epdconfig
+import pwnagotchi.ui.hw.libs.framebuffer as framebuffer
 
 # Display resolution
 EPD_WIDTH = 296
@@ -16,6 +17,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self._framebuffer = framebuffer.FrameBuffer(self.width, self.height)
 
     lut_partial_update = [
         0x0, 0x40, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
@@ -254,20 +256,7 @@ class EPD:
     '''
 
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if (imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif (imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width / 8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+        return self._framebuffer.pack(image)
 
     '''
     function : Sends the image buffer in RAM to e-Paper and displays
@@ -356,7 +345,7 @@ class EPD:
         # logger.debug(linewidth)
 
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))
+        self.send_data2(framebuffer.fill(int(self.height * linewidth), color))
         self.TurnOnDisplay()
 
     '''
@@ -6,6 +6,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class Papirus(DisplayImpl):
+    # e-paper, partial refreshes
+    min_refresh_interval = 1.0
     def __init__(self, config):
         super(Papirus, self).__init__(config, 'papirus')
 
@@ -5,6 +5,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class Waveshare13in3k(DisplayImpl):
+    # e-paper, full refreshes only
+    min_refresh_interval = 5.0
     def __init__(self, config):
         super(Waveshare13in3k, self).__init__(config, 'waveshare13in3k')
 
@@ -5,6 +5,8 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 
 
 class WaveshareV2(DisplayImpl):
+    # e-paper, partial refreshes
+    min_refresh_interval = 1.0
     def __init__(self, config):
         super(WaveshareV2, self).__init__(config, 'waveshare_2')
 
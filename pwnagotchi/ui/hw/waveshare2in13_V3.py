@@ -6,6 +6,8 @@ from PIL import Image,ImageDraw,ImageFont
 
 
 class WaveshareV3(DisplayImpl):
+    # e-paper, partial refreshes
+    min_refresh_interval = 1.0
     def __init__(self, config):
         super(WaveshareV3, self).__init__(config, 'waveshare_3')
 
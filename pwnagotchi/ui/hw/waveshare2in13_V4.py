@@ -6,6 +6,10 @@ from pwnagotchi.ui.hw.base import DisplayImpl
 from PIL import Image,ImageDraw,ImageFont
 
 class WaveshareV4(DisplayImpl):
+    # e-paper, partial refreshes
+    min_refresh_interval = 1.0
+    supports_partial_window = True
+
     def __init__(self, config):
         super(WaveshareV4, self).__init__(config, 'waveshare_4')
 
@@ -50,5 +54,20 @@ class WaveshareV4(DisplayImpl):
         buf = self._display.getbuffer(canvas)
         self._display.displayPartial(buf)
 
+    def _window(self, canvas, box):
+        if canvas.size == (self._display.width, self._display.height):
+            return box
+        # getbuffer() rotates the canvas by 90 degrees
+        x0, y0, x1, y1 = box
+        return y0, canvas.width - x1, y1, canvas.width - x0
+
+    def render_window(self, canvas, boxes):
+        buf = self._display.getbuffer(canvas)
+        self._display.displayPartialWindows(buf, [self._window(canvas, box) for box in boxes])
+
+    def full_refresh(self, canvas):
+        buf = self._display.getbuffer(canvas)
+        self._display.displayPartBaseImage(buf)
+
     def clear(self):
         self._display.Clear(0xFF)
\ No newline at end of file
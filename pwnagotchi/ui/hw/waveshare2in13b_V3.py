@@ -2,10 +2,11 @@ import logging
 
 import pwnagotchi.ui.fonts as fonts
 from pwnagotchi.ui.hw.base import DisplayImpl
-from PIL import Image
 
 
 class Waveshare2in13bV3(DisplayImpl):
+    # e-paper, full refreshes only
+    min_refresh_interval = 5.0
     def __init__(self, config):
         super(Waveshare2in13bV3, self).__init__(config, 'waveshare2in13b_v3')
 
@@ -38,12 +39,9 @@ class Waveshare2in13bV3(DisplayImpl):
         self._display.init()
         self._display.Clear()
 
-    def render(self, canvasBlack=None, canvasRed=None):
-        buffer = self._display.getbuffer
-        image = Image.new('1', (self._layout['height'], self._layout['width']))
-        imageBlack = image if canvasBlack is None else canvasBlack
-        imageRed = image if canvasRed is None else canvasRed
-        self._display.display(buffer(imageBlack), buffer(imageRed))
+    def render(self, canvas):
+        black, red = self._display.getbuffers(canvas)
+        self._display.display(black, red)
 
     def clear(self):
         self._display.Clear()
@@ -5,8 +5,6 @@ import random
 import time
 from threading import Lock
 
-from PIL import ImageDraw
-
 import pwnagotchi
 import pwnagotchi.plugins as plugins
 import pwnagotchi.ui.faces as faces
@@ -15,6 +13,7 @@ import pwnagotchi.ui.web as web
 import pwnagotchi.utils as utils
 
 from pwnagotchi.ui.components import *
+from pwnagotchi.ui.compositor import Compositor
 from pwnagotchi.ui.state import State
 from pwnagotchi.voice import Voice
 
@@ -44,6 +43,7 @@ class View(object):
         self._render_cbs = []
         self._config = config
         self._canvas = None
+        self._damage = []
         self._frozen = False
         self._lock = Lock()
         self._voice = Voice(lang=config['main']['lang'])
@@ -51,6 +51,7 @@ class View(object):
         self._layout = impl.layout()
         self._width = self._layout['width']
         self._height = self._layout['height']
+        self._compositor = Compositor(self._width, self._height, self._white)
         self._state = State(state={
             'channel': LabeledValue(color=BLACK, label='CH', value='00', position=self._layout['channel'],
                                     label_font=fonts.Bold,
@@ -136,6 +137,12 @@ class View(object):
         if cb not in self._render_cbs:
             self._render_cbs.append(cb)
 
+    def damage(self):
+        """
+        The (x0, y0, x1, y1) areas of the canvas that changed with the last frame.
+        """
+        return list(self._damage)
+
     def _refresh_handler(self):
         delay = 1.0 / self._config['ui']['fps']
         while True:
@@ -387,18 +394,16 @@ class View(object):
             state = self._state
             changes = state.changes(ignore=self._ignore_changes)
             if force or len(changes):
-                self._canvas = Image.new('1', (self._width, self._height), self._white)
-                drawer = ImageDraw.Draw(self._canvas)
-
                 plugins.on('ui_update', self)
 
-                for key, lv in state.items():
-                    # lv is a ui element
-                    lv.draw(self._canvas, drawer)
-
-                web.update_frame(self._canvas)
+                # only the elements that changed are drawn again
+                canvas = self._compositor.render(state.items(), force=force)
+                self._damage = self._compositor.damage
+                if self._damage:
+                    self._canvas = canvas
+                    web.update_frame(self._canvas)
 
-                for cb in self._render_cbs:
-                    cb(self._canvas)
+                    for cb in self._render_cbs:
+                        cb(self._canvas)
 
                 self._state.reset()
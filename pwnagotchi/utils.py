@@ -12,6 +12,8 @@ from zipfile import ZipFile
 from datetime import datetime
 from enum import Enum
 
+import pwnagotchi.catalog as catalog
+
 def parse_version(version):
     """
     Converts a version str to tuple, so that versions can be compared
@@ -515,8 +517,7 @@ def secs_to_hhmmss(secs):
 
 
 def total_unique_handshakes(path):
-    expr = os.path.join(path, "*.pcap")
-    return len(glob.glob(expr))
+    return catalog.get(path).count()
 
 
 def iface_channels(ifname):
@@ -569,6 +570,26 @@ def extract_from_pcap(path, fields):
 
     If a field is not found, FieldNotFoundError is raised
     """
+    import pwnagotchi.pcap as pcap
+
+    try:
+        info = pcap.parse(path)
+    except pcap.UnsupportedFormat as e:
+        logging.debug("%s, falling back to scapy", e)
+        return _extract_from_pcap_scapy(path, fields)
+
+    results = dict()
+    for field in fields:
+        if not isinstance(field, WifiInfo):
+            raise TypeError("Invalid field")
+        name = field.name.lower()
+        if name not in info:
+            raise FieldNotFoundError("Could not find field [%s]" % field.name)
+        results[field] = info[name]
+    return results
+
+
+def _extract_from_pcap_scapy(path, fields):
     results = dict()
     for field in fields:
         subtypes = set()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Times how long the display drivers take to push a frame, on a fake SPI bus and GPIO so
+that it runs anywhere numpy and Pillow are installed:
+
+    python3 scripts/display_benchmark.py [--frames 50] [driver ...]
+
+The time is spent converting the frame and handing it to spidev, the bus itself costs
+nothing here. The legacy column is the list based RGB565 conversion with 4096 bytes
+writes the LCD drivers used before, and for the e-paper drivers, whose refresh is not
+timed, the per pixel getbuffer() loop they used before. E-paper frames are rotated, as
+the canvas is on most of them.
+"""
+import os
+import sys
+import time
+import types
+import argparse
+import importlib
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class FakeSpiDev(object):
+    def __init__(self, *args, **kwargs):
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.bytes = 0
+        self.transfers = 0
+
+    def open(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+    def _send(self, data):
+        self.bytes += len(data)
+        self.transfers += 1
+
+    def writebytes(self, data):
+        if len(data) > 4096:
+            raise OverflowError("spidev.writebytes() takes up to 4096 bytes")
+        # spidev builds a C buffer out of the list, one python int at a time
+        bytes(data)
+        self._send(data)
+
+    def writebytes2(self, data):
+        data = memoryview(bytes(data) if isinstance(data, list) else data).cast('B')
+        for start in range(0, len(data), 4096):
+            self._send(data[start:start + 4096])
+
+    def xfer(self, data, *args):
+        self.writebytes(list(data))
+        return [0] * len(data)
+
+    xfer2 = xfer
+
+
+class FakePin(object):
+    def __init__(self, *args, **kwargs):
+        self.value = 0
+
+    def on(self):
+        self.value = 1
+
+    def off(self):
+        self.value = 0
+
+
+class FakePWM(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self, *args):
+        pass
+
+    def stop(self):
+        pass
+
+    def ChangeDutyCycle(self, *args):
+        pass
+
+
+def install_fakes():
+    spidev = types.ModuleType('spidev')
+    spidev.SpiDev = FakeSpiDev
+
+    gpio = types.ModuleType('RPi.GPIO')
+    for name, value in dict(BCM=11, BOARD=10, OUT=0, IN=1, HIGH=1, LOW=0, PUD_UP=22, PUD_DOWN=21).items():
+        setattr(gpio, name, value)
+    for name in ('setmode', 'setwarnings', 'setup', 'output', 'cleanup'):
+        setattr(gpio, name, lambda *args, **kwargs: None)
+    gpio.input = lambda *args: 0
+    gpio.PWM = FakePWM
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+
+    gpiozero = types.ModuleType('gpiozero')
+    gpiozero.__all__ = ['DigitalOutputDevice', 'DigitalInputDevice', 'PWMOutputDevice', 'LED', 'Button']
+    for name in gpiozero.__all__:
+        setattr(gpiozero, name, FakePin)
+
+    sys.modules.update({'spidev': spidev, 'RPi': rpi, 'RPi.GPIO': gpio, 'gpiozero': gpiozero})
+
+
+LCD = 'pwnagotchi.ui.hw.libs.waveshare.lcd'
+
+# name -> (module, class, constructor arguments, method pushing a frame)
+DRIVERS = {
+    'wavesharelcd0in96': (LCD + '.lcdhat0in96.LCD_0inch96', 'LCD_0inch96', (), 'ShowImage'),
+    'wavesharelcd1in14': (LCD + '.lcdhat1in14.LCD_1inch14', 'LCD_1inch14', (), 'ShowImage'),
+    'wavesharelcd1in28': (LCD + '.lcdhat1in28.LCD_1inch28', 'LCD_1inch28', (), 'ShowImage'),
+    'wavesharelcd1in3': (LCD + '.lcdhat1in3.LCD_1inch3', 'LCD_1inch3', (), 'ShowImage'),
+    'wavesharelcd1in47': (LCD + '.lcdhat1in47.LCD_1inch47', 'LCD_1inch47', (), 'ShowImage'),
+    'wavesharelcd1in54': (LCD + '.lcdhat1in54.LCD_1inch54', 'LCD_1inch54', (), 'ShowImage'),
+    'wavesharelcd1in69': (LCD + '.lcdhat1in69.LCD_1inch69', 'LCD_1inch69', (), 'ShowImage'),
+    'wavesharelcd1in8': (LCD + '.lcdhat1in8.LCD_1inch8', 'LCD_1inch8', (), 'ShowImage'),
+    'wavesharelcd1in9': (LCD + '.lcdhat1in9.LCD_1inch9', 'LCD_1inch9', (), 'ShowImage'),
+    'wavesharelcd2in0': (LCD + '.lcdhat2in0.LCD_2inch', 'LCD_2inch', (), 'ShowImage'),
+    'wavesharelcd2in4': (LCD + '.lcdhat2in4.LCD_2inch4', 'LCD_2inch4', (), 'ShowImage'),
+    'lcdhat': (LCD + '.lcdhat.epd', 'EPD', (), 'display'),
+    'waveshare144lcd': (LCD + '.lcdhat144.epd', 'EPD', (), 'display'),
+    'minipitft': ('pwnagotchi.ui.hw.libs.adafruit.minipitft.ST7789', 'ST7789', (0, 0, 25, 22), 'display'),
+    'minipitft2': ('pwnagotchi.ui.hw.libs.adafruit.minipitft2.ST7789', 'ST7789', (0, 0, 25, 22), 'display'),
+    'tftbonnet': ('pwnagotchi.ui.hw.libs.adafruit.tftbonnet.ST7789', 'ST7789', (0, 0, 25, 26), 'display'),
+    'pitft': ('pwnagotchi.ui.hw.libs.adafruit.pitft.ILI9341', 'ILI9341', (0, 0, 25, 18), 'display'),
+    'displayhatmini': ('pwnagotchi.ui.hw.libs.pimoroni.displayhatmini.ST7789', 'ST7789', (0, 1, 9, 13), 'display'),
+    'pirateaudio': ('pwnagotchi.ui.hw.libs.pimoroni.pirateaudio.ST7789', 'ST7789', (0, 1, 9, 13), 'display'),
+    'argonpod': ('pwnagotchi.ui.hw.libs.argon.argonpod.ILI9341', 'ILI9341', (0, 0, 22, 18), 'display'),
+    'waveshareoledlcd': ('pwnagotchi.ui.hw.libs.waveshare.oled.oledlcd.ST7789', 'ST7789', (0, 0, 22, 18), 'display'),
+    'waveshareoledlcdvert': ('pwnagotchi.ui.hw.libs.waveshare.oled.oledlcd.ST7789vert', 'ST7789', (0, 0, 22, 18),
+                             'display'),
+}
+
+EPAPER = 'pwnagotchi.ui.hw.libs.waveshare.epaper'
+
+# name -> (module, method packing a frame)
+EPAPER_DRIVERS = {
+    'waveshare_1': (EPAPER + '.v2in13_V1.epd2in13', 'getbuffer'),
+    'waveshare_2': (EPAPER + '.v2in13_V2.epd2in13_V2', 'getbuffer'),
+    'waveshare_3': (EPAPER + '.v2in13_V3.epd2in13_V3', 'getbuffer'),
+    'waveshare_4': (EPAPER + '.v2in13_V4.epd2in13_V4', 'getbuffer'),
+    'waveshare2in13b_v4': (EPAPER + '.v2in13b_v4.epd2in13b_V4', 'getbuffers'),
+    'waveshare2in13d': (EPAPER + '.v2in13d.epd2in13d', 'getbuffer'),
+    'waveshare2in7': (EPAPER + '.v2in7.epd2in7', 'getbuffer'),
+    'waveshare2in9_v2': (EPAPER + '.v2in9_v2.epd2in9V2', 'getbuffer'),
+    'waveshare3in7': (EPAPER + '.v3in7.epd3in7', 'getbuffer'),
+    'waveshare4in2_v2': (EPAPER + '.v4in2_v2.epd4in2_V2', 'getbuffer'),
+    'waveshare7in5_v2': (EPAPER + '.v7in5_v2.epd7in5_V2', 'getbuffer'),
+    'waveshare13in3k': (EPAPER + '.v13in3k.epd13in3k', 'getbuffer'),
+}
+
+
+def legacy_push(image, spi):
+    img = np.asarray(image)
+    pix = np.zeros((img.shape[0], img.shape[1], 2), dtype=np.uint8)
+    pix[..., [0]] = np.add(np.bitwise_and(img[..., [0]], 0xF8), np.right_shift(img[..., [1]], 5))
+    pix[..., [1]] = np.add(np.bitwise_and(np.left_shift(img[..., [1]], 3), 0xE0), np.right_shift(img[..., [2]], 3))
+    pix = pix.flatten().tolist()
+    for i in range(0, len(pix), 4096):
+        spi.writebytes(pix[i:i + 4096])
+
+
+def legacy_getbuffer(image, width, height):
+    buf = [0xFF] * (((width + 7) // 8) * height)
+    pixels = image.convert('1').load()
+    for y in range(image.size[1]):
+        for x in range(image.size[0]):
+            if pixels[x, y] == 0:
+                newx, newy = y, height - x - 1
+                buf[newx // 8 + newy * ((width + 7) // 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def spi_of(display):
+    for owner in (display, getattr(display, 'st7789', None)):
+        for name in ('SPI', '_spi'):
+            if isinstance(getattr(owner, name, None), FakeSpiDev):
+                return getattr(owner, name)
+    config = sys.modules.get(type(display).__module__.rsplit('.', 1)[0] + '.config')
+    return getattr(config, 'SPI', None)
+
+
+def frame_size(display):
+    width = getattr(display, 'width', None) or getattr(display, '_width')
+    height = getattr(display, 'height', None) or getattr(display, '_height')
+    return width, height
+
+
+def timed(push, frames):
+    push()
+    started = time.perf_counter()
+    for _ in range(frames):
+        push()
+    return (time.perf_counter() - started) / frames * 1000.0
+
+
+def bench(name, frames):
+    module, cls, args, method = DRIVERS[name]
+    display = getattr(importlib.import_module(module), cls)(*args)
+    size = frame_size(display)
+    image = Image.fromarray(np.random.randint(0, 256, (size[1], size[0], 3), dtype=np.uint8), 'RGB')
+    push = getattr(display, method)
+    if method == 'ShowImage' and cls == 'ST7789':
+        push = lambda img: display.ShowImage(img, 0, 0)
+
+    spi = spi_of(display)
+    before = (spi.bytes, spi.transfers)
+    ms = timed(lambda: push(image), frames)
+    sent = (spi.bytes - before[0]) // (frames + 1), (spi.transfers - before[1]) // (frames + 1)
+    legacy = timed(lambda: legacy_push(image, FakeSpiDev()), frames)
+    return size, ms, legacy, sent
+
+
+def bench_epaper(name, frames):
+    module, method = EPAPER_DRIVERS[name]
+    module = importlib.import_module(module)
+    display = module.EPD()
+    size = (display.height, display.width)
+    image = Image.fromarray(np.random.randint(0, 2, (size[1], size[0]), dtype=np.uint8) * 255, 'L').convert('1')
+    pack = getattr(display, method)
+
+    def push():
+        for buf in (pack(image),) if method == 'getbuffer' else pack(image):
+            module.epdconfig.spi_writebyte2(buf)
+
+    spi = module.epdconfig.SPI
+    before = (spi.bytes, spi.transfers)
+    ms = timed(push, frames)
+    sent = (spi.bytes - before[0]) // (frames + 1), (spi.transfers - before[1]) // (frames + 1)
+    # the loop is slow enough for a few frames to tell
+    legacy = timed(lambda: legacy_getbuffer(image, display.width, display.height), max(1, frames // 10))
+    return size, ms, legacy, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('drivers', nargs='*', default=sorted(DRIVERS) + sorted(EPAPER_DRIVERS))
+    args = parser.parse_args()
+
+    install_fakes()
+    print("%-22s %9s %10s %10s %9s %9s" % ('driver', 'size', 'ms/frame', 'legacy', 'bytes', 'transfers'))
+    for name in args.drivers:
+        try:
+            run = bench_epaper if name in EPAPER_DRIVERS else bench
+            size, ms, legacy, (sent, transfers) = run(name, args.frames)
+        except Exception as e:
+            print("%-22s failed: %r" % (name, e))
+            continue
+        print("%-22s %9s %10.2f %10.2f %9d %9d" % (name, '%dx%d' % size, ms, legacy, sent, transfers))
+
+
+if __name__ == '__main__':
+    main()